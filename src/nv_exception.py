@@ -8,4 +8,7 @@ __license__ = "GNU Lesser General Public License"
 __version__ = "1.0"
 
 class midboxExitException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class sftpConnException(Exception):
+    pass
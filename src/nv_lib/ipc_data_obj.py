@@ -8,6 +8,8 @@ __copyright__ = "Copyright (C) The neoview team."
 __license__ = "GNU Lesser General Public License"
 __version__ = "1.0"
 
+from src.nvdb.nvdb_manager import enum_camStatus
+
 class enum_ipcType():
     '''
     the Queue object type to be passed in the object.
@@ -36,6 +38,18 @@ class enum_ipcOpCode():
     CONST_UPDATE_CAMERA_LIVESTREAM_URL = 11
     CONST_IPC_OP_MAX_LIMIT = 100
 
+class enum_ipcPriority():
+    '''
+    The priority of the ipc objects in the conf queue, the lower value is read
+    first.
+    '''
+    # stop/kill/disconnect/exit.
+    CONST_IPC_PRIO_HIGH = 0
+    CONST_IPC_PRIO_NORMAL = 1
+    # status and url refresh.
+    CONST_IPC_PRIO_LOW = 2
+    CONST_IPC_PRIO_CNT = 3
+
 class ipc_data():
     '''
     The parent class for the ipc data. Any IPC data class must inherit this class.
@@ -63,6 +77,18 @@ class ipc_data():
             return True
         return False
 
+    def get_ipc_priority(self):
+        if self.__type == enum_ipcType.CONST_QUIT_MIDBOX:
+            return enum_ipcPriority.CONST_IPC_PRIO_HIGH
+        return enum_ipcPriority.CONST_IPC_PRIO_NORMAL
+
+    def get_ipc_key(self):
+        '''
+        The objects with same key are read in the order they are queued,
+        irrespective of the priority. None when no order is needed.
+        '''
+        return None
+
 class camera_data(ipc_data):
     '''
     Class to hold the camera details.
@@ -83,6 +109,24 @@ class camera_data(ipc_data):
         self.pwd = pwd
         self.live_url = live_url
 
+    def get_ipc_priority(self):
+        op = self.get_ipc_op()
+        if op in (enum_ipcOpCode.CONST_STOP_CAMERA_STREAM_OP,
+                  enum_ipcOpCode.CONST_STOP_CAMERA_LIVESTREAM,
+                  enum_ipcOpCode.CONST_DEL_CAMERA_OP):
+            return enum_ipcPriority.CONST_IPC_PRIO_HIGH
+        if op == enum_ipcOpCode.CONST_UPDATE_CAMERA_STATUS:
+            # The camera disconnect kills the camera stream.
+            if self.status == enum_camStatus.CONST_CAMERA_DISCONNECTED:
+                return enum_ipcPriority.CONST_IPC_PRIO_HIGH
+            return enum_ipcPriority.CONST_IPC_PRIO_LOW
+        if op == enum_ipcOpCode.CONST_UPDATE_CAMERA_LIVESTREAM_URL:
+            return enum_ipcPriority.CONST_IPC_PRIO_LOW
+        return enum_ipcPriority.CONST_IPC_PRIO_NORMAL
+
+    def get_ipc_key(self):
+        return self.name
+
 class webserver_data(ipc_data):
     '''
     Class for manage the webserver data
@@ -11,18 +11,89 @@ import platform
 import errno
 from src.nv_logger import nv_logger
 import subprocess
+import asyncio
 import os
 import shutil
+import stat
+import shlex
+import hashlib
 import paramiko
+import time
+import ctypes
+import mmap
+from collections import deque
+from queue import Queue
+from contextlib import contextmanager
+from threading import Thread, Condition
 from signal import SIGTERM
+from src.nv_exception import sftpConnException
+from src.settings import NV_RELAY_SFTP_CONN_TIMEOUT, NV_RELAY_SFTP_KEEPALIVE
+from src.settings import NV_RELAY_SFTP_IDLE_CHECK
+from src.settings import NV_RELAY_SFTP_RETRY_MIN, NV_RELAY_SFTP_RETRY_MAX
+from src.settings import NV_RELAY_SFTP_BREAKER_FAILURES
+from src.settings import NV_RELAY_SFTP_BLOCK_SIZE, NV_RELAY_SFTP_REQUEST_SIZE
+from src.settings import NV_RELAY_SFTP_PIPELINE_DEPTH
+from src.settings import NV_RELAY_FANOUT_QUEUE_LEN
+class enum_copyMethod():
+    '''
+    enum class for the methods to copy a file locally, fastest first.
+    '''
+    # Hardlink the file, no data copy. Only on the same filesystem.
+    CONST_COPY_LINK = 0
+    # Copy in kernel with copy_file_range, a reflink on CoW filesystems.
+    CONST_COPY_RANGE = 1
+    # Copy in kernel with sendfile.
+    CONST_COPY_SENDFILE = 2
+    # Read and write through the userspace.
+    CONST_COPY_USERSPACE = 3
+
+    COPY_METHOD_STR = {
+                       CONST_COPY_LINK : "hardlink",
+                       CONST_COPY_RANGE : "copy_file_range",
+                       CONST_COPY_SENDFILE : "sendfile",
+                       CONST_COPY_USERSPACE : "userspace copy"
+                       }
+
+# The libc, loaded on first use.
+GBL_LIBC = None
+
+def get_libc():
+    '''
+    Returns the libc with the memory map calls to find the page cache
+    residency of a file, None when its not available.
+    '''
+    global GBL_LIBC
+    if GBL_LIBC is None:
+        try:
+            libc = ctypes.CDLL(None, use_errno = True)
+            libc.mmap.restype = ctypes.c_void_p
+            libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                                  ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                  ctypes.c_long]
+            libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                                     ctypes.POINTER(ctypes.c_ubyte)]
+            GBL_LIBC = libc
+        except (OSError, AttributeError):
+            GBL_LIBC = False
+    return GBL_LIBC
+
 class nv_linux_lib():
     '''
     Library class for the linux operating system.
     '''
+    # Errors on a copy method that is not supported between the source and
+    # destination, the next method is tried.
+    COPY_UNSUPPORTED_ERRNO = (errno.EXDEV, errno.EPERM, errno.EMLINK,
+                              errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS,
+                              errno.EINVAL, errno.EBADF)
+
     def __init__(self):
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
         self.ssh = None
         self.sftp = None
+        # Copy method for every [source device, destination directory].
+        self.copy_method_dic = {}
 
     def get_remote_host_connection(self, hostname, username, pwd):
         '''
@@ -52,6 +123,45 @@ class nv_linux_lib():
                                       % hostname)
             raise e
 
+    def open_sftp_session(self, hostname, username, pwd):
+        '''
+        Returns a new [ssh, sftp] session to 'hostname' with keepalives. Unlike
+        get_remote_sftp_connection the session is not kept in the object, the
+        caller must close both.
+        '''
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.connect(hostname, username = username, password = pwd,
+                        timeout = NV_RELAY_SFTP_CONN_TIMEOUT,
+                        banner_timeout = NV_RELAY_SFTP_CONN_TIMEOUT,
+                        auth_timeout = NV_RELAY_SFTP_CONN_TIMEOUT)
+            transport = ssh.get_transport()
+            transport.set_keepalive(NV_RELAY_SFTP_KEEPALIVE)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            return [ssh, sftp]
+        except Exception as e:
+            ssh.close()
+            self.nv_log_handler.error("Failed to get the sftp connection to %s"
+                                      ", %s", hostname, e)
+            raise e
+
+    def is_sftp_session_alive(self, ssh, sftp, check_remote):
+        '''
+        Check if the ssh transport is still up. The remote end is asked with a
+        'stat' round trip when 'check_remote' is set.
+        '''
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if not check_remote:
+            return True
+        try:
+            sftp.stat('.')
+        except Exception:
+            return False
+        return True
+
     def close_remote_sftp_connection(self):
         if self.sftp:
             self.sftp.close()
@@ -74,6 +184,49 @@ class nv_linux_lib():
         self.nv_log_handler.debug("creating remote directory %s" % dir_name)
         sftp.mkdir(dir_name)
 
+    def remote_make_dir_cached(self, sftp, dir_name, known_dirs):
+        '''
+        Recursive directory creation on a remote machine, using 'known_dirs',
+        the set of directories known to exist on the remote machine. A known
+        directory costs no round trip. Otherwise the parent directory is
+        listed once and all its sub directories are added to 'known_dirs'.
+        The caller must clear 'known_dirs' on any sftp error.
+        '''
+        dir_name = os.path.normpath(dir_name)
+        if dir_name in known_dirs:
+            return
+        parent_dir = os.path.dirname(dir_name)
+        if parent_dir == dir_name:
+            # Root directory is always there.
+            known_dirs.add(dir_name)
+            return
+        if parent_dir in known_dirs:
+            # New directory in a known directory, for eg: a new camera.
+            try:
+                sftp.mkdir(dir_name)
+            except IOError as e:
+                # Created by someone else after the parent directory listing.
+                if not self.is_remote_path_exists(sftp, dir_name):
+                    raise e
+            known_dirs.add(dir_name)
+            return
+        try:
+            dir_attrs = sftp.listdir_attr(parent_dir)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise e
+            self.remote_make_dir_cached(sftp, parent_dir, known_dirs)
+            dir_attrs = []
+        known_dirs.add(parent_dir)
+        for dir_attr in dir_attrs:
+            if dir_attr.st_mode is not None and stat.S_ISDIR(dir_attr.st_mode):
+                known_dirs.add(os.path.join(parent_dir, dir_attr.filename))
+        if dir_name in known_dirs:
+            return
+        self.nv_log_handler.debug("creating remote directory %s" % dir_name)
+        sftp.mkdir(dir_name)
+        known_dirs.add(dir_name)
+
     def remove_file(self, file_name):
         try:
             if os.path.exists(file_name):
@@ -82,6 +235,15 @@ class nv_linux_lib():
             self.nv_log_handler.error("Failed to remove file %s" %str(e))
             raise e
 
+    def get_disk_space(self, path):
+        '''
+        Returns [<total bytes>, <free bytes>] of the filesystem of 'path'. The
+        free bytes are the bytes available to a non root user.
+        '''
+        fs_stat = os.statvfs(path)
+        return [fs_stat.f_blocks * fs_stat.f_frsize,
+                fs_stat.f_bavail * fs_stat.f_frsize]
+
     def remove_dir(self, dir_name):
         try:
             if os.path.exists(dir_name):
@@ -108,11 +270,18 @@ class nv_linux_lib():
             _, err = out.communicate()
             return err
 
-    def execute_cmd_bg(self, cmd, args):
+    def execute_cmd_bg(self, cmd, args, stdin_pipe = False, stdout_pipe = False,
+                       stderr_pipe = False):
         '''
         Execute a command in background. To handle the process externally, the
         process group is assigned a session id. The proocess id can be used to
         kill the process later. Or send signals to the process groups.
+        @param stdin_pipe : Open a pipe to write into stdin of the process.
+        @param stdout_pipe : Open a pipe to read the stdout of process,
+                             discard the output otherwise.
+        @param stderr_pipe : Same as stdout_pipe, for the stderr.
+        The caller must keep reading the pipes, a chatty process blocks when
+        the pipe is full.
         @return: proc_obj : process Obj of process group leader/session.
         '''
         exec_cmd = []
@@ -123,14 +292,81 @@ class nv_linux_lib():
 
         self.nv_log_handler.debug("Executing cmd in bg: %s" %exec_cmd)
         try:
-            proc = subprocess.Popen(exec_cmd, stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    preexec_fn=os.setsid)
+            proc = subprocess.Popen(exec_cmd,
+                        stdin=subprocess.PIPE if stdin_pipe else None,
+                        stdout=subprocess.PIPE if stdout_pipe else
+                               subprocess.DEVNULL,
+                        stderr=subprocess.PIPE if stderr_pipe else
+                               subprocess.DEVNULL,
+                        # Not the preexec_fn, it forces the slow fork+exec
+                        # of the entire middlebox process.
+                        start_new_session=True)
             return proc
         except Exception as e:
             self.nv_log_handler.error("Failed to run bash command %s", e)
             raise e
 
+    async def get_video_codec_async(self, src_path, timeout = 10):
+        '''
+        Probe the first video stream of a media source with ffprobe, from an
+        asyncio event loop.
+        @param src_path : media file or the stream url.
+        @return: codec : Name of the video codec, None if cannot probe.
+        '''
+        probe_args = ["-v", "error"]
+        if src_path.startswith("rtsp://"):
+            probe_args = probe_args + ["-rtsp_transport", "tcp"]
+        probe_args = probe_args + ["-select_streams", "v:0",
+                                   "-show_entries", "stream=codec_name",
+                                   "-of", "default=noprint_wrappers=1:nokey=1",
+                                   src_path]
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec("ffprobe", *probe_args,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL)
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except Exception as e:
+            self.nv_log_handler.error("Failed to probe the video codec, %s", e)
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            return None
+        codec = out.decode(errors="ignore").strip()
+        if proc.returncode or not codec:
+            return None
+        return codec.splitlines()[0]
+
+    async def execute_cmd_async(self, cmd, args, stdin_pipe = False,
+                                stdout_pipe = False, stderr_pipe = False,
+                                env = None):
+        '''
+        Execute a command in background from an asyncio event loop. The process
+        is started in a new session same as ' execute_cmd_bg '. The stdout and
+        stderr are discarded when not piped. The caller must keep reading the
+        pipes, a process blocks on a full pipe.
+        @param env : Environment variables to set for the process, on top of
+                     the middlebox environment.
+        @return: proc_obj : asyncio process object of the session leader.
+        '''
+        exec_args = list(args) if len(args) else []
+        self.nv_log_handler.debug("Executing cmd in event loop: %s",
+                                  [cmd] + exec_args)
+        try:
+            proc = await asyncio.create_subprocess_exec(cmd, *exec_args,
+                        stdin=subprocess.PIPE if stdin_pipe else None,
+                        stdout=subprocess.PIPE if stdout_pipe else
+                               subprocess.DEVNULL,
+                        stderr=subprocess.PIPE if stderr_pipe else
+                               subprocess.DEVNULL,
+                        env=dict(os.environ, **env) if env else None,
+                        start_new_session=True)
+            return proc
+        except Exception as e:
+            self.nv_log_handler.error("Failed to run command %s in event loop,"
+                                      " %s", cmd, e)
+            raise e
+
     def wait_cmd_complete(self, process_obj):
         '''
         Wait on a bg process that created by ' execute_cmd_bg ' .
@@ -139,11 +375,33 @@ class nv_linux_lib():
             self.nv_log_handler.error("Cannot wait on empty process obj")
             return
         try:
-            process_obj.communicate()
+            if process_obj.stdin is not None:
+                # The stdin is fed by some other thread, communicate() closes
+                # the stdin.
+                process_obj.wait()
+            else:
+                process_obj.communicate()
         except Exception as e:
             self.nv_log_handler.error("Error on waiting on process obj %s", e)
             raise e
 
+    def stop_process(self, process_obj):
+        '''
+        Ask a process created by ' execute_cmd_bg ' to exit gracefully. It
+        doesnt wait for the process to exit, the owner of process is expected
+        to wait on it.
+        '''
+        if not process_obj:
+            self.nv_log_handler.info("Cannot stop a non existent process")
+            return
+        try:
+            if process_obj.poll() is None:
+                process_obj.terminate()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to stop the process %d "
+                                      "Exception :  %s", process_obj.pid, e)
+            raise e
+
     def kill_process(self, process_obj):
         '''
         Kill the process that created by the subprocess popen. It is necessary
@@ -192,6 +450,134 @@ class nv_linux_lib():
         '''
         shutil.copy(src_file, dst_dir)
 
+    def copy_file_data(self, src_file, dst_file, copy_method):
+        if copy_method == enum_copyMethod.CONST_COPY_LINK:
+            os.link(src_file, dst_file)
+            return
+        if copy_method == enum_copyMethod.CONST_COPY_USERSPACE:
+            shutil.copyfile(src_file, dst_file)
+            shutil.copymode(src_file, dst_file)
+            return
+        with open(src_file, 'rb') as src_fd, open(dst_file, 'wb') as dst_fd:
+            remaining = os.fstat(src_fd.fileno()).st_size
+            self.advise_file_read(src_fd.fileno(), 0, remaining)
+            offset = 0
+            while remaining > 0:
+                if copy_method == enum_copyMethod.CONST_COPY_RANGE:
+                    copied = os.copy_file_range(src_fd.fileno(),
+                                                dst_fd.fileno(), remaining)
+                else:
+                    copied = os.sendfile(dst_fd.fileno(), src_fd.fileno(),
+                                         offset, remaining)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+        shutil.copymode(src_file, dst_file)
+
+    def advise_file_read(self, fd, offset, length):
+        '''
+        Tell the kernel the range is read sequentially, for a larger
+        read-ahead.
+        '''
+        if not hasattr(os, "posix_fadvise"):
+            return
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+        except OSError as e:
+            self.nv_log_handler.debug("Cannot set read-ahead hint, %s", e)
+
+    def drop_file_cache(self, file_path):
+        '''
+        Drop the file from the page cache, when its not read again. The dirty
+        pages cannot be dropped, they are written back first.
+        '''
+        if not hasattr(os, "posix_fadvise"):
+            return
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    def get_file_cache_residency(self, file_path):
+        '''
+        Returns [<bytes of the file in page cache>, <file size>]. The cached
+        bytes is None when cannot find it. The file is mapped only to ask the
+        kernel with mincore, nothing is read from the disk.
+        '''
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            file_size = os.fstat(fd).st_size
+            libc = get_libc()
+            if not libc or not file_size:
+                return [0 if libc else None, file_size]
+            addr = libc.mmap(None, file_size, mmap.PROT_READ, mmap.MAP_SHARED,
+                             fd, 0)
+            if addr is None or addr == ctypes.c_void_p(-1).value:
+                return [None, file_size]
+            try:
+                num_pages = -(-file_size // mmap.PAGESIZE)
+                page_vec = (ctypes.c_ubyte * num_pages)()
+                if libc.mincore(addr, file_size, page_vec) != 0:
+                    return [None, file_size]
+            finally:
+                libc.munmap(addr, file_size)
+            # Only the lowest bit is set for a page in cache.
+            cached_pages = num_pages - bytes(page_vec).count(0)
+            return [min(cached_pages * mmap.PAGESIZE, file_size), file_size]
+        finally:
+            os.close(fd)
+
+    def fast_copy_file(self, src_file, dst_dir):
+        '''
+        Copy the file locally without passing the data through userspace. The
+        file is hardlinked when the source and destination are on same
+        filesystem, otherwise copied in kernel with copy_file_range(reflink on
+        CoW filesystems) or sendfile. The method is found once for a
+        destination directory and used for the next files.
+        The file is copied to a temporary name and renamed, the destination
+        never has a partial file.
+        Returns the copy method used, enum_copyMethod.
+        '''
+        dst_file = os.path.join(dst_dir, self.get_last_filename(src_file))
+        tmp_file = dst_file + ".nvtmp"
+        cache_key = (os.stat(src_file).st_dev, dst_dir)
+        copy_method = self.copy_method_dic.get(cache_key)
+        if copy_method is None:
+            if os.stat(dst_dir).st_dev == cache_key[0]:
+                copy_method = enum_copyMethod.CONST_COPY_LINK
+            elif hasattr(os, "copy_file_range"):
+                copy_method = enum_copyMethod.CONST_COPY_RANGE
+            else:
+                copy_method = enum_copyMethod.CONST_COPY_SENDFILE
+        if os.path.exists(dst_file) and os.path.samefile(src_file, dst_file):
+            # Already linked, renaming another link of same file is a no-op.
+            return enum_copyMethod.CONST_COPY_LINK
+        while True:
+            try:
+                if os.path.lexists(tmp_file):
+                    os.remove(tmp_file)
+                self.copy_file_data(src_file, tmp_file, copy_method)
+                os.replace(tmp_file, dst_file)
+                break
+            except OSError as e:
+                if e.errno not in self.COPY_UNSUPPORTED_ERRNO or \
+                    copy_method == enum_copyMethod.CONST_COPY_USERSPACE:
+                    if os.path.lexists(tmp_file):
+                        os.remove(tmp_file)
+                    raise e
+                self.nv_log_handler.info("Cannot %s %s to %s, %s",
+                            enum_copyMethod.COPY_METHOD_STR[copy_method],
+                            src_file, dst_dir, e)
+                copy_method += 1
+        if self.copy_method_dic.get(cache_key) != copy_method:
+            self.nv_log_handler.info("Copying files to %s with %s", dst_dir,
+                            enum_copyMethod.COPY_METHOD_STR[copy_method])
+            self.copy_method_dic[cache_key] = copy_method
+        return copy_method
+
     def remote_copy_file(self, sftp, src_file, remote_dir):
         '''
         Copy a file 'src_file' to a remote system at 'remote_dir'.
@@ -211,6 +597,281 @@ class nv_linux_lib():
             self.nv_log_handler.error("Failed to copy to remote machine.")
             raise e
 
+    def get_remote_file_sha256(self, ssh, remote_file):
+        '''
+        Returns the sha256 hex digest of a file on the remote machine.
+        '''
+        _, stdout, _ = ssh.exec_command("sha256sum -- " +
+                                        shlex.quote(remote_file),
+                                        timeout = NV_RELAY_SFTP_CONN_TIMEOUT)
+        output = stdout.read().decode(errors = "replace").split()
+        if stdout.channel.recv_exit_status() != 0 or not output:
+            raise IOError("Cannot find sha256 of remote file %s" % remote_file)
+        return output[0]
+
+    def open_remote_upload(self, sftp, remote_file, mode):
+        '''
+        Open the 'remote_file' for pipelined writes of
+        NV_RELAY_SFTP_REQUEST_SIZE, the writes must be done with
+        'remote_write_pipelined'.
+        '''
+        remote_fd = sftp.open(remote_file, mode, NV_RELAY_SFTP_BLOCK_SIZE)
+        # The in-flight writes are bounded with the paramiko internals, its
+        # public API cannot wait for the write acknowledgements. A sftp stat()
+        # consumes them behind the file, which then waits forever on close.
+        if not hasattr(remote_fd, "_reqs") or \
+            not hasattr(sftp, "_read_response"):
+            remote_fd.close()
+            raise NotImplementedError("Pipelined upload is not supported on "
+                                      "paramiko %s, use the version in "
+                                      "requirements.txt" % paramiko.__version__)
+        remote_fd.MAX_REQUEST_SIZE = NV_RELAY_SFTP_REQUEST_SIZE
+        remote_fd.set_pipelined(True)
+        return remote_fd
+
+    def remote_write_pipelined(self, remote_fd, data):
+        '''
+        Write 'data' to a pipelined remote file, the acknowledgements of the
+        oldest writes are collected until NV_RELAY_SFTP_PIPELINE_DEPTH writes
+        are in flight. paramiko collects them only after 100 writes, and then
+        all of them, which empties the pipeline.
+        '''
+        remote_fd.write(data)
+        write_reqs = remote_fd._reqs
+        while len(write_reqs) > NV_RELAY_SFTP_PIPELINE_DEPTH:
+            # Raises on a failed write.
+            resp_type, _ = remote_fd.sftp._read_response(write_reqs.popleft())
+            if resp_type != paramiko.sftp.CMD_STATUS:
+                raise paramiko.SFTPError("Expected status")
+
+    def remote_upload_range(self, sftp, src_file, remote_tmp, offset, length,
+                            file_hash = None, throttle = None):
+        '''
+        Upload 'length' bytes at 'offset' of 'src_file' to the same offset in
+        the remote file 'remote_tmp'. The writes are pipelined, the remote end
+        acknowledges them asynchronously. 'throttle' is called with the size
+        of every write before its sent, to limit the upload rate.
+        '''
+        with open(src_file, 'rb') as src_fd, \
+            self.open_remote_upload(sftp, remote_tmp, 'r+b') as remote_fd:
+            self.advise_file_read(src_fd.fileno(), offset, length)
+            src_fd.seek(offset)
+            remote_fd.seek(offset)
+            while length > 0:
+                data = src_fd.read(min(length, NV_RELAY_SFTP_BLOCK_SIZE))
+                if not data:
+                    raise IOError("%s is truncated while uploading" % src_file)
+                if file_hash:
+                    file_hash.update(data)
+                if throttle:
+                    throttle(len(data))
+                self.remote_write_pipelined(remote_fd, data)
+                length -= len(data)
+            # All the write acknowledgements are collected on close.
+
+    def remote_commit_upload(self, ssh, sftp, remote_tmp, remote_file,
+                             file_size, file_sha256 = None):
+        '''
+        Verify the uploaded file 'remote_tmp' by its size, and its sha256 when
+        'file_sha256' is given, and rename it to 'remote_file'.
+        Returns the round trip time of a sftp request, measured on the size
+        check.
+        '''
+        rtt_start = time.monotonic()
+        remote_size = sftp.stat(remote_tmp).st_size
+        rtt = time.monotonic() - rtt_start
+        if remote_size != file_size:
+            raise IOError("Size mismatch on uploaded file %s, %d != %d" %
+                          (remote_file, remote_size, file_size))
+        if file_sha256 and file_sha256 != \
+            self.get_remote_file_sha256(ssh, remote_tmp):
+            raise IOError("sha256 mismatch on uploaded file %s" %
+                          remote_file)
+        try:
+            sftp.posix_rename(remote_tmp, remote_file)
+        except IOError:
+            # Server without posix-rename extension.
+            if self.is_remote_path_exists(sftp, remote_file):
+                sftp.remove(remote_file)
+            sftp.rename(remote_tmp, remote_file)
+        return rtt
+
+    def remote_upload_fanout(self, src_file, remote_dests,
+                             verify_hash = False, throttle = None):
+        '''
+        Upload a file 'src_file' to several remote systems with a single read
+        of the file, 'remote_dests' is [[ssh, sftp, remote_dir], ...].
+        Every block read is queued to a writer thread of each remote system,
+        upto NV_RELAY_FANOUT_QUEUE_LEN blocks. The slowest remote system sets
+        the pace, a failed one is dropped and the rest continue.
+        'throttle' is called with the bytes sent for every block read.
+        Returns the upload statistics of each remote system, in the order of
+        'remote_dests'. A failed upload has its exception in the list.
+        '''
+        file_hash = hashlib.sha256() if verify_hash else None
+        file_sha256 = []
+        upload_results = [None] * len(remote_dests)
+        block_queues = [Queue(maxsize = NV_RELAY_FANOUT_QUEUE_LEN)
+                        for _ in remote_dests]
+        start_time = time.monotonic()
+        def upload_dest(dest_idx, ssh, sftp, remote_dir, file_size):
+            remote_file = os.path.join(remote_dir,
+                                       self.get_last_filename(src_file))
+            remote_tmp = remote_file + ".nvtmp"
+            block_queue = block_queues[dest_idx]
+            try:
+                with self.open_remote_upload(sftp, remote_tmp,
+                                             'wb') as remote_fd:
+                    for data in iter(block_queue.get, None):
+                        self.remote_write_pipelined(remote_fd, data)
+                if len(file_sha256) != 1:
+                    raise IOError("%s is not read completely" % src_file)
+                rtt = self.remote_commit_upload(ssh, sftp, remote_tmp,
+                                                remote_file, file_size,
+                                                file_sha256[0])
+                upload_time = max(time.monotonic() - start_time, 1e-6)
+                upload_results[dest_idx] = {"bytes" : file_size,
+                                "secs" : upload_time,
+                                "mbps" : file_size / upload_time / 1000000,
+                                "rtt" : rtt,
+                                "stripes" : 1}
+            except Exception as e:
+                self.nv_log_handler.error("Failed to upload %s to %s, %s",
+                                          src_file, remote_dir, e)
+                upload_results[dest_idx] = e
+                try:
+                    sftp.remove(remote_tmp)
+                except Exception:
+                    pass
+                # Keep the reader going for the other remote systems.
+                for _ in iter(block_queue.get, None):
+                    pass
+        dest_threads = []
+        try:
+            with open(src_file, 'rb') as src_fd:
+                file_size = os.fstat(src_fd.fileno()).st_size
+                self.advise_file_read(src_fd.fileno(), 0, file_size)
+                for dest_idx, [ssh, sftp, remote_dir] in \
+                    enumerate(remote_dests):
+                    dest_thread = Thread(name = "nv_sftp_fanout" +
+                                                str(dest_idx),
+                                         target = upload_dest,
+                                         args = (dest_idx, ssh, sftp,
+                                                 remote_dir, file_size))
+                    dest_thread.start()
+                    dest_threads.append(dest_thread)
+                for data in iter(lambda :
+                                 src_fd.read(NV_RELAY_SFTP_BLOCK_SIZE), b''):
+                    if file_hash:
+                        file_hash.update(data)
+                    live_queues = [block_queue for dest_idx, block_queue in
+                                   enumerate(block_queues)
+                                   if upload_results[dest_idx] is None]
+                    if not live_queues:
+                        break
+                    if throttle:
+                        throttle(len(data) * len(live_queues))
+                    for block_queue in live_queues:
+                        block_queue.put(data)
+                else:
+                    file_sha256.append(file_hash.hexdigest()
+                                       if file_hash else None)
+        finally:
+            for block_queue in block_queues[:len(dest_threads)]:
+                block_queue.put(None)
+            for dest_thread in dest_threads:
+                dest_thread.join()
+        return upload_results
+
+    def remote_upload_file(self, ssh, sftp, src_file, remote_dir,
+                           verify_hash = False, stripe_sftps = None,
+                           throttle = None):
+        '''
+        Upload a file 'src_file' to a remote system at 'remote_dir'. The file
+        is split into ranges uploaded in parallel over 'sftp' and the
+        'stripe_sftps' channels, when given. The remote file is put together
+        as the ranges are written at their offset. 'throttle' is called with
+        the size of every write, to limit the upload rate.
+        The file is uploaded to a temporary name and renamed after verifying the
+        remote file size, and the sha256 of the file when 'verify_hash' is set.
+        The remote system never has a partial file.
+        Returns the upload statistics as
+            {'bytes' : <size>, 'secs' : <time>, 'mbps' : <MB/s>,
+             'rtt' : <round trip time of a sftp request>,
+             'stripes' : <number of ranges uploaded in parallel>}
+        '''
+        remote_file = os.path.join(remote_dir, self.get_last_filename(src_file))
+        remote_tmp = remote_file + ".nvtmp"
+        file_hash = hashlib.sha256() if verify_hash else None
+        start_time = time.monotonic()
+        try:
+            file_size = os.stat(src_file).st_size
+            sftp_list = [sftp] + list(stripe_sftps or [])
+            # Ranges aligned to the block size, the last one takes the rest.
+            range_len = -(-file_size // len(sftp_list))
+            range_len = -(-range_len // NV_RELAY_SFTP_BLOCK_SIZE) * \
+                        NV_RELAY_SFTP_BLOCK_SIZE
+            sftp_list = sftp_list[:max(1, -(-file_size // range_len))] \
+                        if file_size else sftp_list[:1]
+            sftp.open(remote_tmp, 'wb').close()
+            stripe_errors = []
+            def upload_stripe(stripe_sftp, offset):
+                try:
+                    self.remote_upload_range(stripe_sftp, src_file, remote_tmp,
+                                    offset,
+                                    min(range_len, file_size - offset),
+                                    throttle = throttle)
+                except Exception as e:
+                    stripe_errors.append(e)
+            stripe_threads = []
+            for stripe, stripe_sftp in enumerate(sftp_list[1:], 1):
+                stripe_thread = Thread(name = "nv_sftp_stripe" + str(stripe),
+                                       target = upload_stripe,
+                                       args = (stripe_sftp,
+                                               stripe * range_len))
+                stripe_thread.start()
+                stripe_threads.append(stripe_thread)
+            try:
+                # The hash is computed while reading when not striped.
+                self.remote_upload_range(sftp, src_file, remote_tmp, 0,
+                        min(range_len, file_size) if stripe_threads
+                        else file_size,
+                        file_hash if not stripe_threads else None,
+                        throttle)
+            finally:
+                for stripe_thread in stripe_threads:
+                    stripe_thread.join()
+            if stripe_errors:
+                raise stripe_errors[0]
+            if file_hash and stripe_threads:
+                with open(src_file, 'rb') as src_fd:
+                    for data in iter(lambda:
+                                     src_fd.read(NV_RELAY_SFTP_BLOCK_SIZE),
+                                     b''):
+                        file_hash.update(data)
+            rtt = self.remote_commit_upload(ssh, sftp, remote_tmp, remote_file,
+                        file_size,
+                        file_hash.hexdigest() if file_hash else None)
+        except Exception as e:
+            self.nv_log_handler.error("Failed to upload %s to remote machine,"
+                                      " %s", src_file, e)
+            try:
+                sftp.remove(remote_tmp)
+            except Exception:
+                pass
+            raise e
+        upload_time = max(time.monotonic() - start_time, 1e-6)
+        upload_stats = {"bytes" : file_size,
+                        "secs" : upload_time,
+                        "mbps" : file_size / upload_time / 1000000,
+                        "rtt" : rtt,
+                        "stripes" : len(sftp_list)}
+        self.nv_log_handler.info("%s uploaded to %s, %d bytes in %.2f sec, "
+                                 "%.2f MB/s, %d stripes", src_file, remote_dir,
+                                 file_size, upload_time, upload_stats["mbps"],
+                                 len(sftp_list))
+        return upload_stats
+
     def get_parent_dir(self, file_path):
         return os.path.dirname(file_path)
 
@@ -306,6 +967,24 @@ class nv_linux_lib():
             socket.setdefaulttimeout(None)
             sock.close()
 
+    async def is_remote_port_open_async(self, ip, port, timeout = 10):
+        '''
+        Check if a port is open on a remote system, from an asyncio event loop.
+        @param ip : ip address of remote machine in string format.
+        @param port: port to check connectivity. Integer value
+        @return: TRUE/FALSE : If port is open or not.
+        '''
+        if ip is None or port is None:
+            self.nv_log_handler.info("Invalid port/ip, cannot validate port-open")
+            return False
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port),
+                                               timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
 class nv_os_lib():
     '''
     Library class for OS interaction.All the external application interaction
@@ -375,6 +1054,18 @@ class nv_os_lib():
             raise ReferenceError("Undefined context, cannot find the program.")
         return self.context.close_remote_sftp_connection()
 
+    def open_sftp_session(self, hostname, username, pwd):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+            raise ReferenceError("Undefined context, cannot find the program.")
+        return self.context.open_sftp_session(hostname, username, pwd)
+
+    def is_sftp_session_alive(self, ssh, sftp, check_remote = False):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+            raise ReferenceError("Undefined context, cannot find the program.")
+        return self.context.is_sftp_session_alive(ssh, sftp, check_remote)
+
     def make_dir(self,dir_name):
         '''
         Create a new directory in the system if its not exists.
@@ -398,6 +1089,12 @@ class nv_os_lib():
             raise ReferenceError("Undefined context, cannot find the program.")
         return self.context.remote_make_dir(sftp, dir_name)
 
+    def remote_make_dir_cached(self, sftp, dir_name, known_dirs):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+            raise ReferenceError("Undefined context, cannot find the program.")
+        return self.context.remote_make_dir_cached(sftp, dir_name, known_dirs)
+
     def remove_dir(self, dir_name):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
@@ -410,6 +1107,11 @@ class nv_os_lib():
             raise ReferenceError("Undefined context, cannot remove the file.")
         return self.context.remove_file(file_name)
 
+    def get_disk_space(self, path):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.get_disk_space(path)
+
     def is_path_exists(self, path):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
@@ -433,6 +1135,40 @@ class nv_os_lib():
             self.nv_log_handler.error("Platform not defined.")
         return self.context.copy_file(src_path, dst_dir)
 
+    def fast_copy_file(self, src_path, dst_dir):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.fast_copy_file(src_path, dst_dir)
+
+    def drop_file_cache(self, file_path):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.drop_file_cache(file_path)
+
+    def get_file_cache_residency(self, file_path):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.get_file_cache_residency(file_path)
+
+    def remote_upload_file(self, ssh, sftp, src_file, remote_dir,
+                           verify_hash = False, stripe_sftps = None,
+                           throttle = None):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.remote_upload_file(ssh, sftp, src_file,
+                                               remote_dir,
+                                               verify_hash = verify_hash,
+                                               stripe_sftps = stripe_sftps,
+                                               throttle = throttle)
+
+    def remote_upload_fanout(self, src_file, remote_dests,
+                             verify_hash = False, throttle = None):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.remote_upload_fanout(src_file, remote_dests,
+                                                 verify_hash = verify_hash,
+                                                 throttle = throttle)
+
     def remote_copy_file(self, sftp, src_file, remote_dir):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
@@ -464,16 +1200,46 @@ class nv_os_lib():
             self.nv_log_handler.error("Platform not defined.")
         return self.context.get_free_listen_port()
 
-    def execute_cmd_bg(self, cmd, args):
+    def execute_cmd_bg(self, cmd, args, stdin_pipe = False, stdout_pipe = False,
+                       stderr_pipe = False):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
-        return self.context.execute_cmd_bg(cmd, args)
+        return self.context.execute_cmd_bg(cmd, args, stdin_pipe = stdin_pipe,
+                                           stdout_pipe = stdout_pipe,
+                                           stderr_pipe = stderr_pipe)
+
+    def execute_cmd_async(self, cmd, args, stdin_pipe = False,
+                          stdout_pipe = False, stderr_pipe = False,
+                          env = None):
+        '''
+        Returns a coroutine to be awaited in the asyncio event loop.
+        '''
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.execute_cmd_async(cmd, args,
+                                              stdin_pipe = stdin_pipe,
+                                              stdout_pipe = stdout_pipe,
+                                              stderr_pipe = stderr_pipe,
+                                              env = env)
 
     def wait_cmd_complete(self, process_obj):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined")
         return self.context.wait_cmd_complete(process_obj)
 
+    def get_video_codec_async(self, src_path, timeout = 10):
+        '''
+        Returns a coroutine to be awaited in the asyncio event loop.
+        '''
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.get_video_codec_async(src_path, timeout = timeout)
+
+    def stop_process(self, process_obj):
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.stop_process(process_obj)
+
     def kill_process(self, process_obj):
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
@@ -483,3 +1249,246 @@ class nv_os_lib():
         if self.context is None:
             self.nv_log_handler.error("Platform not defined.")
         return self.context.is_remote_port_open(ip, port)
+
+    def is_remote_port_open_async(self, ip, port, timeout = 10):
+        '''
+        Returns a coroutine to be awaited in the asyncio event loop.
+        '''
+        if self.context is None:
+            self.nv_log_handler.error("Platform not defined.")
+        return self.context.is_remote_port_open_async(ip, port,
+                                                      timeout = timeout)
+
+class nv_sftp_session():
+    '''
+    A pooled ssh connection with its sftp channel. 'known_dirs' is the set of
+    remote directories known to exist, cleared on any error in the session.
+    '''
+    def __init__(self, ssh, sftp):
+        self.ssh = ssh
+        self.sftp = sftp
+        self.last_used = time.monotonic()
+        self.known_dirs = set()
+
+    def close(self):
+        try:
+            self.sftp.close()
+        finally:
+            self.ssh.close()
+
+class nv_sftp_pool():
+    '''
+    Pool of sftp sessions to a remote machine, shared by the threads that copy
+    files to it. A session is borrowed for one file copy and returned back.
+    - An idle session is checked before handing it out, the dead ones are
+      closed and replaced by a new connection.
+    - A failed connect is retried after a delay, doubled on every failure
+      from NV_RELAY_SFTP_RETRY_MIN upto NV_RELAY_SFTP_RETRY_MAX.
+    - After NV_RELAY_SFTP_BREAKER_FAILURES failures in a row the circuit
+      is open, borrowing fails right away until the retry delay is elapsed.
+      Then only one thread tries to connect, the circuit is closed on
+      success.
+    '''
+    def __init__(self, hostname, username, pwd, pool_size):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.os_context = nv_os_lib()
+        self.hostname = hostname
+        self.username = username
+        self.pwd = pwd
+        self.pool_size = pool_size
+        self.idle_sessions = deque()
+        # Number of sessions open and being opened, idle and borrowed.
+        self.session_cnt = 0
+        self.fail_cnt = 0
+        self.retry_delay = 0
+        self.next_retry = 0
+        self.is_probing = False
+        self.is_pool_closed = False
+        self.pool_cond = Condition()
+
+    def get_pool_key(self):
+        return (self.hostname, self.username, self.pwd)
+
+    def is_breaker_open(self):
+        return self.fail_cnt >= NV_RELAY_SFTP_BREAKER_FAILURES
+
+    def connect_failed(self):
+        self.fail_cnt += 1
+        self.retry_delay = min(max(self.retry_delay * 2,
+                                   NV_RELAY_SFTP_RETRY_MIN),
+                               NV_RELAY_SFTP_RETRY_MAX)
+        self.next_retry = time.monotonic() + self.retry_delay
+        if self.fail_cnt == NV_RELAY_SFTP_BREAKER_FAILURES:
+            self.nv_log_handler.error("sftp connection to %s failed %d times,"
+                                      " circuit is open", self.hostname,
+                                      self.fail_cnt)
+
+    def connect_done(self):
+        if self.is_breaker_open():
+            self.nv_log_handler.info("sftp connection to %s is restored, "
+                                     "circuit is closed", self.hostname)
+        self.fail_cnt = 0
+        self.retry_delay = 0
+        self.next_retry = 0
+
+    def open_session(self, wait_retry):
+        '''
+        Open a new session, a slot in the pool is already taken for it.
+        '''
+        delay = self.next_retry - time.monotonic()
+        if wait_retry and delay > 0:
+            time.sleep(delay)
+        try:
+            ssh, sftp = self.os_context.open_sftp_session(self.hostname,
+                                                          self.username,
+                                                          self.pwd)
+        except Exception as e:
+            with self.pool_cond:
+                self.session_cnt -= 1
+                self.is_probing = False
+                self.connect_failed()
+                self.pool_cond.notify_all()
+            raise sftpConnException("Cannot connect to %s, %s" %
+                                    (self.hostname, e))
+        with self.pool_cond:
+            self.is_probing = False
+            self.connect_done()
+        return nv_sftp_session(ssh, sftp)
+
+    def get_session(self, wait = True):
+        '''
+        Borrow a session from the pool, wait for a free one when all of them
+        are in use. Returns None instead of waiting when 'wait' is not set.
+        Raises sftpConnException when cannot connect to the remote machine.
+        '''
+        while True:
+            with self.pool_cond:
+                while True:
+                    if self.is_pool_closed:
+                        raise sftpConnException("sftp pool to %s is closed" %
+                                                self.hostname)
+                    if self.idle_sessions:
+                        session = self.idle_sessions.pop()
+                        break
+                    if self.session_cnt < self.pool_size:
+                        if self.is_breaker_open() and \
+                            (self.is_probing or
+                             time.monotonic() < self.next_retry):
+                            raise sftpConnException("sftp circuit to %s is "
+                                                    "open" % self.hostname)
+                        self.is_probing = self.is_breaker_open()
+                        self.session_cnt += 1
+                        session = None
+                        break
+                    if not wait:
+                        return None
+                    self.pool_cond.wait()
+            if session is None:
+                return self.open_session(wait_retry =
+                                         not self.is_breaker_open())
+            check_remote = time.monotonic() - session.last_used > \
+                           NV_RELAY_SFTP_IDLE_CHECK
+            if self.os_context.is_sftp_session_alive(session.ssh,
+                                                     session.sftp,
+                                                     check_remote):
+                return session
+            self.nv_log_handler.info("sftp session to %s is dead, "
+                                     "reconnecting", self.hostname)
+            self.put_session(session, is_broken = True)
+
+    def get_free_sessions(self, count):
+        '''
+        Borrow upto 'count' sessions that are free right now, a new session is
+        opened if the pool is not full and the connection is healthy. Never
+        waits on the pool.
+        '''
+        sessions = []
+        while len(sessions) < count:
+            with self.pool_cond:
+                if self.fail_cnt:
+                    break
+            try:
+                session = self.get_session(wait = False)
+            except sftpConnException:
+                break
+            if session is None:
+                break
+            sessions.append(session)
+        return sessions
+
+    def put_session(self, session, is_broken = False):
+        '''
+        Return a borrowed session to the pool, a broken session is closed.
+        '''
+        with self.pool_cond:
+            if is_broken or self.is_pool_closed:
+                self.session_cnt -= 1
+            else:
+                session.last_used = time.monotonic()
+                self.idle_sessions.append(session)
+            self.pool_cond.notify_all()
+        if is_broken or self.is_pool_closed:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def borrow(self):
+        '''
+        Borrow a sftp session for the 'with' block. The session is dropped if
+        its not alive after an error in the block, its known remote
+        directories are forgotten otherwise.
+        '''
+        session = self.get_session()
+        try:
+            yield session
+        except Exception:
+            self.put_failed_session(session)
+            raise
+        self.put_session(session)
+
+    def put_failed_session(self, session):
+        '''
+        Return a session after an error on it. The session is dropped if its
+        not alive, its known remote directories are forgotten otherwise.
+        '''
+        session.known_dirs.clear()
+        self.put_session(session, is_broken =
+            not self.os_context.is_sftp_session_alive(session.ssh,
+                                                      session.sftp))
+
+    def prewarm_pool(self):
+        '''
+        Open all the sessions of the pool in the background.
+        '''
+        def prewarm():
+            sessions = []
+            try:
+                for _ in range(self.pool_size):
+                    sessions.append(self.get_session())
+            except sftpConnException as e:
+                self.nv_log_handler.error("Failed to prewarm the sftp pool, "
+                                          "%s", e)
+            for session in sessions:
+                self.put_session(session)
+        prewarm_thread = Thread(name = "nv_sftp_prewarm", target = prewarm)
+        prewarm_thread.daemon = True
+        prewarm_thread.start()
+
+    def close_pool(self):
+        '''
+        Close the idle sessions, the borrowed sessions are closed when they
+        are returned.
+        '''
+        with self.pool_cond:
+            self.is_pool_closed = True
+            sessions = list(self.idle_sessions)
+            self.session_cnt -= len(sessions)
+            self.idle_sessions.clear()
+            self.pool_cond.notify_all()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
@@ -8,11 +8,12 @@ __copyright__ = "Copyright (C) The neoview team."
 __license__ = "GNU Lesser General Public License"
 __version__ = "1.0"
 
-from time import time
+from time import time, monotonic
+from collections import deque
 from threading import current_thread
-from threading import Lock
+from threading import Lock, Condition
 from src.nv_logger import nv_logger
-from queue import Queue, Full, Empty
+from src.settings import NV_CONF_QUEUE_LEN, NV_CONF_QUEUE_PUT_TIMEOUT
 
 
 class nv_sync_queue():
@@ -31,14 +32,57 @@ class nv_sync_queue():
         }
 
     # cam_status_obj is object of ipc_data subclass.
+    The values are queued in 'prio_cnt' lanes by the get_ipc_priority() of the
+    objects, lane 0 is read first. A value is never read ahead of the values
+    queued before it with the same get_ipc_key(), they are moved to its lane
+    instead. The readers wait on a condition, the writers are never blocked by
+    a waiting reader.
     '''
-    ipc_queue = None
+    # Number of latencies kept to find the percentiles.
+    LATENCY_SAMPLE_CNT = 1024
 
-    def __init__(self, q_name = "default_queue", max_size = 10000):
+    def __init__(self, q_name = "default_queue", max_size = 10000,
+                 prio_cnt = 1, put_timeout = 1):
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
-        self.ipc_queue = Queue(maxsize = max_size)
         self.q_name = q_name
-        self.CONST_IPCQ_MUTEX = q_name
+        self.max_size = max_size
+        self.put_timeout = put_timeout
+        # The queue entries of every lane,
+        # [tlv_obj, {keys}, sequence number, enqueue time]
+        self.ipc_lanes = [deque() for _ in range(prio_cnt)]
+        self.q_len = 0
+        self.q_seq = 0
+        self.q_cond = Condition()
+        self.q_stats = {"enqueued" : 0, "dequeued" : 0, "dropped" : 0,
+                        "promoted" : 0, "batches" : 0, "batch_max" : 0,
+                        "depth_max" : 0, "latency_total" : 0.0,
+                        "latency_max" : 0.0}
+        self.latency_samples = deque(maxlen = self.LATENCY_SAMPLE_CNT)
+
+    def get_tlv_priority(self, obj_value):
+        prio = min(obj.get_ipc_priority() for obj in obj_value) \
+               if obj_value else len(self.ipc_lanes) - 1
+        return min(max(prio, 0), len(self.ipc_lanes) - 1)
+
+    def promote_entries(self, prio, keys):
+        '''
+        Move the entries with any of the 'keys' in the lanes after 'prio' to
+        the end of lane 'prio', in the order they are queued.
+        '''
+        promote_list = []
+        for lane_idx in range(prio + 1, len(self.ipc_lanes)):
+            lane = self.ipc_lanes[lane_idx]
+            if not any(entry[1] & keys for entry in lane):
+                continue
+            self.ipc_lanes[lane_idx] = deque()
+            for entry in lane:
+                if entry[1] & keys:
+                    promote_list.append(entry)
+                else:
+                    self.ipc_lanes[lane_idx].append(entry)
+        promote_list.sort(key = lambda entry : entry[2])
+        self.ipc_lanes[prio].extend(promote_list)
+        self.q_stats["promoted"] += len(promote_list)
 
     def enqueue_data(self, obj_len, obj_value):
         '''
@@ -57,40 +101,90 @@ class nv_sync_queue():
                    "length" : obj_len,
                    "value" : obj_value
                    }
-        GBL_NV_SYNC_OBJ.mutex_lock(self.CONST_IPCQ_MUTEX)
-        try:
-            self.ipc_queue.put(tlv_obj, timeout = 1)
-        except Full:
-            self.nv_log_handler.error("Faile to put data, queue %s is full",
-                                      self.q_name)
-        except:
-            self.nv_log_handler.error("Unknown error, Failed to put data in queue %s",
-                                      self.q_name)
-        finally:
-            GBL_NV_SYNC_OBJ.mutex_unlock(self.CONST_IPCQ_MUTEX)
-
-    def dequeue_data(self):
-        tlv_obj = None
-        GBL_NV_SYNC_OBJ.mutex_lock(self.CONST_IPCQ_MUTEX)
-        try:
-            tlv_obj = self.ipc_queue.get(timeout = 1)
-        except Empty:
-            #self.nv_log_handler.debug("Failed to read data from empty queue %s",
-            #                          self.q_name)
-            pass
-        except:
-            self.nv_log_handler.error("Unknown error, Failed to read data from queue %s",
-                                      self.q_name)
-        else:
-            # Santiy check on stored object.
-            obj_list = tlv_obj['value']
-            if len(obj_list) != tlv_obj['length']:
-                self.nv_log_handler.error("Error while dequeue,"
-                                          "Length is not matching")
-                tlv_obj = None
-        finally:
-            GBL_NV_SYNC_OBJ.mutex_unlock(self.CONST_IPCQ_MUTEX)
-            return tlv_obj
+        prio = self.get_tlv_priority(obj_value)
+        keys = {obj.get_ipc_key() for obj in obj_value} - {None}
+        with self.q_cond:
+            if not self.q_cond.wait_for(lambda : self.q_len < self.max_size,
+                                        self.put_timeout):
+                self.q_stats["dropped"] += 1
+                self.nv_log_handler.error("Faile to put data, queue %s is full",
+                                          self.q_name)
+                return
+            if keys:
+                self.promote_entries(prio, keys)
+            self.q_seq += 1
+            self.ipc_lanes[prio].append([tlv_obj, keys, self.q_seq,
+                                         monotonic()])
+            self.q_len += 1
+            self.q_stats["enqueued"] += 1
+            self.q_stats["depth_max"] = max(self.q_len,
+                                            self.q_stats["depth_max"])
+            self.q_cond.notify_all()
+
+    def is_tlv_valid(self, tlv_obj):
+        # Santiy check on stored object.
+        if len(tlv_obj['value']) != tlv_obj['length']:
+            self.nv_log_handler.error("Error while dequeue,"
+                                      "Length is not matching")
+            return False
+        return True
+
+    def dequeue_batch(self, max_cnt, timeout = None):
+        '''
+        Returns upto 'max_cnt' values in the priority order, waits upto
+        'timeout' seconds for a value when the queue is empty. None timeout is
+        to wait forever.
+        '''
+        tlv_list = []
+        with self.q_cond:
+            if not self.q_cond.wait_for(lambda : self.q_len, timeout):
+                return tlv_list
+            now = monotonic()
+            for lane in self.ipc_lanes:
+                while lane and len(tlv_list) < max_cnt:
+                    [tlv_obj, _, _, enqueue_time] = lane.popleft()
+                    latency = now - enqueue_time
+                    self.q_stats["latency_total"] += latency
+                    self.q_stats["latency_max"] = max(latency,
+                                                self.q_stats["latency_max"])
+                    self.latency_samples.append(latency)
+                    tlv_list.append(tlv_obj)
+            self.q_len -= len(tlv_list)
+            self.q_stats["dequeued"] += len(tlv_list)
+            self.q_stats["batches"] += 1
+            self.q_stats["batch_max"] = max(len(tlv_list),
+                                            self.q_stats["batch_max"])
+            self.q_cond.notify_all()
+        return [tlv_obj for tlv_obj in tlv_list if self.is_tlv_valid(tlv_obj)]
+
+    def dequeue_data(self, timeout = 1):
+        tlv_list = self.dequeue_batch(1, timeout)
+        return tlv_list[0] if tlv_list else None
+
+    def get_queue_depth(self):
+        return self.q_len
+
+    def get_queue_stats(self):
+        '''
+        Returns the queue statistics, the latency is the time a value waited
+        in the queue, in seconds,
+        {'depth' : 2, 'lane_depths' : [0, 1, 1], 'depth_max' : 40,
+         'enqueued' : 100, 'dequeued' : 98, 'dropped' : 0, 'promoted' : 3,
+         'batches' : 60, 'batch_max' : 16, 'latency_avg' : 0.0002,
+         'latency_max' : 0.01, 'latency_p50' : 0.0001, 'latency_p99' : 0.005}
+        '''
+        with self.q_cond:
+            q_stats = dict(self.q_stats)
+            q_stats["depth"] = self.q_len
+            q_stats["lane_depths"] = [len(lane) for lane in self.ipc_lanes]
+            latency_list = sorted(self.latency_samples)
+        q_stats["latency_avg"] = q_stats.pop("latency_total") / \
+                                 max(q_stats["dequeued"], 1)
+        for pct in (50, 99):
+            q_stats["latency_p%d" % pct] = \
+                latency_list[(len(latency_list) - 1) * pct // 100] \
+                if latency_list else 0.0
+        return q_stats
 
 class nv_sync_lib():
     '''
@@ -211,5 +305,10 @@ GBL_NV_SYNC_OBJ = nv_sync_lib()
 
 # The cmd execution queue used to run the commands to middlebox.
 # Main thread polls this queue all the time to execute operation in middlebox.
-GBL_CONF_QUEUE = nv_sync_queue(q_name="cmd_queue")
+# The stop/kill/disconnect operations are read first and the status refresh
+# operations are read last, enum_ipcPriority.
+GBL_CONF_QUEUE = nv_sync_queue(q_name="cmd_queue",
+                               max_size = NV_CONF_QUEUE_LEN,
+                               prio_cnt = 3,
+                               put_timeout = NV_CONF_QUEUE_PUT_TIMEOUT)
 
@@ -0,0 +1,379 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The live preview streaming module for the middlebox web tier.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import struct
+from threading import Lock
+from threading import Timer
+from threading import current_thread
+import tornado.web
+import tornado.gen
+import tornado.ioloop
+from tornado.concurrent import Future
+from src.nv_logger import nv_logger
+from src.nv_logger_rl import nv_logger_rl
+from src.nv_lib.ipc_data_obj import enum_ipcOpCode, camera_data
+from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
+from src.settings import NV_CAM_LIVE_HLS_DIR
+from src.settings import NV_CAM_LIVE_IDLE_TIMEOUT
+
+class live_fmp4_client():
+    '''
+    A http client of the live fragmented MP4 stream. Must be used only in the
+    web server ioloop thread.
+    '''
+    # Number of writes a client can have in flight, the data is dropped for
+    # a slow client after that.
+    MAX_PENDING_WRITES = 4
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.pending_writes = 0
+        self.drop_cnt = 0
+
+    def write_data(self, data):
+        '''
+        Write the data to the client. The data is dropped when the client is
+        too slow to take it. Every fragment starts with a key frame, so the
+        client can continue from any next fragment.
+        '''
+        if self.pending_writes >= self.MAX_PENDING_WRITES:
+            self.drop_cnt += 1
+            return
+        try:
+            self.handler.write(data)
+            flush_future = self.handler.flush()
+        except Exception:
+            # Connection is closed, the handler removes the client.
+            return
+        self.pending_writes += 1
+        flush_future.add_done_callback(self.write_done)
+
+    def write_done(self, flush_future):
+        self.pending_writes -= 1
+
+class live_fmp4_stream():
+    '''
+    Live fragmented MP4 stream of a camera. The remuxer feeds the stream from
+    its own thread, the stream is split into MP4 boxes and sent out to the
+    http clients in fragments(moof + mdat). A new client gets the init
+    segment(ftyp + moov) first and joins the stream at the next fragment.
+    '''
+    BOX_HDR_LEN = 8
+
+    def __init__(self, name):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.nv_log_handler_rl = nv_logger_rl(nv_log_obj = self.nv_log_handler,
+                                              timeout = 30)
+        self.name = name
+        self.stream_buf = bytearray()
+        self.init_boxes = []
+        self.init_segment = None
+        self.fragment_boxes = []
+        self.clients = {}
+        self.ioloop = None
+        self.stream_lock = Lock()
+
+    def next_box(self):
+        '''
+        Returns (box_type, box_data) of the next complete box in the stream
+        buffer, None if there is no complete box yet.
+        '''
+        if len(self.stream_buf) < self.BOX_HDR_LEN:
+            return None
+        box_len, box_type = struct.unpack(">I4s",
+                                          self.stream_buf[:self.BOX_HDR_LEN])
+        if box_len == 1:
+            # 64 bit box size.
+            if len(self.stream_buf) < 16:
+                return None
+            box_len = struct.unpack(">Q", self.stream_buf[8:16])[0]
+        if box_len < self.BOX_HDR_LEN:
+            self.nv_log_handler.error("Invalid MP4 box in live stream %s, "
+                                      "resetting the stream", self.name)
+            self.reset()
+            return None
+        if len(self.stream_buf) < box_len:
+            return None
+        box_data = bytes(self.stream_buf[:box_len])
+        del self.stream_buf[:box_len]
+        return (box_type, box_data)
+
+    def feed(self, data):
+        '''
+        Feed the remuxer output into the stream. Called from the remuxer thread.
+        '''
+        self.stream_buf += data
+        while True:
+            box = self.next_box()
+            if box is None:
+                break
+            box_type, box_data = box
+            if box_type == b'ftyp':
+                self.init_boxes = [box_data]
+                self.fragment_boxes = []
+            elif box_type == b'moov':
+                self.init_boxes.append(box_data)
+                with self.stream_lock:
+                    self.init_segment = b''.join(self.init_boxes)
+            elif box_type == b'moof':
+                self.fragment_boxes = [box_data]
+            elif box_type == b'mdat' and self.fragment_boxes:
+                self.fragment_boxes.append(box_data)
+                self.publish(b''.join(self.fragment_boxes))
+                self.fragment_boxes = []
+            elif self.fragment_boxes:
+                self.fragment_boxes.append(box_data)
+
+    def reset(self):
+        '''
+        Reset the stream, for eg: when the remuxer is restarted. Clients
+        already connected keep the connection, but the new init segment is not
+        sent to them.
+        '''
+        self.stream_buf = bytearray()
+        self.init_boxes = []
+        self.fragment_boxes = []
+        with self.stream_lock:
+            self.init_segment = None
+
+    def publish(self, fragment):
+        ioloop = self.ioloop
+        if ioloop is None or not self.clients:
+            return
+        ioloop.add_callback(self.write_fragment, fragment)
+
+    def write_fragment(self, fragment):
+        # Runs in the ioloop thread.
+        for client in list(self.clients.values()):
+            client.write_data(fragment)
+
+    def is_ready(self):
+        return self.init_segment is not None
+
+    def add_client(self, handler):
+        '''
+        Add a http client to the stream, must be called from the ioloop thread.
+        @return: True : client is added.
+                 False : stream is not ready to serve, no init segment yet.
+        '''
+        with self.stream_lock:
+            init_segment = self.init_segment
+        if init_segment is None:
+            return False
+        self.ioloop = tornado.ioloop.IOLoop.current()
+        client = live_fmp4_client(handler)
+        self.clients[handler] = client
+        client.write_data(init_segment)
+        self.nv_log_handler.debug("New live client on %s, total %d clients",
+                                  self.name, len(self.clients))
+        return True
+
+    def remove_client(self, handler):
+        client = self.clients.pop(handler, None)
+        if client and client.drop_cnt:
+            self.nv_log_handler_rl.info_rl("%d live fragments dropped on a "
+                                           "slow client of %s",
+                                           client.drop_cnt, self.name)
+
+    def close(self):
+        '''
+        Close all the client connections, runs in the ioloop thread.
+        '''
+        for handler in list(self.clients.keys()):
+            self.remove_client(handler)
+            try:
+                handler.finish()
+            except Exception:
+                pass
+
+class live_stream_registry():
+    '''
+    All the live fragmented MP4 streams served by the middlebox web tier.
+    XXX :: DO NOT CREATE OBJECTS FOR THIS CLASS, USE 'GBL_LIVE_STREAMS'.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.streams = {}
+        self.registry_lock = Lock()
+
+    def add_stream(self, name):
+        '''
+        Add a new stream, it replaces the stream of same name. The replaced
+        stream is closed by its owner with 'remove_stream'.
+        '''
+        stream = live_fmp4_stream(name)
+        with self.registry_lock:
+            self.streams[name] = stream
+        return stream
+
+    def get_stream(self, name):
+        with self.registry_lock:
+            return self.streams.get(name)
+
+    def remove_stream(self, name, stream = None):
+        '''
+        Remove and close the stream. When 'stream' is given, only that stream
+        is closed, the stream of same name is removed only if its 'stream'.
+        '''
+        with self.registry_lock:
+            if stream is None:
+                stream = self.streams.pop(name, None)
+            elif self.streams.get(name) is stream:
+                del self.streams[name]
+        if stream is None or stream.ioloop is None:
+            return
+        stream.ioloop.add_callback(stream.close)
+
+class live_viewer_mgr():
+    '''
+    Track the viewers of camera live preview. The live preview of a camera is
+    started on its first viewer and stopped when there is no viewer for
+    NV_CAM_LIVE_IDLE_TIMEOUT seconds. A viewer is any hashable object, for eg:
+    the websocket connection of a switch page.
+    XXX :: DO NOT CREATE OBJECTS FOR THIS CLASS, USE 'GBL_LIVE_VIEWERS'.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        # { camera name : set of viewers }
+        self.cam_viewers = {}
+        # { camera name : idle Timer }
+        self.idle_timers = {}
+        self.viewer_lock = Lock()
+
+    def send_live_op(self, cam_name, op):
+        live_obj = camera_data(op = op,
+                               name = cam_name,
+                               # Everything else can be None
+                               status = None,
+                               ip = None,
+                               macAddr = None,
+                               port = None,
+                               time_len = None,
+                               uname = None,
+                               pwd = None,
+                               desc = None
+                               )
+        GBL_CONF_QUEUE.enqueue_data(obj_len = 1, obj_value = [live_obj])
+
+    def add_viewer(self, cam_name, viewer):
+        with self.viewer_lock:
+            viewers = self.cam_viewers.setdefault(cam_name, set())
+            if viewer in viewers:
+                return
+            viewers.add(viewer)
+            idle_timer = self.idle_timers.pop(cam_name, None)
+            if idle_timer is not None:
+                # Live preview is still running, no need to start it again.
+                idle_timer.cancel()
+                return
+            if len(viewers) > 1:
+                return
+        self.nv_log_handler.debug("First viewer on %s, starting the live "
+                                  "preview", cam_name)
+        self.send_live_op(cam_name,
+                          enum_ipcOpCode.CONST_START_CAMERA_LIVESTREAM)
+
+    def remove_viewer(self, cam_name, viewer):
+        with self.viewer_lock:
+            viewers = self.cam_viewers.get(cam_name)
+            if not viewers or viewer not in viewers:
+                return
+            viewers.remove(viewer)
+            if viewers:
+                return
+            del self.cam_viewers[cam_name]
+            idle_timer = Timer(NV_CAM_LIVE_IDLE_TIMEOUT, self.live_idle_expired,
+                               args = (cam_name,))
+            idle_timer.daemon = True
+            self.idle_timers[cam_name] = idle_timer
+            idle_timer.start()
+
+    def remove_viewer_all(self, viewer):
+        '''
+        Remove the viewer from all the cameras, for eg: when the page is closed.
+        '''
+        with self.viewer_lock:
+            cam_names = [cam_name for cam_name, viewers in
+                         self.cam_viewers.items() if viewer in viewers]
+        for cam_name in cam_names:
+            self.remove_viewer(cam_name, viewer)
+
+    def live_idle_expired(self, cam_name):
+        with self.viewer_lock:
+            # Runs in the idle timer thread itself.
+            if self.idle_timers.get(cam_name) is not current_thread():
+                # Got a new viewer meanwhile.
+                return
+            del self.idle_timers[cam_name]
+        self.nv_log_handler.debug("No viewers on %s, stopping the live "
+                                  "preview", cam_name)
+        self.send_live_op(cam_name, enum_ipcOpCode.CONST_STOP_CAMERA_LIVESTREAM)
+
+    def stop_all(self):
+        with self.viewer_lock:
+            for idle_timer in self.idle_timers.values():
+                idle_timer.cancel()
+            self.idle_timers.clear()
+            self.cam_viewers.clear()
+
+class LiveStreamHandler(tornado.web.RequestHandler):
+    '''
+    Serve the live fragmented MP4 stream of a camera. The response never
+    ends until the client closes the connection or the live stream stopped.
+    '''
+    @tornado.gen.coroutine
+    def get(self, stream_name):
+        self.live_stream = GBL_LIVE_STREAMS.get_stream(stream_name)
+        if self.live_stream is None or not self.live_stream.is_ready():
+            raise tornado.web.HTTPError(404)
+        self.set_header("Content-Type", "video/mp4")
+        self.set_header("Cache-Control", "no-cache")
+        self.close_future = Future()
+        if not self.live_stream.add_client(self):
+            raise tornado.web.HTTPError(404)
+        yield self.close_future
+
+    def on_connection_close(self):
+        self.live_stream.remove_client(self)
+        if not self.close_future.done():
+            self.close_future.set_result(None)
+
+    def on_finish(self):
+        if hasattr(self, 'close_future') and not self.close_future.done():
+            self.close_future.set_result(None)
+
+class LiveHLSFileHandler(tornado.web.StaticFileHandler):
+    '''
+    Serve the HLS playlists and segments of live preview. Playlists are
+    rewritten by the remuxer all the time, must not be cached.
+    '''
+    HLS_CONTENT_TYPES = {
+                        ".m3u8" : "application/vnd.apple.mpegurl",
+                        ".ts" : "video/mp2t",
+                        ".m4s" : "video/iso.segment",
+                        ".mp4" : "video/mp4"
+                        }
+
+    def get_content_type(self):
+        for ext, content_type in self.HLS_CONTENT_TYPES.items():
+            if self.absolute_path.endswith(ext):
+                return content_type
+        return super(LiveHLSFileHandler, self).get_content_type()
+
+    def set_extra_headers(self, path):
+        if path.endswith(".m3u8"):
+            self.set_header("Cache-Control", "no-cache")
+
+LIVE_HANDLERS = [
+            (r'/live/([0-9]+)', LiveStreamHandler),
+            (r'/hls/(.*)', LiveHLSFileHandler, {"path": NV_CAM_LIVE_HLS_DIR})
+        ]
+
+GBL_LIVE_STREAMS = live_stream_registry()
+GBL_LIVE_VIEWERS = live_viewer_mgr()
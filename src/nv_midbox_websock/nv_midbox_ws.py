@@ -13,10 +13,12 @@ import tornado.websocket
 import tornado.httpserver
 import tornado.ioloop
 from src.nv_logger import nv_logger
-from src.nvdb.nvdb_manager import db_mgr_obj, nv_camera
+from src.nvdb.nvdb_cam_registry import GBL_CAM_REGISTRY
 from src.nv_logger import default_nv_log_handler
 from src.nv_lib.nv_sync_lib import GBL_NV_SYNC_OBJ
 from src.nv_midbox_websock.nv_midbox_wsClient import GBL_WSCLIENT
+from src.nv_midbox_websock.nv_midbox_live import LIVE_HANDLERS
+from src.nv_midbox_websock.nv_midbox_live import GBL_LIVE_VIEWERS
 import json
 from src.nv_lib.ipc_data_obj import camera_data,enum_ipcOpCode
 from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
@@ -91,14 +93,7 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
         # send out it as a message
         cam_json = []
         GBL_WEBSOCK_POOL.add_connection(self)
-        try:
-            db_mgr_obj.db_start_transaction()
-            cameras = db_mgr_obj.get_tbl_records(nv_camera)
-        except Exception as e:
-            default_nv_log_handler.info("Failed to get camera details from DB"
-                                        " when opening websocket in ws")
-        finally:
-            db_mgr_obj.db_end_transaction()
+        cameras = GBL_CAM_REGISTRY.get_cameras()
         try:
             if not cameras:
                 return
@@ -113,7 +108,7 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
 
     def get_camera_json(self, camera):
         '''
-        camera is a object of db class nv_camera.
+        camera is a nv_cam_entry object from camera registry.
         Populate only the relevant fields.
         '''
         cam_dic = {
@@ -127,14 +122,7 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
 
     def send_all_camera_to_all_ws(self):
         cam_json = []
-        try:
-            db_mgr_obj.db_start_transaction()
-            cameras = db_mgr_obj.get_tbl_records(nv_camera)
-        except Exception as e:
-            default_nv_log_handler.info("Failed to collecte camera details"
-                                         " from the db in ws process.")
-        finally:
-            db_mgr_obj.db_end_transaction()
+        cameras = GBL_CAM_REGISTRY.get_cameras()
         try:
             if not cameras:
                 # No cameras configured, return empty json.
@@ -185,6 +173,16 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
             default_nv_log_handler.error("Exception in ws, cannot send status"
                                          "update, %s", e)
 
+    def update_camera_live(self, name, watch):
+        '''
+        Every websocket connection is a viewer of the camera live preview.
+        The live preview runs as long as there is a viewer.
+        '''
+        if watch:
+            GBL_LIVE_VIEWERS.add_viewer(name, self)
+        else:
+            GBL_LIVE_VIEWERS.remove_viewer(name, self)
+
     def on_message(self, message):
         # TODO : Send out message to the midbox conf to change the camera
         # settings.
@@ -207,6 +205,10 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
             # Notification to the server about the system update.
             self.send_all_camera_to_all_ws()
             return
+        elif 'live' in data and 'name' in data:
+            # The switch page starts/stops watching the camera live preview.
+            self.update_camera_live(name = data['name'], watch = data['live'])
+            return
         elif len(data) != 5:
             default_nv_log_handler.error("Cannot Parse json in ws, length "\
                                         "is invalid in %s.", data)
@@ -220,9 +222,11 @@ class UserWebSocketHandler(tornado.websocket.WebSocketHandler):
         self.update_camera_status(name = data['name'], status = data['status'])
 
     def on_close(self):
+        GBL_LIVE_VIEWERS.remove_viewer_all(self)
         GBL_WEBSOCK_POOL.remove_connection(self)
 
     def onerror(self):
+        GBL_LIVE_VIEWERS.remove_viewer_all(self)
         GBL_WEBSOCK_POOL.remove_connection(self)
 
     def check_origin(self, origin):
@@ -282,7 +286,7 @@ class SwitchApplication(tornado.web.Application):
         handlers = [
             (r'/', IndexPageHandler),
             (r"/static/(.*)",tornado.web.StaticFileHandler, {"path": "./static"},)
-        ]
+        ] + LIVE_HANDLERS
         settings = {
             'debug' : True,
             "static_path": "src/nv_midbox_websock/templates/static",
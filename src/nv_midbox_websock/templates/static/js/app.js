@@ -3,6 +3,7 @@ angular.module('landingApp', [])
 .controller('landingController', ['$scope', '$window', function($scope, $window) {
   var host = "ws://" + $window.location.hostname + ":9090/HTTPUserwebsocket",
   cameraStatus = [],reload_video=false,
+  liveCameras = {},
   ws = new WebSocket(host);
   if($window.localStorage.getItem("camera")) {
     $scope.allCamera = true;
@@ -16,6 +17,23 @@ angular.module('landingApp', [])
     $window.location.reload()
   }
 
+  // The middlebox runs the live preview of a camera only while some page
+  // watches it. Watch the cameras on display, stop watching the rest.
+  function watchLive(cameraNames) {
+    _.each(_.keys(liveCameras), function(name) {
+      if(cameraNames.indexOf(name) == -1) {
+        delete liveCameras[name];
+        ws.send(JSON.stringify([{"token" : null, "name" : name, "live" : false}]));
+      }
+    });
+    _.each(cameraNames, function(name) {
+      if(!liveCameras[name]) {
+        liveCameras[name] = true;
+        ws.send(JSON.stringify([{"token" : null, "name" : name, "live" : true}]));
+      }
+    });
+  };
+
   function init() {
     ws.onmessage = function(e) {
       var parsed = JSON.parse(e.data),
@@ -44,6 +62,9 @@ angular.module('landingApp', [])
           }
         }
       }
+      watchLive(_.pluck(_.filter($scope.cameraInfo, function(camInfo) {
+        return camInfo && camInfo.name;
+      }), "name"));
       $scope.$apply();
       if(reload_video) {
         $scope.ngRepeatFinished();
@@ -81,6 +102,7 @@ angular.module('landingApp', [])
     $scope.cameraInfo = $scope.cameraInfo.filter(function(camInfo) {
       return camInfo.name == localCam;
     });
+    watchLive([localCam]);
     $scope.ngRepeatFinished();
   };
 
@@ -93,6 +115,18 @@ angular.module('landingApp', [])
     return true;
   };
 
+  // Live preview is fragmented MP4 on /live/, HLS playlist on /hls/ and
+  // Ogg when the middlebox transcodes the camera stream.
+  var getStreamType = function(streamUrl) {
+    if(streamUrl.indexOf(".m3u8") != -1) {
+      return "application/vnd.apple.mpegurl";
+    }
+    if(streamUrl.indexOf("/live/") != -1) {
+      return "video/mp4";
+    }
+    return "video/ogg";
+  };
+
   $scope.ngRepeatFinished = function() {
     var videoArr=[],sourceArr=[];
     for(var j=0;j<$scope.cameraInfo.length;j++) {
@@ -101,6 +135,9 @@ angular.module('landingApp', [])
         sourceArr[j] = document.getElementById("source"+j);
         var currentSrc = sourceArr[j].getAttribute('src');
         if(!currentSrc || currentSrc != $scope.cameraInfo[j].streamUrl) {
+          // HLS plays only on the browsers with native HLS support.
+          var streamType = getStreamType($scope.cameraInfo[j].streamUrl);
+          sourceArr[j].setAttribute('type', streamType);
           sourceArr[j].setAttribute('src', $scope.cameraInfo[j].streamUrl);
           videoArr[j].load();
           videoArr[j].play();
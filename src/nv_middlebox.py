@@ -17,6 +17,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(curr_dir, os.pardir)))
 
 from src.nv_logger import nv_logger,default_nv_log_handler
 from src.nvdb.nvdb_manager import db_mgr_obj
+from src.nvdb.nvdb_cam_registry import GBL_CAM_REGISTRY
 from src.nv_midbox_websock.nv_midbox_ws import nv_midbox_ws
 # Import all the configuration values
 from src.nv_midbox_conf import nv_midbox_conf
@@ -35,6 +36,7 @@ class nv_middlebox():
         try:
             db_mgr_obj.setup_session()
             db_mgr_obj.create_system_record()
+            GBL_CAM_REGISTRY.load_cameras()
         except Exception as e:
             self.nv_log_handler.error("Failed to initilized the middlebox DB")
             raise e
@@ -17,7 +17,7 @@ from base64 import b64encode
 from src.nv_logger import nv_logger
 from src.nvdb.nvdb_manager import db_mgr_obj, nv_midbox_system, enum_camStatus,\
     nv_webserver_system
-from src.nvdb.nvdb_manager import nv_camera
+from src.nvdb.nvdb_cam_registry import GBL_CAM_REGISTRY
 from src.nv_lib.ipc_data_obj import webserver_data, exitSys_data,camera_data, enum_ipcOpCode
 from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
 from src.nv_exception import midboxExitException
@@ -49,8 +49,15 @@ class nv_middlebox_cli(threading.Thread):
     Thread to run the cli option functions. All CLI user interaction handled
     by this thread
     '''
-    def __init__(self):
+    def __init__(self, relay_mgr = None, cam_thread_mgr = None):
+        '''
+        @param relay_mgr: The relay manager, to list the relay statistics.
+        @param cam_thread_mgr: The camera thread manager, to list the camera
+                               stream statistics and processes.
+        '''
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.relay_mgr = relay_mgr
+        self.cam_thread_mgr = cam_thread_mgr
         threading.Thread.__init__(self, None, None, "nv_midbox_cli")
         self.daemon = True # Kill the cli thread when main thread exits.
 
@@ -132,9 +139,12 @@ class nv_middlebox_cli(threading.Thread):
             self.nv_log_handler.error("Failed to configure the webserver")
 
     def del_nv_webserver(self):
+        srv_name = input("Enter webserver Name/IP to delete(default = all) : ")
+        if not srv_name:
+            srv_name = None
         try:
             ws_data = webserver_data(op = enum_ipcOpCode.CONST_DEL_WEBSERVER_OP,
-                                     name = None,
+                                     name = srv_name,
                                      videopath = None,
                                      uname = None,
                                      pwd = None)
@@ -191,9 +201,7 @@ class nv_middlebox_cli(threading.Thread):
         Return true if all the details are right. False otherwise.
         All the function parameters are string type.
         '''
-        db_mgr_obj.db_start_transaction()
-        cam_records = db_mgr_obj.get_tbl_records(nv_camera)
-        db_mgr_obj.db_end_transaction()
+        cam_records = GBL_CAM_REGISTRY.get_cameras()
         for cam_record in cam_records:
             if cam_record.name == name:
                 self.nv_log_handler.error("Cannot add camera, Duplicate name :%s"
@@ -289,21 +297,11 @@ class nv_middlebox_cli(threading.Thread):
 
     def nv_midbox_start_stream(self):
         cam_name = (input("Enter Camera Name: "))
-        filter_arg = {'name' : cam_name}
-        db_mgr_obj.db_start_transaction()
-        cam_cnt = db_mgr_obj.get_tbl_records_filterby_cnt(nv_camera, filter_arg)
-        db_mgr_obj.db_end_transaction()
-        if cam_cnt == 0:
+        cam_record = GBL_CAM_REGISTRY.get_camera(cam_name)
+        if cam_record is None:
             self.nv_log_handler.error("No record found with given name %s"
                                       % cam_name)
             return
-        if cam_cnt > 1:
-            self.nv_log_handler.error("Exiting, More than one record found"
-                                      " with same name %s" % cam_name)
-            return
-        db_mgr_obj.db_start_transaction()
-        cam_record = db_mgr_obj.get_tbl_records_filterby(nv_camera, filter_arg)[0]
-        db_mgr_obj.db_end_transaction()
         # XXX :: No need to send out all the camera details to start stream,only
         # name will be enough. But nothing harm to send everything. so sending
         # out for integrity.
@@ -327,9 +325,7 @@ class nv_middlebox_cli(threading.Thread):
         '''
         Start all the available cameras in the system
         '''
-        db_mgr_obj.db_start_transaction()
-        cam_records = db_mgr_obj.get_tbl_records(nv_camera)
-        db_mgr_obj.db_end_transaction()
+        cam_records = GBL_CAM_REGISTRY.get_cameras()
         for cam_record in cam_records:
             cam_ipcData = camera_data(
                                 op = enum_ipcOpCode.CONST_START_CAMERA_STREAM_OP,
@@ -354,18 +350,10 @@ class nv_middlebox_cli(threading.Thread):
         cam_name = input("Enter camera Name: ")
         if cam_name is None:
             return
-        filter_arg = {'name' : cam_name}
-        db_mgr_obj.db_start_transaction()
-        cam_cnt = db_mgr_obj.get_tbl_records_filterby_cnt(nv_camera, filter_arg)
-        db_mgr_obj.db_end_transaction()
-        if cam_cnt == 0:
+        if GBL_CAM_REGISTRY.get_camera(cam_name) is None:
             self.nv_log_handler.error("No record found with given name %s"
                                       % cam_name)
             return
-        if cam_cnt > 1:
-            self.nv_log_handler.error("Exiting, More than one record found"
-                                      " with same name %s" % cam_name)
-            return
         cam_ipcData = camera_data(op = enum_ipcOpCode.CONST_STOP_CAMERA_STREAM_OP,
                                   name = cam_name,
                                   # Everything else is None
@@ -384,9 +372,7 @@ class nv_middlebox_cli(threading.Thread):
             self.nv_log_handler.error("Failed to stop the camera at cli, %s", e)
 
     def nv_midbox_stop_all_stream(self):
-        db_mgr_obj.db_start_transaction()
-        cam_records = db_mgr_obj.get_tbl_records(nv_camera)
-        db_mgr_obj.db_end_transaction()
+        cam_records = GBL_CAM_REGISTRY.get_cameras()
         for cam_record in cam_records:
             cam_name = cam_record.name
             cam_ipcData = camera_data(op = enum_ipcOpCode.CONST_STOP_CAMERA_STREAM_OP,
@@ -409,8 +395,25 @@ class nv_middlebox_cli(threading.Thread):
                                           " %s", e)
 
     def list_midbox_system(self):
+        print_color_string("Conf queue : %s" % GBL_CONF_QUEUE.get_queue_stats(),
+                           color = "yellow")
+        print_color_string("DB lock : %s" % db_mgr_obj.get_db_lock_stats(),
+                           color = "yellow")
+        if self.relay_mgr:
+            for cam_name, cam_stats in \
+                sorted(self.relay_mgr.get_relay_stats().items()):
+                print_color_string("Relay %s : %s" % (cam_name, cam_stats),
+                                   color = "yellow")
+        if self.cam_thread_mgr:
+            for cam_record in GBL_CAM_REGISTRY.get_cameras():
+                print_color_string("Stream %s : %s" % (cam_record.name,
+                                self.cam_thread_mgr.get_cam_stream_stats(
+                                                        cam_record.cam_id)),
+                                color = "yellow")
+            for proc_state in self.cam_thread_mgr.get_proc_states():
+                print_color_string("Process %s" % proc_state, color = "yellow")
         try:
-            db_mgr_obj.db_start_transaction()
+            db_mgr_obj.db_start_transaction(read_only = True)
             self.nv_log_handler.debug("Listing system & webserver details "
                                       "from DB")
             if not db_mgr_obj.get_tbl_record_cnt(nv_midbox_system):
@@ -428,20 +431,14 @@ class nv_middlebox_cli(threading.Thread):
         except Exception as e:
             self.nv_log_handler.info("Failed to list the midbox system :%s", e)
         finally:
-            db_mgr_obj.db_end_transaction()
+            db_mgr_obj.db_end_transaction(read_only = True)
 
     def nv_midbox_list_cameras(self):
-        try:
-            db_mgr_obj.db_start_transaction()
-            if not db_mgr_obj.get_tbl_record_cnt(nv_camera):
-                print_color_string("No camera record found in the system",
-                                   color='red')
-                self.nv_log_handler.debug("Camera table empty in the system")
-                return
-            cam_records = db_mgr_obj.get_tbl_records(nv_camera)
-            print_color_string(cam_records, color = "green")
-            self.nv_log_handler.debug("Listing all the cameras in the DB")
-        except Exception as e:
-            self.nv_log_handler.info("Failed to list cameras : %s", e)
-        finally:
-            db_mgr_obj.db_end_transaction()
+        cam_records = GBL_CAM_REGISTRY.get_cameras()
+        if not cam_records:
+            print_color_string("No camera record found in the system",
+                               color='red')
+            self.nv_log_handler.debug("Camera table empty in the system")
+            return
+        print_color_string(cam_records, color = "green")
+        self.nv_log_handler.debug("Listing all the cameras in the registry")
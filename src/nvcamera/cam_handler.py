@@ -12,11 +12,16 @@ from src.nv_lib.nv_os_lib import nv_os_lib
 import time
 import ipaddress
 from src.settings import NV_MID_BOX_CAM_STREAM_DIR
-from threading import Thread
+from src.settings import NV_CAM_RECORD_MODE, NV_CAM_RECORD_RESTART_DELAY
 from threading import Event
+from threading import Timer
 from src.nv_lib.ipc_data_obj import camera_data, enum_ipcOpCode
 from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
 from src.nvdb.nvdb_manager import enum_camStatus
+from src.nvcamera.cam_libvlc import GBL_LIBVLC_ENGINE, nv_libvlc_stream
+from src.nvcamera.cam_supervisor import GBL_PROC_SUPERVISOR, nv_supervised_proc
+from src.nvcamera.cam_stream_stats import cam_stream_stats
+from src.nvcamera.cam_stream_stats import FFMPEG_PROGRESS_ARGS
 
 class cam_handler():
 
@@ -24,7 +29,13 @@ class cam_handler():
     Each camera had a camera handler instance to stream and store the video file
     in the local media-box server 
     '''
-    def __init__(self, cam_tbl_entry=None):
+    INGEST_CONSUMER_NAME = "record"
+
+    def __init__(self, cam_tbl_entry=None, ingest=None):
+        '''
+        @param ingest: The shared camera ingest to record from. The recorder
+                       connects to the camera by itself when its None.
+        '''
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
         self.time_lapse = cam_tbl_entry.stream_file_time_sec
 
@@ -38,47 +49,200 @@ class cam_handler():
         self.os_context = nv_os_lib()
         self.nv_log_handler.debug("Initialized the camera handler for %s.",
                                   self.name)
-        self.cam_thread_obj = None
         self.cam_stream_stop_event = Event()
-        self.vlc_thread = None
-
-    def save_camera_stream_in_multifile(self, stop_event):
-        cam_src_path = ["rtsp://" + self.username + ":" + self.pwd + "@" +\
-                        self.cam_ip + ":" + self.cam_listen_port]
-        vlc_out_opts = cam_src_path +\
-                       ["--no-loop", "--no-repeat", "--play-and-exit",
-                        "--live-caching=3000", #"--rt-priority",
-                       "--stop-time=" +
-                        str(self.time_lapse)]
+        self.stream_proc = None
+        self.respawn_out_file = None
+        self.stream_stats = cam_stream_stats(self.name + "-record")
+        self.ingest = ingest
+        if NV_CAM_RECORD_MODE != 'segment':
+            # Only the segment recorder can record from the shared ingest.
+            self.ingest = None
+        # libvlc recording mode data.
+        self.libvlc_started = False
+        self.libvlc_stream = None
+        self.libvlc_out_file = None
+        self.libvlc_stop_event = Event()
+
+    def get_camera_src_path(self):
+        return "rtsp://" + self.username + ":" + self.pwd + "@" +\
+                self.cam_ip + ":" + self.cam_listen_port
+
+    def get_camera_out_dir(self):
+        out_file_path = NV_MID_BOX_CAM_STREAM_DIR.rstrip('/') + "/" +\
+                        self.cam_dir + "/"
+        self.os_context.make_dir(out_file_path)
+        return out_file_path
+
+    def get_respawn_args(self):
+        '''
+        cvlc arguments for the next file, called by the supervisor on every
+        start of the respawn recorder.
+        '''
+        self.respawn_out_file = self.get_camera_out_dir() +\
+                    time.strftime("%d-%b-%Y:%H-%M-%S", time.gmtime()) + ".mp4"
+        vlc_args = [self.get_camera_src_path(),
+                    "--no-loop", "--no-repeat", "--play-and-exit",
+                    "--live-caching=3000", #"--rt-priority",
+                    "--stop-time=" + str(self.time_lapse),
+                    ":sout=#file{dst=" + self.respawn_out_file + "}"]
+        self.nv_log_handler.debug("Streaming  to a file %s" % str(vlc_args))
+        return vlc_args
+
+    def respawn_recording_stopped(self, sproc):
+        # The last file is closed by cvlc on stop and its already handed to
+        # the relay on the close, its not deleted here.
+        self.notify_stream_stopped()
+
+    def record_stream_respawn(self):
+        '''
+        Record the camera stream by starting a new cvlc process for every file.
+        Each cvlc run stops after 'time_lapse' seconds and the supervisor
+        starts the next one right away.
+        '''
         if self.os_context.is_pgm_installed('cvlc') is None:
             #The cvlc is not found.
             self.nv_log_handler.error("cvlc not installed, cannot stream")
+            self.notify_stream_stopped()
             return
-        out_file_path = NV_MID_BOX_CAM_STREAM_DIR.rstrip('/') + "/" +\
-                        self.cam_dir + "/"
-        self.os_context.make_dir(out_file_path)
-        try:
-            while not stop_event.is_set():
-            # Camera streaming loop to stream from camera, cut and store in
-            # multiple files. No error validation here, the files might be
-            # created without any video data. The restreaming server validates
-            # the files later.
-                out_file = out_file_path +\
+        # No error validation here, the files might be created without any
+        # video data. The restreaming server validates the files later.
+        self.stream_proc = nv_supervised_proc(
+                                name = self.name + self.cam_id + "-record",
+                                cmd = "cvlc",
+                                args = self.get_respawn_args,
+                                on_stop = self.respawn_recording_stopped,
+                                restart_delay = 0,
+                                stats = self.stream_stats)
+        GBL_PROC_SUPERVISOR.start_proc(self.stream_proc)
+
+    def record_stream_segment(self):
+        '''
+        Record the camera stream with one long-lived ffmpeg process. The RTSP
+        session is kept open for the entire recording and the segment muxer
+        cuts the stream into files of 'time_lapse' seconds. The stream is
+        copied as is, no decode/encode happens in the middlebox.
+        The ffmpeg is restarted by the supervisor only when it exits, for eg:
+        on camera connection loss.
+        The ffmpeg names the files in local time, its run in UTC to keep the
+        file names in UTC same as the other recording modes.
+        '''
+        if self.os_context.is_pgm_installed('ffmpeg') is None:
+            self.nv_log_handler.error("ffmpeg not installed, cannot stream")
+            self.notify_stream_stopped()
+            return
+        out_file_path = self.get_camera_out_dir()
+        if self.ingest is not None:
+            # MPEG-TS stream from the ingest.
+            src_args = ["-f", "mpegts", "-i", "pipe:0"]
+        else:
+            src_args = ["-rtsp_transport", "tcp",
+                        "-i", self.get_camera_src_path()]
+        ffmpeg_args = ["-nostdin", "-loglevel", "warning"] +\
+                      FFMPEG_PROGRESS_ARGS + src_args +\
+                      ["-map", "0", "-c", "copy",
+                       "-bsf:a", "aac_adtstoasc",
+                       "-f", "segment",
+                       "-segment_time", str(self.time_lapse),
+                       "-segment_format", "mp4",
+                       "-reset_timestamps", "1",
+                       "-strftime", "1",
+                       out_file_path + "%d-%b-%Y:%H-%M-%S.mp4"]
+        self.nv_log_handler.debug("Segment recording on %s" %
+                                  str(ffmpeg_args))
+        self.stream_proc = nv_supervised_proc(
+                                name = self.name + self.cam_id + "-record",
+                                cmd = "ffmpeg",
+                                args = ffmpeg_args,
+                                stdin_pipe = self.ingest is not None,
+                                on_stop = self.segment_recording_stopped,
+                                stats = self.stream_stats,
+                                env = {"TZ" : "UTC"})
+        if self.ingest is not None:
+            self.ingest.attach_consumer(self.INGEST_CONSUMER_NAME,
+                                        self.stream_proc)
+        GBL_PROC_SUPERVISOR.start_proc(self.stream_proc)
+
+    def segment_recording_stopped(self, sproc):
+        if self.ingest is not None:
+            self.ingest.detach_consumer(self.INGEST_CONSUMER_NAME)
+        self.notify_stream_stopped()
+
+    def start_libvlc_segment(self):
+        '''
+        Start recording the next file in the libvlc engine. Runs in the libvlc
+        engine thread.
+        '''
+        if self.cam_stream_stop_event.is_set():
+            self.libvlc_recording_stopped()
+            return
+        self.libvlc_out_file = self.get_camera_out_dir() +\
                     time.strftime("%d-%b-%Y:%H-%M-%S", time.gmtime()) + ".mp4"
-                vlc_args = vlc_out_opts + [":sout=#file{dst=" + out_file + "}"]
-                self.nv_log_handler.debug("Streaming  to a file %s" %
-                                          str(vlc_args))
-                self.vlc_thread = self.os_context.execute_cmd_bg("cvlc",
-                                                                 vlc_args)
-                self.os_context.wait_cmd_complete(self.vlc_thread)
+        vlc_opts = [":live-caching=3000",
+                    ":stop-time=" + str(self.time_lapse),
+                    ":sout=#file{dst=" + self.libvlc_out_file + "}"]
+        self.libvlc_stream = nv_libvlc_stream(self.get_camera_src_path(),
+                                              vlc_opts,
+                                              on_end = self.libvlc_segment_end)
+        try:
+            self.libvlc_stream.start()
         except Exception as e:
-            self.nv_log_handler.info("Streaming thread is killed abruptly"
-                            "on streaming from camera %s" % self.name)
+            self.nv_log_handler.error("Failed to start libvlc recording on %s"
+                                      ", %s", self.name, e)
+            self.libvlc_segment_end(self.libvlc_stream, True)
+
+    def libvlc_segment_end(self, stream, is_error):
+        '''
+        Roll over to the next file when libvlc reached the stop-time of
+        current file. On error, the next file is started after a delay.
+        Runs in the libvlc engine thread.
+        '''
+        if stream is not self.libvlc_stream:
+            return
+        if self.cam_stream_stop_event.is_set():
+            self.libvlc_recording_stopped()
+            return
+        if not is_error:
+            self.start_libvlc_segment()
+            return
+        self.nv_log_handler.info("libvlc recording failed on camera %s, "
+                                 "restarting in %d sec", self.name,
+                                 NV_CAM_RECORD_RESTART_DELAY)
+        restart_timer = Timer(NV_CAM_RECORD_RESTART_DELAY,
+                              GBL_LIBVLC_ENGINE.post_event,
+                              args = (self.start_libvlc_segment,))
+        restart_timer.daemon = True
+        restart_timer.start()
 
-        # Delete the last file as it may be not safe to share.
-        self.nv_log_handler.debug("delete last video snip %s before exiting,",
-                                  out_file)
-        self.os_context.remove_file(out_file)
+    def stop_libvlc_recording(self):
+        '''
+        Stop the libvlc recording, runs in the libvlc engine thread.
+        '''
+        if self.libvlc_stream is not None:
+            self.libvlc_stream.stop()
+        self.libvlc_recording_stopped()
+
+    def libvlc_recording_stopped(self):
+        if self.libvlc_stop_event.is_set():
+            return
+        # The last file is closed by libvlc on stop and its already handed to
+        # the relay on the close, its not deleted here.
+        self.libvlc_stream = None
+        self.notify_stream_stopped()
+        self.libvlc_stop_event.set()
+
+    def get_stream_stats(self):
+        '''
+        Returns the statistics of current recording. The libvlc media
+        statistics in libvlc recording mode, statistics parsed from the
+        recording process otherwise.
+        '''
+        if self.stream_proc is not None:
+            return self.stream_stats.get_stats()
+        if self.libvlc_stream is None:
+            return None
+        return self.libvlc_stream.get_stats()
+
+    def notify_stream_stopped(self):
         # Set the camera status to ready while exiting the streaming.
         cam_ipcData = camera_data(op = enum_ipcOpCode.CONST_UPDATE_CAMERA_STATUS,
                                   name = self.name,
@@ -104,30 +268,54 @@ class cam_handler():
         '''
         Start the camera streaming from the camera named cam_id
         '''
-        if self.cam_thread_obj:
-            self.nv_log_handler.error("Cannot start streaming thread, " 
+        if NV_CAM_RECORD_MODE == 'libvlc':
+            # libvlc engine records in the engine thread, no thread needed
+            # for the camera.
+            if self.libvlc_started:
+                self.nv_log_handler.error("Cannot start libvlc recording, "
+                                          "its already started")
+                return
+            GBL_LIBVLC_ENGINE.get_instance()
+            self.libvlc_started = True
+            GBL_LIBVLC_ENGINE.post_event(self.start_libvlc_segment)
+            return
+        if self.stream_proc:
+            self.nv_log_handler.error("Cannot start streaming process, "
                                         "its already exists")
             return
-        self.cam_thread_obj = Thread(
-                              name=self.name + str(self.cam_id) + "-stream",
-                              target=self.save_camera_stream_in_multifile,
-                              args = (self.cam_stream_stop_event,))
-        self.cam_thread_obj.daemon = True
-        self.cam_thread_obj.start()
+        # The recording process is run by the process supervisor, no thread
+        # needed for the camera.
+        if NV_CAM_RECORD_MODE == 'segment':
+            self.record_stream_segment()
+        else:
+            self.record_stream_respawn()
 
     def stop_camera_thread(self):
         '''
         Stop the camera streaming of camera with id 'cam_id'
         '''
         self.cam_stream_stop_event.set()
+        if NV_CAM_RECORD_MODE == 'libvlc':
+            if self.libvlc_started:
+                GBL_LIBVLC_ENGINE.post_event(self.stop_libvlc_recording)
+            return
+        # The segment recorder never exits by itself, ask it to finalize
+        # the current file and exit. EOF on the stream is enough to finalize
+        # when recording from the ingest.
+        GBL_PROC_SUPERVISOR.stop_proc(self.stream_proc,
+                                      close_stdin = self.ingest is not None)
 
     def kill_camera_thread(self):
         '''
         Kill the camera thread in the emergency event.
         '''
         self.cam_stream_stop_event.set()
+        if NV_CAM_RECORD_MODE == 'libvlc':
+            # Nothing to kill, libvlc recording stops immediately.
+            self.stop_camera_thread()
+            return
         try:
-            self.os_context.kill_process(self.vlc_thread)
+            GBL_PROC_SUPERVISOR.kill_proc(self.stream_proc)
         except Exception as e:
             self.nv_log_handler.info("Failed to kill the vlc thread in force"
                                       "%s", e)
@@ -136,8 +324,10 @@ class cam_handler():
         '''
         Wait for camera streamer thread to join in the main thread.
         '''
-        if self.cam_thread_obj is not None and self.cam_thread_obj.isAlive():
-            self.cam_thread_obj.join()
+        if NV_CAM_RECORD_MODE == 'libvlc' and self.libvlc_started:
+            self.libvlc_stop_event.wait()
+            return
+        GBL_PROC_SUPERVISOR.wait_proc(self.stream_proc)
 
     def get_camid_by_name(self, cam_name):
         '''
@@ -0,0 +1,121 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The camera ingest module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import ipaddress
+from threading import Lock
+from src.nv_logger import nv_logger
+from src.nv_logger_rl import nv_logger_rl
+from src.nvcamera.cam_supervisor import GBL_PROC_SUPERVISOR
+from src.nvcamera.cam_supervisor import nv_supervised_proc
+from src.nvcamera.cam_stream_stats import cam_stream_stats
+from src.nvcamera.cam_stream_stats import FFMPEG_PROGRESS_ARGS
+
+# Size of a MPEG-TS packet, in bytes.
+MPEGTS_PACKET_SIZE = 188
+
+class cam_ingest():
+    '''
+    Pull the camera stream once and fan it out to all the attached consumers.
+    The RTSP stream is copied into MPEG-TS without any transcoding by an
+    ffmpeg process. The ingest runs as long as there is at least one consumer
+    attached to it.
+    The ingest and the consumers are supervised processes, the stream is
+    passed between them in the supervisor event loop. A slow or dead consumer
+    never blocks the ingest or the other consumers.
+    '''
+    def __init__(self, cam_tbl_entry):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.nv_log_handler_rl = nv_logger_rl(nv_log_obj = self.nv_log_handler,
+                                              timeout = 30)
+        self.name = cam_tbl_entry.name
+        self.cam_id = cam_tbl_entry.cam_id
+        self.cam_src_path = "rtsp://" + cam_tbl_entry.username + ":" +\
+                            cam_tbl_entry.password + "@" +\
+                            str(ipaddress.IPv4Address(cam_tbl_entry.ip_addr)) +\
+                            ":" + str(cam_tbl_entry.listen_port)
+        self.consumers = {}
+        self.ingest_lock = Lock()
+        self.ingest_proc = None
+        # The partial TS packet at the end of the last read.
+        self.stream_tail = b""
+        self.stream_stats = cam_stream_stats(self.name + "-ingest")
+
+    def attach_consumer(self, name, sproc):
+        '''
+        Attach a consumer to the ingest. 'sproc' is a supervised process with a
+        stdin pipe, it gets the stream across its restarts. Start the ingest if
+        its not running.
+        '''
+        with self.ingest_lock:
+            self.consumers[name] = sproc
+            if self.ingest_proc is None:
+                self.start_ingest()
+        self.nv_log_handler.debug("Attached %s to the ingest of camera %s",
+                                  name, self.name)
+
+    def detach_consumer(self, name):
+        '''
+        Detach a consumer from the ingest. The ingest stopped when its the
+        last consumer. The consumer process is not stopped.
+        '''
+        with self.ingest_lock:
+            if self.consumers.pop(name, None) is None:
+                return
+            if not self.consumers:
+                self.stop_ingest()
+        self.nv_log_handler.debug("Detached %s from the ingest of camera %s",
+                                  name, self.name)
+
+    def start_ingest(self):
+        ffmpeg_args = ["-nostdin", "-loglevel", "warning"] +\
+                      FFMPEG_PROGRESS_ARGS +\
+                      ["-rtsp_transport", "tcp",
+                       "-i", self.cam_src_path,
+                       "-map", "0", "-c", "copy",
+                       "-f", "mpegts", "pipe:1"]
+        self.ingest_proc = nv_supervised_proc(
+                                name = self.name + str(self.cam_id) + "-ingest",
+                                cmd = "ffmpeg",
+                                args = ffmpeg_args,
+                                on_stdout = self.fan_out_stream,
+                                on_start = self.reset_stream,
+                                stats = self.stream_stats)
+        GBL_PROC_SUPERVISOR.start_proc(self.ingest_proc)
+
+    def stop_ingest(self):
+        GBL_PROC_SUPERVISOR.stop_proc(self.ingest_proc)
+        self.ingest_proc = None
+
+    def reset_stream(self, sproc):
+        # A restarted ingest starts a new stream on a packet boundary.
+        self.stream_tail = b""
+
+    def fan_out_stream(self, chunk):
+        # Runs in the supervisor event loop. Only the whole TS packets are
+        # passed on, so a slow consumer drops the stream on packet boundaries
+        # and its demuxer stays in sync.
+        chunk = self.stream_tail + chunk
+        packets_len = len(chunk) - len(chunk) % MPEGTS_PACKET_SIZE
+        self.stream_tail = chunk[packets_len:]
+        if not packets_len:
+            return
+        chunk = chunk[:packets_len]
+        for name, consumer in list(self.consumers.items()):
+            if not consumer.is_running():
+                continue
+            if not GBL_PROC_SUPERVISOR.write_stdin(consumer, chunk):
+                self.nv_log_handler_rl.info_rl("Ingest consumer %s of %s is "
+                                               "slow, dropping the stream data",
+                                               name, self.name)
+
+    def stop_all(self):
+        with self.ingest_lock:
+            self.consumers.clear()
+            if self.ingest_proc is not None:
+                self.stop_ingest()
@@ -0,0 +1,171 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The in-process libvlc media engine for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import queue
+from threading import Thread
+from threading import Lock
+from src.nv_logger import nv_logger
+
+class nv_libvlc_engine():
+    '''
+    Wrapper for the libvlc binding in 'vlc.py'. One libvlc instance is shared
+    by all the camera streams in the middlebox.
+    libvlc raises the media player events on its own threads and its not safe
+    to call libvlc from these event callbacks. Every event is handed over to
+    the engine thread, that runs all the event handlers one after other.
+    XXX :: DO NOT CREATE OBJECTS FOR THIS CLASS. USE THE GLOBAL OBJECT
+    'GBL_LIBVLC_ENGINE'.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.vlc = None
+        self.instance = None
+        self.engine_lock = Lock()
+        self.event_queue = queue.Queue()
+        self.engine_thread = None
+
+    def get_vlc_module(self):
+        '''
+        Load the libvlc binding on first use. The binding loads libvlc.so at
+        the import time, so the middlebox can still run the cvlc engines when
+        libvlc is not installed.
+        '''
+        if self.vlc is None:
+            try:
+                from src.nvcamera import vlc
+            except Exception as e:
+                self.nv_log_handler.error("Failed to load libvlc, %s", e)
+                raise ImportError("libvlc is not available, install vlc")
+            self.vlc = vlc
+        return self.vlc
+
+    def get_instance(self):
+        '''
+        Returns the shared libvlc instance, create it if not exists.
+        '''
+        with self.engine_lock:
+            if self.instance is not None:
+                return self.instance
+            vlc = self.get_vlc_module()
+            try:
+                self.instance = vlc.Instance("--no-xlib", "--quiet",
+                                             "--no-video-title-show")
+            except Exception as e:
+                # The binding raises NameError when libvlc.so is not found.
+                self.nv_log_handler.error("libvlc is not available, %s", e)
+                self.instance = None
+            if self.instance is None:
+                self.nv_log_handler.error("Failed to create libvlc instance")
+                raise RuntimeError("Cannot create the libvlc instance")
+            self.engine_thread = Thread(name = "nv_libvlc_engine",
+                                        target = self.run_engine)
+            self.engine_thread.daemon = True
+            self.engine_thread.start()
+            self.nv_log_handler.info("Started the libvlc engine")
+        return self.instance
+
+    def post_event(self, fn, *args):
+        '''
+        Run 'fn' with 'args' in the engine thread.
+        '''
+        self.event_queue.put((fn, args))
+
+    def run_engine(self):
+        while True:
+            event = self.event_queue.get()
+            if event is None:
+                break
+            fn, args = event
+            try:
+                fn(*args)
+            except Exception as e:
+                self.nv_log_handler.error("Exception in libvlc engine event "
+                                          "handler %s", e)
+        self.nv_log_handler.info("Exiting the libvlc engine thread")
+
+    def stop_engine(self):
+        if self.engine_thread is None:
+            return
+        self.event_queue.put(None)
+
+class nv_libvlc_stream():
+    '''
+    A media stream played in the shared libvlc instance. The stream output is
+    defined by the ':sout' option in 'options'.
+    'on_end' is called in the engine thread as on_end(stream, is_error) when
+    the stream is ended or failed. It is not called on an explicit stop.
+    '''
+    def __init__(self, mrl, options, on_end = None):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.mrl = mrl
+        self.options = options
+        self.on_end = on_end
+        self.media = None
+        self.player = None
+
+    def start(self):
+        instance = GBL_LIBVLC_ENGINE.get_instance()
+        vlc = GBL_LIBVLC_ENGINE.get_vlc_module()
+        self.media = instance.media_new(self.mrl, *self.options)
+        self.player = instance.media_player_new()
+        self.player.set_media(self.media)
+        event_mgr = self.player.event_manager()
+        event_mgr.event_attach(vlc.EventType.MediaPlayerEndReached,
+                               self.on_vlc_event, False)
+        event_mgr.event_attach(vlc.EventType.MediaPlayerEncounteredError,
+                               self.on_vlc_event, True)
+        if self.player.play() == -1:
+            self.release()
+            raise RuntimeError("libvlc failed to play the stream")
+
+    def on_vlc_event(self, event, is_error):
+        # Called in libvlc thread, do not call libvlc from here.
+        GBL_LIBVLC_ENGINE.post_event(self.stream_ended, is_error)
+
+    def stream_ended(self, is_error):
+        if self.player is None:
+            # Stream is stopped already.
+            return
+        self.release()
+        if self.on_end:
+            self.on_end(self, is_error)
+
+    def stop(self):
+        if self.player is None:
+            return
+        self.player.stop()
+        self.release()
+
+    def release(self):
+        if self.player is not None:
+            self.player.release()
+            self.player = None
+        if self.media is not None:
+            self.media.release()
+            self.media = None
+
+    def is_playing(self):
+        return self.player is not None
+
+    def get_stats(self):
+        '''
+        Returns the libvlc media statistics as a dictionary, None if the
+        statistics are not available.
+        '''
+        media = self.media
+        if media is None:
+            return None
+        vlc = GBL_LIBVLC_ENGINE.get_vlc_module()
+        stats = vlc.MediaStats()
+        if not media.get_stats(stats):
+            return None
+        return dict((field, getattr(stats, field))
+                    for field, _ in vlc.MediaStats._fields_)
+
+GBL_LIBVLC_ENGINE = nv_libvlc_engine()
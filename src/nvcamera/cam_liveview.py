@@ -11,22 +11,45 @@ from src.nv_logger import nv_logger
 from src.nv_lib.nv_os_lib import nv_os_lib
 from src.nv_lib.ipc_data_obj import enum_ipcOpCode, camera_data
 from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
-from src.nvdb.nvdb_manager import nv_camera
-from src.nvdb.nvdb_manager import db_mgr_obj
+from src.nvdb.nvdb_cam_registry import GBL_CAM_REGISTRY
 from src.nvdb.nvdb_manager import enum_camStatus
+from src.nvcamera.cam_libvlc import nv_libvlc_stream, GBL_LIBVLC_ENGINE
+from src.nvcamera.cam_supervisor import GBL_PROC_SUPERVISOR, nv_supervised_proc
+from src.nvcamera.cam_stream_stats import cam_stream_stats
+from src.nvcamera.cam_stream_stats import FFMPEG_PROGRESS_ARGS
+from src.nv_midbox_websock.nv_midbox_live import GBL_LIVE_STREAMS
+from src.settings import NV_CAM_LIVE_ENGINE
+from src.settings import NV_CAM_LIVE_MODE
+from src.settings import NV_CAM_LIVE_PLAYABLE_CODECS
+from src.settings import NV_CAM_LIVE_HLS_DIR
+from src.settings import NV_CAM_LIVE_HLS_SEGMENT_SEC
+from src.settings import NV_CAM_LIVE_HLS_LIST_SIZE
+from src.settings import NV_CAM_LIVE_READY_TIMEOUT
+from src.settings import NV_CAM_LIVE_CHECK_INTERVAL
+from src.settings import NV_MIDBOX_PAGE_HTTP_PORT
 
+import asyncio
+import concurrent.futures
 import ipaddress
-from threading import Thread
-from threading import Event
-from time import sleep
+import uuid
 
 class nv_cam_liveview():
     '''
     Class to handle the live view of camera stream. Cameras output the streams
-    in rtsp format. browser doesnnt support rtsp support. This module transcode
-    the rtsp into http and send it to browser for the live preview.
+    in rtsp format. browser doesnnt support rtsp support. This module remux the
+    rtsp into fragmented MP4/HLS and serve it from the middlebox page server
+    for the live preview. The stream is transcoded only when the browser cannot
+    play the camera video codec.
+    The live preview is started and supervised in the process supervisor
+    event loop, none of its methods called in the loop must block.
     '''
-    def __init__(self, cam_tbl_entry = None):
+    INGEST_CONSUMER_NAME = "live"
+
+    def __init__(self, cam_tbl_entry = None, ingest = None):
+        '''
+        @param ingest: The shared camera ingest for the live preview. The live
+                       preview connects to the camera by itself when its None.
+        '''
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
         if cam_tbl_entry is None:
             self.nv_log_handler.error("Cannot start live preview for empty"
@@ -40,9 +63,16 @@ class nv_cam_liveview():
         self.cam_ip = str(ipaddress.IPv4Address(cam_tbl_entry.ip_addr))
         self.cam_listen_port = str(cam_tbl_entry.listen_port)
         self.os_context = nv_os_lib()
+        self.ingest = ingest
+        self.live_mode = None
+        # Unique token of every live preview start, to tell apart the HLS
+        # directory and process of a live preview from the previous ones.
+        self.live_token = None
+        self.cam_video_codec = None
         self.live_thread_cmd = None
-        self.live_cam_thread = None
-        self.cam_live_stop_event = Event()
+        self.stream_stats = cam_stream_stats(self.cam_name + "-live")
+        # Future of the live preview task in the process supervisor.
+        self.live_task = None
         # Do not modify the value in methods
         self.const_stream_len_sec = cam_tbl_entry.stream_file_time_sec
         # Do not modify this value in any of methods
@@ -50,13 +80,23 @@ class nv_cam_liveview():
         self.stream_state = cam_tbl_entry.status
         self.state_chk_timeout = self.const_stream_len_sec
 
-    def do_live_preview(self):
+    async def do_live_preview(self):
         '''
         Helper function to do the live preview operation
         '''
-        cam_src_path = ["rtsp://" + self.cam_uname + ":" + self.cam_pwd + "@" +\
-                        self.cam_ip + ":" + self.cam_listen_port]
-        vlc_out_opts = cam_src_path + ["--live-caching=3000"]
+        cam_src_path = "rtsp://" + self.cam_uname + ":" + self.cam_pwd + "@" +\
+                        self.cam_ip + ":" + self.cam_listen_port
+        self.live_mode = await self.get_live_mode(cam_src_path)
+        self.live_token = uuid.uuid4().hex[:8]
+        if self.live_mode != 'transcode':
+            return await self.do_live_preview_remux(cam_src_path)
+        if NV_CAM_LIVE_ENGINE == 'libvlc':
+            return self.do_live_preview_libvlc(cam_src_path)
+        if self.ingest is not None:
+            # MPEG-TS stream from the ingest on stdin.
+            vlc_out_opts = ["fd://0", "--demux=ts", "--live-caching=3000"]
+        else:
+            vlc_out_opts = [cam_src_path, "--live-caching=3000"]
 
         if self.os_context.is_pgm_installed('cvlc') is None:
             #The cvlc is not found.
@@ -67,13 +107,10 @@ class nv_cam_liveview():
             self.nv_log_handler.error("ffmpeg is not installed, cannot live-stream")
             return None
         port_num = str(self.os_context.get_free_listen_port())
-        vlc_args = vlc_out_opts + [":sout=#transcode{vcodec=theo,vb=250,fps=20,"
-                                   "scale=0.25,acodec=none,threads=4}:"
-                                   "http{mux=ogg,dst=:"
-                                   + port_num + "/" + str(self.cam_id) + "}",
+        vlc_args = vlc_out_opts + [self.get_live_sout(port_num),
                                    "--no-sout-audio" ]
         try:
-            self.live_thread_cmd = self.os_context.execute_cmd_bg("cvlc", vlc_args)
+            self.start_live_proc("cvlc", vlc_args)
             self.live_url = port_num + "/" + str(self.cam_id)
         except Exception as e:
             self.nv_log_handler.error("Failed to start the live stream"
@@ -82,10 +119,200 @@ class nv_cam_liveview():
             raise e
         return self.live_url
 
-    def is_camera_reachable(self):
+    async def get_live_mode(self, cam_src_path):
+        '''
+        Returns the live preview mode for the camera. The camera video codec is
+        probed only once, the stream is transcoded when the browser cannot play
+        the codec.
+        '''
+        if NV_CAM_LIVE_MODE == 'transcode':
+            return 'transcode'
+        if self.cam_video_codec is None:
+            self.cam_video_codec = await self.os_context.get_video_codec_async(
+                                                                cam_src_path)
+            if self.cam_video_codec is None:
+                # Cannot probe, most cameras stream H.264 anyway.
+                self.nv_log_handler.info("Cannot find the video codec of %s, "
+                                         "trying to live preview without "
+                                         "transcode", self.cam_name)
+                return NV_CAM_LIVE_MODE
+        if self.cam_video_codec not in NV_CAM_LIVE_PLAYABLE_CODECS:
+            self.nv_log_handler.info("%s video codec %s is not playable in "
+                                     "browser, transcoding the live preview",
+                                     self.cam_name, self.cam_video_codec)
+            return 'transcode'
+        return NV_CAM_LIVE_MODE
+
+    def get_live_hls_dir(self):
+        '''
+        Every start of the live preview writes into a new HLS directory, the
+        directory of the previous remuxer is removed when it exits.
+        '''
+        return self.os_context.join_dir(
+                        self.os_context.join_dir(NV_CAM_LIVE_HLS_DIR,
+                                                 str(self.cam_id)),
+                        self.live_token)
+
+    async def do_live_preview_remux(self, cam_src_path):
+        '''
+        Copy the camera video into fragmented MP4/HLS for the live preview,
+        without any transcoding. The fragmented MP4 is read from the ffmpeg
+        stdout and streamed to the browsers by the middlebox page server. HLS
+        playlist and segments are written into the live directory and served
+        as files.
+        '''
+        if self.os_context.is_pgm_installed('ffmpeg') is None:
+            self.nv_log_handler.error("ffmpeg is not installed, cannot live-stream")
+            return None
+        if self.ingest is not None:
+            # MPEG-TS stream from the ingest on stdin.
+            src_args = ["-f", "mpegts", "-i", "pipe:0"]
+        else:
+            src_args = ["-rtsp_transport", "tcp", "-i", cam_src_path]
+        live_stream = None
+        hls_dir = None
+        if self.live_mode == 'hls':
+            hls_dir = self.get_live_hls_dir()
+            self.os_context.make_dir(hls_dir)
+            out_args = ["-f", "hls",
+                        "-hls_time", str(NV_CAM_LIVE_HLS_SEGMENT_SEC),
+                        "-hls_list_size", str(NV_CAM_LIVE_HLS_LIST_SIZE),
+                        "-hls_flags", "delete_segments+omit_endlist",
+                        self.os_context.join_dir(hls_dir, "index.m3u8")]
+            live_url = str(NV_MIDBOX_PAGE_HTTP_PORT) + "/hls/" + \
+                       str(self.cam_id) + "/" + self.live_token + "/index.m3u8"
+        else:
+            out_args = ["-f", "mp4",
+                        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                        "pipe:1"]
+            live_stream = GBL_LIVE_STREAMS.add_stream(str(self.cam_id))
+            live_url = str(NV_MIDBOX_PAGE_HTTP_PORT) + "/live/" + \
+                       str(self.cam_id)
+        ffmpeg_args = ["-nostdin", "-loglevel", "error"] + \
+                      FFMPEG_PROGRESS_ARGS + src_args + \
+                      ["-map", "0:v:0", "-c:v", "copy", "-an"] + out_args
+        on_stop = lambda sproc : self.remux_proc_stopped(live_stream, hls_dir)
+        try:
+            if live_stream is not None:
+                # A restarted remuxer starts the stream with a new init segment.
+                self.start_live_proc("ffmpeg", ffmpeg_args,
+                                     on_stdout = live_stream.feed,
+                                     on_start = lambda sproc:
+                                                live_stream.reset(),
+                                     on_stop = on_stop)
+            else:
+                self.start_live_proc("ffmpeg", ffmpeg_args, on_stop = on_stop)
+            self.live_url = live_url
+        except Exception as e:
+            self.nv_log_handler.error("Failed to start the live stream"
+                                      "Error is %s", e)
+            self.stop_live_proc()
+            raise e
+        if not await self.wait_remux_ready(live_stream):
+            self.nv_log_handler.info("Live preview of %s is not playable yet "
+                                     "after %d sec", self.cam_name,
+                                     NV_CAM_LIVE_READY_TIMEOUT)
+        return self.live_url
+
+    async def wait_remux_ready(self, live_stream):
+        '''
+        Wait until the remuxed stream is playable, i.e. the fragmented MP4 init
+        segment is out or the first HLS playlist is written.
+        '''
+        playlist = self.os_context.join_dir(self.get_live_hls_dir(),
+                                            "index.m3u8")
+        timeout = NV_CAM_LIVE_READY_TIMEOUT * 4
+        while timeout:
+            if live_stream is not None and live_stream.is_ready():
+                return True
+            if live_stream is None and self.os_context.is_path_exists(playlist):
+                return True
+            await asyncio.sleep(0.25)
+            timeout -= 1
+        return False
+
+    def start_live_proc(self, cmd, args, on_stdout = None, on_start = None,
+                        on_stop = None):
+        '''
+        Run the live preview process in the process supervisor. The process is
+        restarted by the supervisor when it exits, for eg: on camera
+        connection loss.
+        '''
+        self.live_thread_cmd = nv_supervised_proc(
+                                name = self.cam_name + str(self.cam_id) +
+                                       "-live-" + self.live_token,
+                                cmd = cmd,
+                                args = args,
+                                stdin_pipe = self.ingest is not None,
+                                on_stdout = on_stdout,
+                                on_start = on_start,
+                                on_stop = on_stop,
+                                stats = self.stream_stats)
+        if self.ingest is not None:
+            self.ingest.attach_consumer(self.INGEST_CONSUMER_NAME,
+                                        self.live_thread_cmd)
+        GBL_PROC_SUPERVISOR.start_proc(self.live_thread_cmd)
+
+    def stop_live_proc(self):
+        '''
+        Stop the live preview process, doesnt wait for the process to exit.
+        '''
+        if self.ingest is not None:
+            self.ingest.detach_consumer(self.INGEST_CONSUMER_NAME)
+        GBL_PROC_SUPERVISOR.stop_proc(self.live_thread_cmd)
+
+    def remux_proc_stopped(self, live_stream, hls_dir):
+        '''
+        Remove the HLS directory or the live stream of the remuxer once its
+        exited, called by the process supervisor. Only the remuxer's own are
+        removed, a new live preview of the camera may be running already.
+        '''
+        if hls_dir is not None:
+            self.os_context.remove_dir(hls_dir)
+        if live_stream is not None:
+            GBL_LIVE_STREAMS.remove_stream(str(self.cam_id), live_stream)
+
+    def get_live_sout(self, port_num):
+        return ":sout=#transcode{vcodec=theo,vb=250,fps=20,"\
+               "scale=0.25,acodec=none,threads=4}:"\
+               "http{mux=ogg,dst=:" + port_num + "/" + str(self.cam_id) + "}"
+
+    def do_live_preview_libvlc(self, cam_src_path):
+        '''
+        Run the live preview in the libvlc engine of middlebox process.
+        '''
+        port_num = str(self.os_context.get_free_listen_port())
+        vlc_opts = [":live-caching=3000", self.get_live_sout(port_num),
+                    ":no-sout-audio"]
+        live_stream = nv_libvlc_stream(cam_src_path, vlc_opts)
+        try:
+            live_stream.start()
+            self.live_thread_cmd = live_stream
+            self.live_url = port_num + "/" + str(self.cam_id)
+        except Exception as e:
+            self.nv_log_handler.error("Failed to start the libvlc live stream"
+                                      "Error is %s", e)
+            self.live_thread_cmd = None
+            raise e
+        return self.live_url
+
+    def get_live_stats(self):
+        '''
+        Returns the statistics of live preview. The libvlc media statistics
+        when the live preview runs in libvlc engine, statistics parsed from the
+        live preview process otherwise.
+        '''
+        if not self.live_thread_cmd:
+            return None
+        if self.live_mode != 'transcode' or NV_CAM_LIVE_ENGINE != 'libvlc':
+            return self.stream_stats.get_stats()
+        return self.live_thread_cmd.get_stats()
+
+    async def is_camera_reachable(self):
         #Check if the port and camera ip is reachable.
         try:
-            is_open = self.os_context.is_remote_port_open(ip=self.cam_ip,
+            is_open = await self.os_context.is_remote_port_open_async(
+                                        ip=self.cam_ip,
                                         port=int(self.cam_listen_port))
             if is_open:
                 return True
@@ -128,22 +355,27 @@ class nv_cam_liveview():
 
     def restart_live_stream(self):
         '''
-        Stop the current live stream thread and start a new one.
-        Used to restart the live preview in case there are connection
-        issues with the camera
-        @return: url : the new url after starting the live stream
+        Restart the live preview process, used to restart the live preview in
+        case there are connection issues with the camera. The live url stays
+        the same.
         '''
-        new_liveUrl = None
+        if not self.live_thread_cmd:
+            return
+        if self.live_mode == 'transcode' and NV_CAM_LIVE_ENGINE == 'libvlc':
+            # libvlc blocks on stop, restart in the libvlc engine thread.
+            GBL_LIBVLC_ENGINE.post_event(self.restart_libvlc_stream,
+                                         self.live_thread_cmd)
+            return
+        GBL_PROC_SUPERVISOR.restart_proc(self.live_thread_cmd)
+
+    def restart_libvlc_stream(self, live_stream):
         try:
-            self.stop_live_preview__()
-            new_liveUrl= self.do_live_preview()
+            live_stream.stop()
+            live_stream.start()
         except Exception as e:
             self.nv_log_handler.info("Failed to start live preview again "
                                      " on %s Exception %s",
                                      self.cam_name, e)
-            raise e
-        finally:
-            return new_liveUrl
 
     def stream_state_changed(self):
         '''
@@ -158,23 +390,13 @@ class nv_cam_liveview():
             '''
             No need to do the camera status check in the loop.
             Validate only on the timeout. The purpose of this is to avoid
-            unnecessary DB read for the validation.
+            unnecessary camera registry lookup for the validation.
             '''
             self.state_chk_timeout -= 1
             return False
 
         self.state_chk_timeout = self.const_stream_len_sec
-        filter_arg = {'name' : self.cam_name}
-        cam_record = None
-        try:
-            db_mgr_obj.db_start_transaction()
-            cam_record = db_mgr_obj.get_tbl_records_filterby_first(nv_camera,
-                                                                   filter_arg)
-            db_mgr_obj.db_end_transaction()
-        except:
-            # Release the db lock in error in case its not yet released
-            db_mgr_obj.db_end_transaction()
-            return False
+        cam_record = GBL_CAM_REGISTRY.get_camera(self.cam_name)
         if cam_record is None:
             self.nv_log_handler.error("Empty camera record for %s, Cannot read",
                                       self.cam_name)
@@ -187,12 +409,12 @@ class nv_cam_liveview():
         self.stream_state = cam_record.status
         return True
 
-    def start_live_preview__(self, stop_event):
+    async def start_live_preview__(self):
         '''
         (Class internal function)
-        Start the preview thread to do the transcode and xmit the stream
+        Start the live preview and supervise it until its stopped, runs in the
+        process supervisor event loop.
         Set the HTTP url to view the live preview.
-        @param  stop_event : Sets by thread manager to stop the live preview
         '''
         if self.live_url:
             self.nv_log_handler.info("The live stream is already running on %s"
@@ -200,49 +422,47 @@ class nv_cam_liveview():
                                      self.live_url)
             return
         try:
-            #Check if the port and camera ip is reachable.
-            if not self.is_camera_reachable():
+            try:
+                #Check if the port and camera ip is reachable.
+                if not await self.is_camera_reachable():
+                    self.live_url = None
+                    return
+                await self.do_live_preview()
+            except Exception as e:
                 self.live_url = None
+                self.nv_log_handler.error("Failed to start the live preview on "
+                                          "%s Exception :%s", self.cam_name, e)
                 return
-            self.do_live_preview()
-        except Exception as e:
-            self.live_url = None
-            self.nv_log_handler.error("Failed to start the live preview on %s"
-                                      "Exception :%s", self.cam_name, e)
-            return
+            if self.const_stream_len_sec <= 0:
+                self.nv_log_handler.error("stream length in seconds is not "
+                                          "valid, cannot supervise the live "
+                                          "view")
+                return
+            # Publish the live url once its ready to play.
+            self.update_livestream_in_DB(new_liveUrl = self.live_url)
+            await self.supervise_live_preview()
+        finally:
+            # Stopped by thread manager or failed.
+            self.stop_live_preview__()
 
-        # Live preview may disturbed by external connectivity issues. There is
-        # no way liveview thread can detect those issues. Once the connection
-        # is lost liveview thread becomes rogue and it cannot reconnect again
-        # when camera become live.
-        # As a fix liveview thread teardown connection when connection lost.
-        # This allows the live view is not disturbed by connectivity issues
-        if self.const_stream_len_sec <= 0:
-            self.nv_log_handler.error("stream length in seconds is not valid,"
-                                      " cannot run the live view thread")
-            try:
-                self.stop_live_preview__()
-            except:
-                self.nv_log_handler.error("Failed to stop streaming for %s"
-                                          "when the stream timeout is invalid",
-                                          self.cam_name)
-            finally:
-                self.live_url = None
-            return
-        timeout = 0
+    async def supervise_live_preview(self):
+        '''
+        Live preview may disturbed by external connectivity issues. There is
+        no way the live preview process can detect those issues, it cannot
+        reconnect when the camera become live again. As a fix the live preview
+        is restarted when the camera is reachable again after a connection
+        loss.
+        '''
         cam_conn_ok = True
-        new_liveUrl = None
-        self.update_livestream_in_DB(new_liveUrl = self.live_url)
-        while not stop_event.is_set():
-            sleep(0.25) # 25 milliseconds to check the connections
-            if timeout:
+        while True:
+            if cam_conn_ok:
+                await asyncio.sleep(NV_CAM_LIVE_CHECK_INTERVAL)
+            else:
                 # Camera disconnected and wait for reconnect mode
-                timeout -= 1
-                continue
+                await asyncio.sleep(self.const_stream_len_sec)
             try:
                 # Validate the camera reachability.
-                if not self.is_camera_reachable():
-                    timeout = self.const_live_stream_timeout
+                if not await self.is_camera_reachable():
                     cam_conn_ok = False
                     continue
                 # Vlc lib is not very stable to process the streaming for long
@@ -252,48 +472,47 @@ class nv_cam_liveview():
                 if self.stream_state_changed() or not cam_conn_ok:
                     # Have camera connectivity, but connection lost before. so
                     # reconnect
-                    new_liveUrl = self.restart_live_stream()
+                    self.restart_live_stream()
                     cam_conn_ok = True
-                    self.live_url = new_liveUrl
-                    self.update_livestream_in_DB(new_liveUrl = new_liveUrl)
             except Exception as e:
                 self.nv_log_handler.error("%s error in restarting the live", e)
-                self.stop_live_preview__()
-
-        # stop the thread as the live view is stopped by thread manager.
-        self.stop_live_preview__()
+                return
 
     def start_live_preview(self):
         '''
-        Start the camera live view thread
+        Start the camera live view in the process supervisor
         '''
-        if self.live_cam_thread:
-            self.nv_log_handler.error("Cannot start live-view thread, "
-                                        "its already exists")
+        if self.live_task:
+            self.nv_log_handler.error("Cannot start live-view, its already "
+                                      "exists")
             return
-        self.live_cam_thread = Thread(name=self.cam_name + str(self.cam_id) +
-                                      "-live",
-                              target=self.start_live_preview__,
-                              args = (self.cam_live_stop_event,))
-        self.live_cam_thread.daemon = True
-        self.live_cam_thread.start()
+        self.live_task = GBL_PROC_SUPERVISOR.run_task(
+                                                self.start_live_preview__())
 
     def stop_live_preview(self):
         '''
-        External function to stop the live view thread
+        External function to stop the live view, doesnt wait for the live
+        preview process to exit.
         '''
-        self.cam_live_stop_event.set()
+        if self.live_task is not None:
+            self.live_task.cancel()
 
     def stop_live_preview__(self):
         '''
         Stop the live preview of the camera.(Class internal function)
+        The process is stopped in background.
         '''
         if not self.live_thread_cmd or not self.live_url:
             self.nv_log_handler.info("live stream thread is not running for %s",
                                      self.cam_name)
             return
         try:
-            self.os_context.kill_process(self.live_thread_cmd)
+            if self.live_mode == 'transcode' and \
+                NV_CAM_LIVE_ENGINE == 'libvlc':
+                # libvlc blocks on stop, stop in the libvlc engine thread.
+                GBL_LIBVLC_ENGINE.post_event(self.live_thread_cmd.stop)
+            else:
+                self.stop_live_proc()
             self.live_url = None
             self.live_thread_cmd = None
         except Exception as e:
@@ -301,14 +520,20 @@ class nv_cam_liveview():
                                       self.cam_name)
             raise e
 
+    def is_live_running(self):
+        '''
+        Check if the live view task is running, it is done once the live
+        preview is stopped or failed to start.
+        '''
+        return self.live_task is not None and not self.live_task.done()
+
     def join_live_preview(self, timeout=2):
         '''
-        Join wait call for the live view thread, Must called to make sure the
-        thread is stopped successfully
-        @param timeout: timeout to exit the join call. 
+        Wait for the live view task to finish after stop.
+        @param timeout: timeout to exit the join call.
         '''
-        if self.live_cam_thread is not None and self.live_cam_thread.isAlive():
-            self.live_cam_thread.join(timeout=timeout)
+        if self.live_task is not None:
+            concurrent.futures.wait([self.live_task], timeout = timeout)
 
     def get_live_preview_url(self):
         '''
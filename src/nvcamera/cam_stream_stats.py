@@ -0,0 +1,121 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The camera stream statistics module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import re
+import time
+from src.nv_logger import nv_logger
+from src.nv_logger_rl import nv_logger_rl
+from src.settings import NV_PROC_STDERR_LOG_INTERVAL
+
+# ffmpeg arguments to report the progress on stderr as 'key=value' lines.
+FFMPEG_PROGRESS_ARGS = ["-nostats", "-progress", "pipe:2"]
+
+class cam_stream_stats():
+    '''
+    Statistics of a camera stream, parsed from the stderr of the ffmpeg/cvlc
+    process that handles the stream. ffmpeg reports the progress as
+    'key=value' lines with FFMPEG_PROGRESS_ARGS. Any other line is a warning or
+    an error, they are counted and logged with rate limit.
+    The counters are kept across the restarts of the process.
+    '''
+    RE_PROGRESS = re.compile(r'^(\w+)=\s*(\S*)\s*$')
+    RE_BITRATE = re.compile(r'^([\d.]+)kbits/s$')
+    RE_RTP_MISSED = re.compile(r'RTP: missed (\d+) packets')
+    RE_FRAME_DROP = re.compile(r'picture is too late to be displayed|'
+                               r'dropping (?:frame|picture)|'
+                               r'frame dropped', re.IGNORECASE)
+    RE_RECONNECT = re.compile(r'reconnect|connection (?:reset|timed out|'
+                              r'refused)|no data received', re.IGNORECASE)
+
+    def __init__(self, name):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.nv_log_handler_rl = nv_logger_rl(nv_log_obj = self.nv_log_handler,
+                                              timeout =
+                                              NV_PROC_STDERR_LOG_INTERVAL)
+        self.name = name
+        self.bitrate_kbps = 0.0
+        self.fps = 0.0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.dup_frames = 0
+        self.missed_packets = 0
+        self.reconnects = 0
+        self.messages = 0
+        self.proc_starts = 0
+        self.last_update = None
+        # Counters reported by the current process run. ffmpeg reports the
+        # totals of its own run, added to the counters on the next run.
+        self.run_frames = 0
+        self.run_dropped_frames = 0
+        self.run_dup_frames = 0
+
+    def proc_started(self):
+        '''
+        A new run of the process is started.
+        '''
+        self.frames += self.run_frames
+        self.dropped_frames += self.run_dropped_frames
+        self.dup_frames += self.run_dup_frames
+        self.run_frames = 0
+        self.run_dropped_frames = 0
+        self.run_dup_frames = 0
+        self.bitrate_kbps = 0.0
+        self.fps = 0.0
+        self.proc_starts += 1
+        if self.proc_starts > 1:
+            # Every restart reconnects to the camera.
+            self.reconnects += 1
+
+    def parse_progress(self, key, value):
+        try:
+            if key == "frame":
+                self.run_frames = int(value)
+            elif key == "fps":
+                self.fps = float(value)
+            elif key == "bitrate":
+                bitrate = self.RE_BITRATE.match(value)
+                self.bitrate_kbps = float(bitrate.group(1)) if bitrate else 0.0
+            elif key == "drop_frames":
+                self.run_dropped_frames = int(value)
+            elif key == "dup_frames":
+                self.run_dup_frames = int(value)
+            elif key == "progress":
+                self.last_update = time.time()
+        except ValueError:
+            # 'N/A' before the first frame.
+            pass
+
+    def parse_line(self, line):
+        progress = self.RE_PROGRESS.match(line)
+        if progress:
+            self.parse_progress(progress.group(1), progress.group(2))
+            return
+        self.messages += 1
+        missed = self.RE_RTP_MISSED.search(line)
+        if missed:
+            self.missed_packets += int(missed.group(1))
+        elif self.RE_FRAME_DROP.search(line):
+            self.dropped_frames += 1
+        elif self.RE_RECONNECT.search(line):
+            self.reconnects += 1
+        self.nv_log_handler_rl.info_rl("%s : %s", self.name, line.strip())
+
+    def get_stats(self):
+        return {
+                "bitrate_kbps" : self.bitrate_kbps,
+                "fps" : self.fps,
+                "frames" : self.frames + self.run_frames,
+                "dropped_frames" : self.dropped_frames +
+                                   self.run_dropped_frames,
+                "dup_frames" : self.dup_frames + self.run_dup_frames,
+                "missed_packets" : self.missed_packets,
+                "reconnects" : self.reconnects,
+                "messages" : self.messages,
+                "last_update" : self.last_update
+                }
@@ -0,0 +1,437 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The process supervisor module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import asyncio
+import time
+import sys
+import os
+from threading import Thread
+from threading import Event
+from threading import Lock
+from src.nv_logger import nv_logger
+from src.nv_lib.nv_os_lib import nv_os_lib
+from src.settings import NV_CAM_RECORD_RESTART_DELAY
+from src.settings import NV_PROC_RESTART_BACKOFF_MAX
+from src.settings import NV_PROC_HEALTHY_RUN_SEC
+from src.settings import NV_PROC_STOP_TIMEOUT
+from src.settings import NV_CAM_INGEST_CHUNK_SIZE
+from src.settings import NV_CAM_INGEST_CONSUMER_BUF_SIZE
+from src.settings import NV_PROC_STDERR_CHUNK_SIZE
+
+class enum_procState():
+    CONST_PROC_INIT = 0
+    CONST_PROC_STARTING = 1
+    CONST_PROC_RUNNING = 2
+    CONST_PROC_BACKOFF = 3
+    CONST_PROC_STOPPING = 4
+    CONST_PROC_STOPPED = 5
+
+class nv_supervised_proc():
+    '''
+    A child process run by the process supervisor. The callbacks are called in
+    the supervisor event loop, they must not block.
+    @param name : Unique name of the process.
+    @param cmd : The program to run.
+    @param args : List of arguments, or a function that returns the list. The
+                  function is called on every start of the process.
+    @param stdin_pipe : Open a pipe to write into stdin of the process.
+    @param on_stdout : Called as on_stdout(data) for every chunk of the process
+                       stdout. The stdout is discarded when its None.
+    @param on_start : Called as on_start(sproc) on every start of the process.
+    @param on_exit : Called as on_exit(sproc, exit_code) on every exit.
+    @param on_stop : Called as on_stop(sproc) when the process is stopped for
+                     good, no more restarts.
+    @param restart : Restart the process when it exits by itself.
+    @param restart_delay : Delay before restarting a healthy process.
+    @param stats : A 'cam_stream_stats' to parse the process stderr into. The
+                   stderr is discarded when its None.
+    @param env : Environment variables to set for the process, for eg:
+                 {'TZ' : 'UTC'}
+    '''
+    def __init__(self, name, cmd, args, stdin_pipe = False, on_stdout = None,
+                 on_start = None, on_exit = None, on_stop = None,
+                 restart = True, restart_delay = NV_CAM_RECORD_RESTART_DELAY,
+                 stats = None, env = None):
+        self.name = name
+        self.cmd = cmd
+        self.args = args
+        self.stdin_pipe = stdin_pipe
+        self.on_stdout = on_stdout
+        self.on_start = on_start
+        self.on_exit = on_exit
+        self.on_stop = on_stop
+        self.restart = restart
+        self.restart_delay = restart_delay
+        self.stats = stats
+        self.env = env
+        # Process state, owned by the supervisor event loop.
+        self.state = enum_procState.CONST_PROC_INIT
+        self.proc = None
+        self.pid = None
+        self.start_cnt = 0
+        self.start_time = None
+        self.exit_code = None
+        self.backoff = 0
+        self.stop_requested = False
+        self.restart_requested = False
+        self.stop_kill = False
+        self.stop_close_stdin = False
+        self.stdin_drop_bytes = 0
+        self.wakeup = None
+        self.task = None
+        self.stopped_event = Event()
+
+    def is_running(self):
+        return self.state == enum_procState.CONST_PROC_RUNNING
+
+    def is_stopped(self):
+        return self.stopped_event.is_set()
+
+    def get_state(self):
+        return {
+                "name" : self.name,
+                "state" : self.state,
+                "pid" : self.pid,
+                "start_cnt" : self.start_cnt,
+                "exit_code" : self.exit_code,
+                "uptime" : time.monotonic() - self.start_time
+                           if self.is_running() else 0,
+                "backoff" : self.backoff,
+                "stdin_drop_bytes" : self.stdin_drop_bytes,
+                "stats" : self.stats.get_stats() if self.stats else None
+                }
+
+class nv_proc_supervisor():
+    '''
+    Run all the child processes of the middlebox in one asyncio event loop
+    thread. The supervisor restarts the processes with backoff, and its the
+    only place to start, stop and kill them.
+    XXX :: DO NOT CREATE OBJECTS FOR THIS CLASS, USE 'GBL_PROC_SUPERVISOR'.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.os_context = nv_os_lib()
+        self.loop = None
+        self.loop_thread = None
+        self.procs = {}
+        self.supervisor_lock = Lock()
+
+    def get_loop(self):
+        '''
+        Returns the supervisor event loop, start it on first use.
+        '''
+        with self.supervisor_lock:
+            if self.loop is not None:
+                return self.loop
+            self.loop = asyncio.new_event_loop()
+            self.set_child_watcher()
+            self.loop_thread = Thread(name = "nv_proc_supervisor",
+                                      target = self.run_loop)
+            self.loop_thread.daemon = True
+            self.loop_thread.start()
+            self.nv_log_handler.info("Started the process supervisor")
+        return self.loop
+
+    def set_child_watcher(self):
+        '''
+        asyncio before python 3.12 waits on every child process in a thread of
+        its own. Wait on the process fd in the event loop instead, when the
+        kernel supports it.
+        '''
+        if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+            return
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        except Exception as e:
+            self.nv_log_handler.info("Cannot use pidfd to wait on the child "
+                                     "processes, %s", e)
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.nv_log_handler.info("Exiting the process supervisor")
+
+    def run_callback(self, sproc, fn, *args):
+        if fn is None:
+            return
+        try:
+            fn(*args)
+        except Exception as e:
+            self.nv_log_handler.error("Exception in callback of process %s, "
+                                      "%s", sproc.name, e)
+
+    def start_proc(self, sproc):
+        '''
+        Start a supervised process, can be called from any thread.
+        '''
+        with self.supervisor_lock:
+            old_sproc = self.procs.get(sproc.name)
+            if old_sproc is not None and not old_sproc.is_stopped():
+                self.nv_log_handler.error("Process %s is already running, "
+                                          "cannot start again", sproc.name)
+                return False
+            self.procs[sproc.name] = sproc
+        self.get_loop().call_soon_threadsafe(self.spawn_proc_task, sproc)
+        return True
+
+    def spawn_proc_task(self, sproc):
+        sproc.wakeup = asyncio.Event()
+        sproc.task = asyncio.ensure_future(self.run_proc(sproc))
+
+    async def read_proc_stdout(self, sproc, proc):
+        while True:
+            data = await proc.stdout.read(NV_CAM_INGEST_CHUNK_SIZE)
+            if not data:
+                break
+            self.run_callback(sproc, sproc.on_stdout, data)
+
+    async def read_proc_stderr(self, sproc, proc):
+        '''
+        Read the process stderr as it comes and hand over every line to the
+        stream stats. The progress lines are ended by '\r' and the rest by '\n'.
+        '''
+        pending = b''
+        while True:
+            data = await proc.stderr.read(NV_PROC_STDERR_CHUNK_SIZE)
+            if not data:
+                break
+            lines = (pending + data).replace(b'\r', b'\n').split(b'\n')
+            pending = lines.pop()
+            if len(pending) > NV_PROC_STDERR_CHUNK_SIZE:
+                # Never ending line, take it as it is.
+                lines.append(pending)
+                pending = b''
+            for line in lines:
+                if line:
+                    self.run_callback(sproc, sproc.stats.parse_line,
+                                      line.decode(errors = "replace"))
+        if pending:
+            self.run_callback(sproc, sproc.stats.parse_line,
+                              pending.decode(errors = "replace"))
+
+    def get_restart_delay(self, sproc, run_time):
+        if run_time >= NV_PROC_HEALTHY_RUN_SEC:
+            sproc.backoff = 0
+            return sproc.restart_delay
+        sproc.backoff = min(max(sproc.backoff * 2, NV_CAM_RECORD_RESTART_DELAY),
+                            NV_PROC_RESTART_BACKOFF_MAX)
+        return max(sproc.restart_delay, sproc.backoff)
+
+    async def run_proc(self, sproc):
+        while not sproc.stop_requested:
+            sproc.state = enum_procState.CONST_PROC_STARTING
+            start_time = time.monotonic()
+            try:
+                args = sproc.args() if callable(sproc.args) else sproc.args
+                proc = await self.os_context.execute_cmd_async(sproc.cmd, args,
+                                    stdin_pipe = sproc.stdin_pipe,
+                                    stdout_pipe = sproc.on_stdout is not None,
+                                    stderr_pipe = sproc.stats is not None,
+                                    env = sproc.env)
+                sproc.proc = proc
+                sproc.pid = proc.pid
+                sproc.start_cnt += 1
+                sproc.start_time = start_time
+                sproc.state = enum_procState.CONST_PROC_RUNNING
+                if sproc.stop_requested:
+                    # Stop issued while the process is getting started.
+                    self.signal_stop(sproc, proc)
+                if sproc.stats is not None:
+                    sproc.stats.proc_started()
+                self.run_callback(sproc, sproc.on_start, sproc)
+                readers = []
+                if sproc.on_stdout is not None:
+                    readers.append(self.read_proc_stdout(sproc, proc))
+                if sproc.stats is not None:
+                    readers.append(self.read_proc_stderr(sproc, proc))
+                if readers:
+                    await asyncio.gather(*readers)
+                sproc.exit_code = await proc.wait()
+                sproc.proc = None
+                self.run_callback(sproc, sproc.on_exit, sproc, sproc.exit_code)
+            except Exception as e:
+                self.nv_log_handler.error("Failed to run the process %s, %s",
+                                          sproc.name, e)
+                sproc.proc = None
+            if sproc.stop_requested or not sproc.restart:
+                break
+            delay = self.get_restart_delay(sproc,
+                                           time.monotonic() - start_time)
+            if sproc.restart_requested:
+                sproc.restart_requested = False
+                delay = 0
+            sproc.state = enum_procState.CONST_PROC_BACKOFF
+            if delay:
+                self.nv_log_handler.info("Process %s exited with %s, restarting"
+                                         " in %d sec", sproc.name,
+                                         sproc.exit_code, delay)
+                try:
+                    await asyncio.wait_for(sproc.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        sproc.state = enum_procState.CONST_PROC_STOPPED
+        with self.supervisor_lock:
+            if self.procs.get(sproc.name) is sproc:
+                del self.procs[sproc.name]
+        self.run_callback(sproc, sproc.on_stop, sproc)
+        sproc.stopped_event.set()
+        self.nv_log_handler.debug("Stopped the process %s", sproc.name)
+
+    def signal_proc(self, sproc, kill):
+        proc = sproc.proc
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            if kill:
+                proc.kill()
+            else:
+                proc.terminate()
+        except ProcessLookupError:
+            pass
+
+    def kill_if_running(self, sproc, proc):
+        if sproc.proc is proc and proc.returncode is None:
+            self.nv_log_handler.info("Process %s is not exited in %d sec, "
+                                     "killing it", sproc.name,
+                                     NV_PROC_STOP_TIMEOUT)
+            self.signal_proc(sproc, kill = True)
+
+    def signal_stop(self, sproc, proc):
+        '''
+        Ask the process to exit, it is killed if not exited in
+        NV_PROC_STOP_TIMEOUT.
+        '''
+        sproc.state = enum_procState.CONST_PROC_STOPPING
+        if sproc.stop_kill:
+            self.signal_proc(sproc, kill = True)
+            return
+        if sproc.stop_close_stdin and proc.stdin is not None:
+            # EOF on stdin lets the process to finalize its output and exit.
+            proc.stdin.close()
+        else:
+            self.signal_proc(sproc, kill = False)
+        self.loop.call_later(NV_PROC_STOP_TIMEOUT, self.kill_if_running,
+                             sproc, proc)
+
+    def stop_proc_in_loop(self, sproc, kill, close_stdin):
+        sproc.stop_requested = True
+        sproc.stop_kill = sproc.stop_kill or kill
+        sproc.stop_close_stdin = close_stdin
+        if sproc.task is None:
+            # Never started.
+            sproc.state = enum_procState.CONST_PROC_STOPPED
+            sproc.stopped_event.set()
+            return
+        sproc.wakeup.set()
+        proc = sproc.proc
+        if proc is None or proc.returncode is not None:
+            # Not spawned yet, signalled by 'run_proc' once its spawned.
+            return
+        self.signal_stop(sproc, proc)
+
+    def stop_proc(self, sproc, close_stdin = False):
+        '''
+        Stop a supervised process gracefully, it is killed if not exited in
+        NV_PROC_STOP_TIMEOUT. Doesnt wait for the process to exit.
+        @param close_stdin : Close the stdin of process instead of terminating,
+                             for a process that exits on EOF.
+        '''
+        if sproc is None or self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.stop_proc_in_loop, sproc, False,
+                                       close_stdin)
+
+    def kill_proc(self, sproc):
+        '''
+        Kill a supervised process, it is not restarted.
+        '''
+        if sproc is None or self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.stop_proc_in_loop, sproc, True,
+                                       False)
+
+    def restart_proc_in_loop(self, sproc):
+        proc = sproc.proc
+        if sproc.stop_requested or proc is None or proc.returncode is not None:
+            return
+        sproc.restart_requested = True
+        self.signal_proc(sproc, kill = False)
+        self.loop.call_later(NV_PROC_STOP_TIMEOUT, self.kill_if_running,
+                             sproc, proc)
+
+    def restart_proc(self, sproc):
+        '''
+        Restart a running supervised process without any delay, it is killed
+        if not exited in NV_PROC_STOP_TIMEOUT.
+        '''
+        if sproc is None or self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.restart_proc_in_loop, sproc)
+
+    def run_task(self, coro):
+        '''
+        Run a coroutine in the supervisor event loop, can be called from any
+        thread. The coroutine must not block the event loop.
+        @return: concurrent.futures.Future of the coroutine, cancel it to stop
+                 the coroutine.
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def wait_proc(self, sproc, timeout = None):
+        '''
+        Wait for a supervised process to stop for good.
+        @return: True if the process is stopped, False on timeout.
+        '''
+        if sproc is None:
+            return True
+        return sproc.stopped_event.wait(timeout)
+
+    def write_stdin(self, sproc, data):
+        '''
+        Write data into the stdin of a supervised process, must be called in the
+        supervisor event loop. The data is dropped when the process is not
+        consuming it fast enough.
+        @return: True if the data is written, False if its dropped.
+        '''
+        proc = sproc.proc
+        if proc is None or proc.stdin is None or proc.stdin.is_closing():
+            return False
+        if proc.stdin.transport.get_write_buffer_size() + len(data) >\
+                NV_CAM_INGEST_CONSUMER_BUF_SIZE:
+            sproc.stdin_drop_bytes += len(data)
+            return False
+        try:
+            proc.stdin.write(data)
+        except Exception:
+            return False
+        return True
+
+    def get_proc_states(self):
+        with self.supervisor_lock:
+            return [sproc.get_state() for sproc in self.procs.values()]
+
+    def stop_supervisor(self, timeout = NV_PROC_STOP_TIMEOUT):
+        '''
+        Stop all the supervised processes and the event loop.
+        '''
+        if self.loop is None:
+            return
+        with self.supervisor_lock:
+            sprocs = list(self.procs.values())
+        for sproc in sprocs:
+            self.stop_proc(sproc)
+        for sproc in sprocs:
+            self.wait_proc(sproc, timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout)
+
+GBL_PROC_SUPERVISOR = nv_proc_supervisor()
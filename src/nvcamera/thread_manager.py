@@ -10,7 +10,9 @@ __version__ = "1.0"
 from src.nvcamera.cam_handler import cam_handler
 from src.nv_logger import nv_logger
 from src.nvcamera.cam_liveview import nv_cam_liveview
-from time import sleep
+from src.nvcamera.cam_ingest import cam_ingest
+from src.nvcamera.cam_supervisor import GBL_PROC_SUPERVISOR
+from src.settings import NV_CAM_SHARED_INGEST
 '''
 Camera handler thread dictionary. the format for the dictionary should be
 { cam_id : cam_handler obj }
@@ -24,9 +26,10 @@ camera threads before exiting the application
 
 class thread_manager():
     '''
-    Handle threads of each camera. A thread is created for every camera handler
-    operation. Only one instance of thread manager should be present in the
-    middle box application.
+    Handle threads of each camera. The camera recording, ingest and live preview
+    processes are run by the process supervisor, thread manager is the API to
+    start/stop/kill them. Only one instance of thread manager should be present
+    in the middle box application.
     '''
     def __init__(self):
         # Initialize the thread manager
@@ -38,6 +41,56 @@ class thread_manager():
         self.cam_live_threads = {}
         # camera live threads for join
         self.join_cam_live_threads = {}
+        # Shared camera ingest dictionary, { cam_id : cam_ingest obj }
+        self.cam_ingest_dic = {}
+
+    def get_cam_ingest(self, cam_table_entry):
+        '''
+        Returns the shared ingest of the camera, None when the cameras are not
+        configured to share the ingest.
+        '''
+        if not NV_CAM_SHARED_INGEST:
+            return None
+        cam_id = cam_table_entry.cam_id
+        ingest = self.cam_ingest_dic.get(cam_id)
+        if ingest is None:
+            ingest = cam_ingest(cam_table_entry)
+            self.cam_ingest_dic[cam_id] = ingest
+        return ingest
+
+    def stop_all_cam_ingest(self):
+        for _, ingest in self.cam_ingest_dic.items():
+            ingest.stop_all()
+
+    def stop_proc_supervisor(self):
+        '''
+        Stop all the remaining processes and the process supervisor. Must be
+        called after stopping all the camera and live threads.
+        '''
+        GBL_PROC_SUPERVISOR.stop_supervisor()
+
+    def get_cam_stream_stats(self, cam_id):
+        '''
+        Returns the stream statistics of the camera ingest, recording and
+        live preview.
+        '''
+        stats = {}
+        ingest = self.cam_ingest_dic.get(cam_id)
+        if ingest is not None:
+            stats["ingest"] = ingest.stream_stats.get_stats()
+        cam_obj = self.cam_thread_dic.get(cam_id)
+        if cam_obj:
+            stats["record"] = cam_obj.get_stream_stats()
+        live_obj = self.cam_live_threads.get(cam_id)
+        if live_obj:
+            stats["live"] = live_obj.get_live_stats()
+        return stats
+
+    def get_proc_states(self):
+        '''
+        Returns the state of all the running camera processes.
+        '''
+        return GBL_PROC_SUPERVISOR.get_proc_states()
 
     def start_camera_thread(self,cam_table_entry):
         # Create a thread for camera stream handling if not exists
@@ -48,7 +101,8 @@ class thread_manager():
             self.nv_log_handler.error("A thread is already exists for the"
                                       "camera with id %d" % cam_id)
             return
-        cam_obj = cam_handler(cam_table_entry)
+        cam_obj = cam_handler(cam_table_entry,
+                              ingest = self.get_cam_ingest(cam_table_entry))
         self.cam_thread_dic[cam_id] = cam_obj
         cam_obj.start_camera_thread()
         self.nv_log_handler.debug("camera thread is created for %d", cam_id)
@@ -147,6 +201,11 @@ class thread_manager():
             self.nv_log_handler.error("Failed to join the camera threads.")
 
     def start_cam_live(self, cam_tbl_entry):
+        '''
+        Start the live preview of the camera, doesnt wait for the live preview
+        to be ready. The live url is updated in the camera registry by the live
+        preview once its ready to play.
+        '''
         if not cam_tbl_entry:
             self.nv_log_handler.debug("Empty table entry, cannot start live")
             return
@@ -155,23 +214,31 @@ class thread_manager():
             self.nv_log_handler.info("Invalid camera ID, Cannot start live "
                                      "streaming")
             return
-        if self.cam_live_threads.get(cam_id):
+        live_obj = self.cam_live_threads.get(cam_id)
+        if live_obj and live_obj.is_live_running():
             self.nv_log_handler.error("Cannot start live streaming, "
                                       "some other live streaming obj exists")
             return
-        live_obj = nv_cam_liveview(cam_tbl_entry = cam_tbl_entry)
+        live_obj = nv_cam_liveview(cam_tbl_entry = cam_tbl_entry,
+                                   ingest = self.get_cam_ingest(cam_tbl_entry))
         try:
             self.nv_log_handler.debug("starting the live on %s", cam_tbl_entry.name)
             live_obj.start_live_preview()
             self.nv_log_handler.info("Live-url is getting ready.... ")
-            sleep(2) # Make sure the live url is populated in the live thread.
-            url = live_obj.get_live_preview_url()
             self.cam_live_threads[cam_id] = live_obj
-            return url
         except Exception as e:
             self.nv_log_handler.error("Failed to start live streaming on %s",
                                       " exception : %s", cam_tbl_entry.name, e)
+
+    def get_cam_live_url(self, cam_id):
+        '''
+        Returns the live url of the running live preview of the camera, None
+        if the live preview is not running or not ready yet.
+        '''
+        live_obj = self.cam_live_threads.get(cam_id)
+        if not live_obj:
             return None
+        return live_obj.get_live_preview_url()
 
     def stop_cam_live(self, cam_id):
         if not cam_id:
@@ -47,7 +47,11 @@ import sys
 import functools
 
 # Used by EventManager in override.py
-from inspect import getargspec
+try:
+    from inspect import getargspec
+except ImportError:
+    # getargspec is removed in python 3.11
+    from inspect import getfullargspec as getargspec
 
 __version__ = "N/A"
 build_date  = "Fri Apr 15 16:45:33 2016"
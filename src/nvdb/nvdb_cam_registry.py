@@ -0,0 +1,236 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The in-memory camera registry for nv-middlebox.
+#
+
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import copy
+import socket
+import struct
+from threading import Lock
+from src.nv_logger import nv_logger
+from src.nvdb.nvdb_manager import db_mgr_obj, nv_camera
+
+class nv_cam_entry():
+    '''
+    A read only copy of a camera record in the nv_camera table. The entry is
+    never changed once its in the registry, a new entry is created on every
+    update. The 'version' is the registry version the entry is updated at.
+    '''
+    CAM_FIELDS = ("cam_id", "name", "status", "desc", "ip_addr", "mac_addr",
+                  "listen_port", "username", "password", "live_url",
+                  "stream_file_time_sec", "nv_midbox_id")
+
+    def __init__(self, cam_record, version):
+        for field in self.CAM_FIELDS:
+            setattr(self, field, getattr(cam_record, field))
+        self.version = version
+
+    def get_updated_entry(self, version, cam_fields):
+        '''
+        Returns a new entry with the 'cam_fields' changed,
+        for eg: {'status' : enum_camStatus.CONST_CAMERA_READY}
+        '''
+        cam_entry = copy.copy(self)
+        for field, value in cam_fields.items():
+            setattr(cam_entry, field, value)
+        cam_entry.version = version
+        return cam_entry
+
+    def __repr__(self):
+        return "<nv_camera(cam_id=%d name='%s', ip_addr='%s', mac_addr='%s',"\
+                " listen_port=%d, username=%s, password='%s', "\
+                "stream_file_time_sec=%d,"\
+                "nv_midbox_id=%d, status = %d,"\
+                " desc = '%s' ,live_url = '%s')>\n" % (self.cam_id, self.name, \
+                socket.inet_ntoa(struct.pack('!L', self.ip_addr)), \
+                self.mac_addr, self.listen_port, \
+                self.username, self.password, \
+                self.stream_file_time_sec, \
+                self.nv_midbox_id, \
+                self.status, self.desc, self.live_url)
+
+class nv_cam_registry():
+    '''
+    The in-memory copy of all the cameras, the camera records are read from
+    here and never from the DB. Every change is updated in registry right
+    away and submitted to the DB group commit in the same order. A camera is
+    reloaded from DB when its change failed to commit. A new camera is added
+    to registry only after its committed.
+    The readers doesnt take any lock, the camera maps are replaced as a whole
+    on every change. The writers must not hold the DB transaction lock, the
+    group commit thread needs it to commit the changes.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        # The cameras by id and name,
+        # ({ cam_id : nv_cam_entry_obj }, { 'camera1' : nv_cam_entry_obj })
+        self.cam_maps = ({}, {})
+        # Incremented on every change to the cameras.
+        self.version = 0
+        self.registry_lock = Lock()
+
+    def publish_cameras(self, cam_entries, del_cam_ids = ()):
+        '''
+        Replace the camera maps with the new/updated 'cam_entries' and
+        without the 'del_cam_ids'.
+        '''
+        cam_id_dic = dict(self.cam_maps[0])
+        for cam_id in del_cam_ids:
+            cam_id_dic.pop(cam_id, None)
+        for cam_entry in cam_entries:
+            cam_id_dic[cam_entry.cam_id] = cam_entry
+        self.cam_maps = (cam_id_dic,
+                         {cam_entry.name : cam_entry
+                          for cam_entry in cam_id_dic.values()})
+
+    def load_cameras(self):
+        '''
+        Read all the cameras from DB, at the middlebox start.
+        '''
+        with self.registry_lock:
+            self.version += 1
+            self.cam_maps = ({}, {})
+            self.publish_cameras([nv_cam_entry(cam_record, self.version)
+                for cam_record in db_mgr_obj.get_tbl_records(nv_camera)])
+        self.nv_log_handler.info("Loaded %d cameras to camera registry",
+                                 len(self.cam_maps[0]))
+
+    def reload_cameras(self, cam_versions):
+        '''
+        Read the cameras from DB again after a failed commit. A camera changed
+        again after the failed change is left as is.
+        cam_versions : { cam_id : version of the failed change }
+        '''
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            cam_records = {cam_id : db_mgr_obj.get_tbl_records_filterby_first(
+                                        nv_camera, {'cam_id' : cam_id})
+                           for cam_id in cam_versions}
+            with self.registry_lock:
+                self.version += 1
+                cam_entries = []
+                del_cam_ids = []
+                for cam_id, cam_record in cam_records.items():
+                    cam_entry = self.get_camera_by_id(cam_id)
+                    if cam_entry is not None and \
+                        cam_entry.version != cam_versions[cam_id]:
+                        continue
+                    if cam_record is None:
+                        del_cam_ids.append(cam_id)
+                    else:
+                        cam_entries.append(nv_cam_entry(cam_record,
+                                                        self.version))
+                self.publish_cameras(cam_entries, del_cam_ids)
+        except Exception as e:
+            self.nv_log_handler.error("Failed to reload the cameras, %s", e)
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+
+    def cam_write_done(self, write_error, cam_versions):
+        if write_error is None:
+            return
+        self.nv_log_handler.error("Failed to write the camera changes, "
+                                  "reloading the cameras from DB")
+        self.reload_cameras(cam_versions)
+
+    def get_version(self):
+        return self.version
+
+    def get_camera(self, name):
+        return self.cam_maps[1].get(name)
+
+    def get_camera_by_id(self, cam_id):
+        return self.cam_maps[0].get(cam_id)
+
+    def get_cameras(self):
+        return list(self.cam_maps[0].values())
+
+    def add_camera(self, cam_record):
+        '''
+        Add the new nv_camera record to DB and registry, returns after its
+        committed. The record must set the nv_midbox_id and not the nv_midbox,
+        the system record is in the session of another thread.
+        '''
+        def add_cam_done(write_error):
+            if write_error is not None:
+                self.nv_log_handler.error("Failed to add the camera %s",
+                                          cam_record.name)
+                return
+            with self.registry_lock:
+                self.version += 1
+                self.publish_cameras([nv_cam_entry(cam_record, self.version)])
+
+        if self.get_camera(cam_record.name) is not None:
+            raise KeyError("Camera %s is already present" % cam_record.name)
+        db_mgr_obj.db_submit_write(lambda : db_mgr_obj.add_record(cam_record),
+                                   add_cam_done)
+        db_mgr_obj.db_flush_writes()
+
+    @staticmethod
+    def write_cam_updates(cam_updates):
+        '''
+        cam_updates : { cam_id : { field : value } }
+        '''
+        for cam_id, cam_fields in cam_updates.items():
+            cam_record = db_mgr_obj.get_tbl_records_filterby_first(
+                                        nv_camera, {'cam_id' : cam_id})
+            if cam_record is None:
+                raise KeyError("No camera record in DB for %d" % cam_id)
+            for field, value in cam_fields.items():
+                setattr(cam_record, field, value)
+
+    def update_cameras(self, cam_updates):
+        '''
+        Update the fields of the cameras, committed together in DB,
+        { 'camera1' : {'status' : enum_camStatus.CONST_CAMERA_READY} }
+        '''
+        with self.registry_lock:
+            cam_entries = []
+            for name, cam_fields in cam_updates.items():
+                cam_entry = self.get_camera(name)
+                if cam_entry is None:
+                    raise KeyError("No camera record found for %s" % name)
+                cam_entries.append(cam_entry.get_updated_entry(
+                                                self.version + 1, cam_fields))
+            if not cam_entries:
+                return
+            self.version += 1
+            self.publish_cameras(cam_entries)
+            cam_id_updates = {cam_entry.cam_id : cam_updates[cam_entry.name]
+                              for cam_entry in cam_entries}
+            cam_versions = {cam_entry.cam_id : self.version
+                            for cam_entry in cam_entries}
+            db_mgr_obj.db_submit_write(
+                    lambda : self.write_cam_updates(cam_id_updates),
+                    lambda write_error : self.cam_write_done(write_error,
+                                                             cam_versions))
+
+    def update_camera(self, name, **cam_fields):
+        self.update_cameras({name : cam_fields})
+
+    @staticmethod
+    def write_cam_delete(cam_id):
+        cam_record = db_mgr_obj.get_tbl_records_filterby_first(
+                                        nv_camera, {'cam_id' : cam_id})
+        if cam_record is not None:
+            db_mgr_obj.delete_record(cam_record)
+
+    def del_camera(self, name):
+        with self.registry_lock:
+            cam_entry = self.get_camera(name)
+            if cam_entry is None:
+                raise KeyError("No camera record found for %s" % name)
+            self.version += 1
+            self.publish_cameras([], del_cam_ids = [cam_entry.cam_id])
+            cam_versions = {cam_entry.cam_id : cam_entry.version}
+            db_mgr_obj.db_submit_write(
+                    lambda : self.write_cam_delete(cam_entry.cam_id),
+                    lambda write_error : self.cam_write_done(write_error,
+                                                             cam_versions))
+
+GBL_CAM_REGISTRY = nv_cam_registry()
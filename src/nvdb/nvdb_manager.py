@@ -12,14 +12,21 @@ __version__ = "1.0"
 import uuid
 import socket
 import struct
-from sqlalchemy import create_engine
+import time
+from collections import deque
+from threading import Lock, Condition, Event, Thread, current_thread
+from sqlalchemy import create_engine, event
 from sqlalchemy import Column, DateTime, String, Integer, ForeignKey
+from sqlalchemy import Float, Index, func, bindparam
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, backref
 from src.settings import NVDB_SQLALCHEMY_DB
 from src.nv_logger import nv_logger
 from src.settings import NV_MID_BOX_APP_NAME
-from sqlalchemy.pool import StaticPool
+from src.settings import NVDB_POOL_SIZE, NVDB_POOL_OVERFLOW
+from src.settings import NVDB_BUSY_TIMEOUT, NVDB_LOCK_WAIT_WARN
+from src.settings import NVDB_GROUP_COMMIT_WINDOW, NVDB_GROUP_COMMIT_MAX_OPS
+from sqlalchemy.pool import StaticPool, QueuePool
 from sqlalchemy.orm.scoping import scoped_session
 from src.nv_lib.nv_sync_lib import GBL_NV_SYNC_OBJ
 
@@ -39,7 +46,9 @@ class nv_midbox_system(db_base):
 
 class nv_webserver_system(db_base):
     '''
-    The table to hold the webserver credentials.
+    The table to hold the webserver credentials. The video files are relayed
+    to all the webservers in the table, for eg: a primary webserver and a
+    backup archive.
     '''
     __tablename__ = 'nv_webserver'
     server_id = Column(Integer, primary_key = True)
@@ -115,6 +124,72 @@ class nv_camera(db_base):
                 self.nv_midbox_id, \
                 self.status, self.desc, self.live_url)
 
+class enum_relayState():
+    '''
+    enum class for the relay state of a video file in the relay journal.
+    '''
+    CONST_RELAY_PENDING = 0 # Waiting to copy.
+    CONST_RELAY_UPLOADING = 1 # Copy in progress.
+    CONST_RELAY_DONE = 2 # Copied to webserver.
+    CONST_RELAY_FAILED = 3 # Copy failed, retried later.
+    # Not a valid video file to copy, for eg: the file size is too small.
+    CONST_RELAY_SKIPPED = 4
+
+    RELAY_STATE_STR = {
+                       CONST_RELAY_PENDING : "PENDING",
+                       CONST_RELAY_UPLOADING : "UPLOADING",
+                       CONST_RELAY_DONE : "DONE",
+                       CONST_RELAY_FAILED : "FAILED",
+                       CONST_RELAY_SKIPPED : "SKIPPED"
+                       }
+
+class nv_relay_journal(db_base):
+    '''
+    The table to track the relay of every video file to every webserver. The
+    files are relayed in the order of 'file_time', the file modified time.
+    '''
+    __tablename__ = 'nv_relay_journal'
+    file_path = Column(String, primary_key = True)
+    server_id = Column(Integer, primary_key = True)
+    cam_name = Column(String, nullable = False)
+    state = Column(Integer, nullable = False) # enum_relayState
+    attempts = Column(Integer, nullable = False, default = 0)
+    file_time = Column(Float, nullable = False)
+    update_time = Column(Float, nullable = False)
+    __table_args__ = (Index('ix_relay_journal_state_time',
+                            'state', 'file_time'),)
+
+    def __repr__(self):
+        return "<nv_relay_journal(file_path = '%s', server_id = %d, "\
+               "cam_name = '%s', state = %s, attempts = %d)>" % \
+               (self.file_path, self.server_id, self.cam_name,
+                enum_relayState.RELAY_STATE_STR[self.state], self.attempts)
+
+class nv_segment(db_base):
+    '''
+    The catalog of the video segments recorded by the cameras, a row per
+    finalized segment file. The times are in seconds since epoch, UTC.
+    '''
+    __tablename__ = 'nv_segment'
+    seg_id = Column(Integer, primary_key = True)
+    file_path = Column(String, nullable = False, unique = True)
+    cam_name = Column(String, nullable = False)
+    start_time = Column(Float, nullable = False)
+    end_time = Column(Float, nullable = False)
+    duration = Column(Float, nullable = False)
+    file_size = Column(Integer, nullable = False)
+    # enum_relayState of the segment for all the webservers.
+    relay_state = Column(Integer, nullable = False,
+                         default = enum_relayState.CONST_RELAY_PENDING)
+    __table_args__ = (Index('ix_segment_cam_start',
+                            'cam_name', 'start_time'),)
+
+    def __repr__(self):
+        return "<nv_segment(file_path = '%s', cam_name = '%s', "\
+               "start_time = %.3f, duration = %.3f, file_size = %d, "\
+               "relay_state = %s)>" % \
+               (self.file_path, self.cam_name, self.start_time, self.duration,
+                self.file_size, enum_relayState.RELAY_STATE_STR[self.relay_state])
 
 class db_manager():
     '''
@@ -122,34 +197,95 @@ class db_manager():
     NOTE :: Isolation is not inherent with db manager implementation. So in 
     multithreaded implementation, its responsibility of caller to take care of
     it.
+    Every thread has its own DB session, the session is closed at the end of
+    every transaction. The DB is in WAL mode, so the readers never wait for
+    the writer. Only the write transactions take the DB transaction lock.
+    The control writes can be submitted to the group commit thread, the
+    writes submitted together are committed in one transaction.
     '''
 
     DB_TRANSACT_LOCK="nvdb_transact_lock"
     def __init__(self):
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
-        self.db_engine = create_engine(NVDB_SQLALCHEMY_DB,
+        if ':memory:' in NVDB_SQLALCHEMY_DB:
+            # Every connection has its own inmemory DB, share one.
+            self.db_engine = create_engine(NVDB_SQLALCHEMY_DB,
                                     connect_args={'check_same_thread': False},
                                     poolclass=StaticPool, echo=False)
-        session_maker = sessionmaker(bind=self.db_engine)
+        else:
+            self.db_engine = create_engine(NVDB_SQLALCHEMY_DB,
+                                    connect_args={'check_same_thread': False,
+                                                  'timeout': NVDB_BUSY_TIMEOUT},
+                                    poolclass=QueuePool,
+                                    pool_size=NVDB_POOL_SIZE,
+                                    max_overflow=NVDB_POOL_OVERFLOW,
+                                    echo=False)
+            event.listen(self.db_engine, "connect", self.setup_db_connection)
+        # The objects are used after the session is closed, dont expire them
+        # on commit.
+        session_maker = sessionmaker(bind=self.db_engine,
+                                     expire_on_commit=False)
         self.Session = scoped_session(session_maker)
-        self.db_session = None
+        self.is_session_ready = False
         db_base.metadata.create_all(self.db_engine)
         self.nv_midbox_db_entry = None
-        self.nv_webserver = None
+        self.nv_webservers = None
+        # DB transaction lock statistics.
+        self.lock_stats = {"write_transactions" : 0,
+                           "read_transactions" : 0,
+                           "lock_wait_total" : 0.0,
+                           "lock_wait_max" : 0.0,
+                           "lock_hold_total" : 0.0,
+                           "lock_hold_max" : 0.0,
+                           "group_commits" : 0,
+                           "group_writes" : 0,
+                           "group_writes_max" : 0}
+        self.lock_time = 0.0
+        self.stats_lock = Lock()
+        # The writes waiting for group commit, in the order submitted,
+        # deque([[write_fn, on_done], ...])
+        self.group_writes = deque()
+        self.group_cond = Condition()
+        self.group_thread = None
+        self.is_group_stopped = False
         self.nv_log_handler.debug("Tables created in nvdb")
 
+    @staticmethod
+    def setup_db_connection(dbapi_conn, conn_record):
+        '''
+        Set the WAL journaling and busy timeout on every new sqlite
+        connection.
+        '''
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=%d" % (NVDB_BUSY_TIMEOUT * 1000))
+        cursor.close()
+
+    @property
+    def db_session(self):
+        '''
+        The DB session of the calling thread, None when the DB is not set up.
+        '''
+        if not self.is_session_ready:
+            return None
+        return self.Session()
+
     def setup_session(self):
-        if self.db_session is None:
+        if not self.is_session_ready:
             self.nv_log_handler.debug("NULL db session, create a new one..")
-            self.db_session = self.Session()
+            self.is_session_ready = True
+            self.start_group_commit()
 
     def teardown_session(self):
-        if self.db_session is None:
+        if not self.is_session_ready:
             self.nv_log_handler.error("Cannot teardown empty session")
             return
+        # The submitted writes are committed before the session is closed.
+        self.stop_group_commit()
         try:
             self.Session.remove()
-            self.db_session = None
+            self.is_session_ready = False
         except Exception as e:
             self.nv_log_handler.error("Failed to teardown DB session %s", e)
 
@@ -158,27 +294,41 @@ class db_manager():
             self.nv_log_handler.error("Can't create webserver record, "
                                       "DB session is not initialized")
             return
-        if self.get_webserver_record() is not None:
-            self.nv_log_handler.error("Cannot create multiple webserver for"
-                                    "same machine")
-            return
-        self.nv_webserver = webserver_db_entry
-        self.nv_log_handler.info("Setting the webserver DB record %d"
+        for websrv in self.get_webserver_records():
+            if websrv.name == webserver_db_entry.name and \
+                websrv.video_path == webserver_db_entry.video_path:
+                self.nv_log_handler.error("Webserver %s:%s is already "
+                                          "configured", websrv.name,
+                                          websrv.video_path)
+                return
+        self.nv_log_handler.info("Adding the webserver DB record %d"
                                  % webserver_db_entry.server_id)
-        self.add_record(self.nv_webserver)
+        self.add_record(webserver_db_entry)
         self.db_commit()
+        self.nv_webservers.append(webserver_db_entry)
 
-    def del_webserver(self):
+    def del_webserver(self, name = None):
+        '''
+        Delete the webserver 'name', all the webservers when 'name' is None.
+        The relay journal of the webserver is deleted too.
+        '''
         if self.db_session is None:
             self.nv_log_handler.error("Can't create webserver record, "
                                       "DB session is not initialized")
             return
-        if self.nv_webserver is None:
+        del_webservers = [websrv for websrv in self.get_webserver_records()
+                          if name is None or websrv.name == name]
+        if not del_webservers:
             self.nv_log_handler.error("Cannot delete non-existant webserver"
                                     " instance")
             return
-        self.clean_table(table_name=nv_webserver_system)
-        self.nv_webserver = None
+        for websrv in del_webservers:
+            self.db_session.query(nv_relay_journal).filter_by(
+                    server_id = websrv.server_id).delete(
+                    synchronize_session = False)
+            self.delete_record(websrv)
+        self.db_commit()
+        self.nv_webservers = None
 
     def create_system_record(self):
         if self.db_session is None:
@@ -205,21 +355,31 @@ class db_manager():
     def get_own_system_record(self):
         return self.nv_midbox_db_entry
 
-    def get_webserver_record(self):
-        if not self.nv_webserver:
-            webserver_lst = self.get_tbl_records(nv_webserver_system)
-            if not webserver_lst:
-                return None
-            if len(webserver_lst) != 1:
-                self.nv_log_handler.error("Multiple webserver instance..")
-                return None
-            self.nv_webserver = webserver_lst[0]
-        return self.nv_webserver
+    def get_webserver_records(self):
+        '''
+        Returns the list of all the webservers.
+        '''
+        if self.nv_webservers is None:
+            websrv_list = self.get_tbl_records(nv_webserver_system)
+            # The list is shared by all the threads, keep it out of the
+            # session of this thread.
+            for websrv in websrv_list:
+                self.db_session.expunge(websrv)
+            self.nv_webservers = websrv_list
+        return self.nv_webservers
 
     def add_record(self, record_obj):
         self.nv_log_handler.debug("Adding a new record")
         self.db_session.add(record_obj)
 
+    def add_records(self, record_list):
+        '''
+        Add many new records in one bulk insert, the records are not kept in
+        the session after the commit.
+        '''
+        self.nv_log_handler.debug("Adding %d new records", len(record_list))
+        self.db_session.bulk_save_objects(record_list)
+
     def db_commit(self):
         try:
             self.nv_log_handler.debug("Committing the changes to DB.")
@@ -294,24 +454,310 @@ class db_manager():
                                   % ' '.join(list(kwargs)))
         return self.db_session.query(table_name).filter_by(**kwargs).count()
 
-    def db_start_transaction(self):
+    def get_relay_journal_entry(self, file_path, server_id):
+        return self.db_session.query(nv_relay_journal).get((file_path,
+                                                            server_id))
+
+    def get_relay_journal_keys(self):
+        '''
+        Returns the set of all the [file path, server id] in relay journal.
+        '''
+        return set(self.db_session.query(nv_relay_journal.file_path,
+                                         nv_relay_journal.server_id))
+
+    def get_relay_journal_backlog(self, max_attempts, retry_time, limit):
+        '''
+        Returns the oldest 'limit' journal entries that are yet to be copied.
+        The failed files are retried upto 'max_attempts' times, only if the
+        last attempt was before 'retry_time'.
+        '''
+        return self.db_session.query(nv_relay_journal).filter(
+                (nv_relay_journal.state == enum_relayState.CONST_RELAY_PENDING)
+                | ((nv_relay_journal.state ==
+                    enum_relayState.CONST_RELAY_FAILED)
+                   & (nv_relay_journal.attempts < max_attempts)
+                   & (nv_relay_journal.update_time < retry_time))).order_by(
+                nv_relay_journal.file_time).limit(limit).all()
+
+    def get_relay_journal_states(self):
+        '''
+        Returns the relay state of all the files in relay journal for every
+        webserver, { file_path : { server_id : enum_relayState } }
+        '''
+        file_states = {}
+        for (file_path, server_id, state) in self.db_session.query(
+                                            nv_relay_journal.file_path,
+                                            nv_relay_journal.server_id,
+                                            nv_relay_journal.state):
+            file_states.setdefault(file_path, {})[server_id] = state
+        return file_states
+
+    def del_relay_journal_files(self, file_paths):
+        '''
+        Delete the files 'file_paths' from relay journal, for all the
+        webservers.
+        '''
+        file_paths = list(file_paths)
+        # Upto 500 files at a time, sqlite limits the query parameters.
+        for idx in range(0, len(file_paths), 500):
+            self.db_session.query(nv_relay_journal).filter(
+                    nv_relay_journal.file_path.in_(file_paths[idx:idx + 500])
+                    ).delete(synchronize_session = False)
+
+    def get_relay_journal_file_states(self, file_path):
+        '''
+        Returns the relay state of a file for every webserver,
+        { server_id : enum_relayState }
+        '''
+        return dict(self.db_session.query(nv_relay_journal.server_id,
+                                          nv_relay_journal.state).filter_by(
+                                          file_path = file_path))
+
+    def add_segments(self, segments):
+        '''
+        Insert the segments in one statement, a segment already in catalog
+        is replaced.
+        segments : list of the nv_segment column dictionaries, for eg:
+            [{'file_path' : '/tmp/camera/cam1/01-Jan-2020:10-00-00.mp4',
+              'cam_name' : 'cam1', 'start_time' : 1577872800.0,
+              'end_time' : 1577872860.0, 'duration' : 60.0,
+              'file_size' : 1200000, 'relay_state' : 0}]
+        '''
+        self.db_session.execute(
+                nv_segment.__table__.insert().prefix_with("OR REPLACE"),
+                segments)
+
+    def del_segment_files(self, file_paths):
+        file_paths = list(file_paths)
+        # Upto 500 files at a time, sqlite limits the query parameters.
+        for idx in range(0, len(file_paths), 500):
+            self.db_session.query(nv_segment).filter(
+                    nv_segment.file_path.in_(file_paths[idx:idx + 500])
+                    ).delete(synchronize_session = False)
+
+    def set_segment_relay_states(self, relay_states):
+        '''
+        relay_states : { file_path : enum_relayState }
+        '''
+        if not relay_states:
+            return
+        self.db_session.execute(nv_segment.__table__.update().where(
+                    nv_segment.file_path == bindparam('seg_path')).values(
+                    relay_state = bindparam('seg_state')),
+                    [{'seg_path' : file_path, 'seg_state' : relay_state}
+                     for file_path, relay_state in relay_states.items()])
+
+    def get_segment_paths(self):
+        return set(file_path for (file_path,) in
+                   self.db_session.query(nv_segment.file_path))
+
+    def get_segment_max_duration(self):
+        return self.db_session.query(func.max(nv_segment.duration)).scalar()\
+               or 0.0
+
+    def get_segments(self, cam_name, start_time, end_time, max_duration):
+        '''
+        Returns the segments of the camera that has any video between
+        'start_time' and 'end_time', in the order of start time. No segment is
+        longer than 'max_duration', so only the index range from
+        'start_time' - 'max_duration' is read.
+        '''
+        return self.db_session.query(nv_segment).filter(
+                nv_segment.cam_name == cam_name,
+                nv_segment.start_time >= start_time - max_duration,
+                nv_segment.start_time < end_time,
+                nv_segment.end_time > start_time).order_by(
+                nv_segment.start_time).all()
+
+    def reset_relay_journal_uploading(self):
+        '''
+        Move the files that were being copied back to pending, the copy is
+        interrupted by the middlebox exit.
+        '''
+        return self.db_session.query(nv_relay_journal).filter_by(
+                state = enum_relayState.CONST_RELAY_UPLOADING).update(
+                {nv_relay_journal.state : enum_relayState.CONST_RELAY_PENDING},
+                synchronize_session = False)
+
+    def db_start_transaction(self, read_only = False):
         '''
         Acquire the DB lock before starting any transaction on the session.
         User can access the DB without the lock, however its good to acquire
         the lock before the transaction to keep the DB session in safe state all
         the time.
+        A 'read_only' transaction doesnt take the lock, it must not change the
+        DB.
         '''
+        if read_only:
+            with self.stats_lock:
+                self.lock_stats["read_transactions"] += 1
+            return
+        wait_time = time.monotonic()
         GBL_NV_SYNC_OBJ.mutex_lock(self.DB_TRANSACT_LOCK)
-
-    def db_end_transaction(self):
+        self.lock_time = time.monotonic()
+        wait_time = self.lock_time - wait_time
+        with self.stats_lock:
+            self.lock_stats["write_transactions"] += 1
+            self.lock_stats["lock_wait_total"] += wait_time
+            self.lock_stats["lock_wait_max"] = max(wait_time,
+                                            self.lock_stats["lock_wait_max"])
+        if wait_time > NVDB_LOCK_WAIT_WARN:
+            self.nv_log_handler.warning("Waited %.2f sec for the DB "
+                                        "transaction lock", wait_time)
+
+    def db_end_transaction(self, read_only = False):
         '''
         Release the lock after the transaction is complete. It is also essential
-        to release the lock in db session after the transaction.
+        to release the lock in db session after the transaction. The session of
+        the thread is closed, the changes not committed are discarded.
         '''
-        if GBL_NV_SYNC_OBJ.is_mutex_locked(self.DB_TRANSACT_LOCK):
-            self.nv_log_handler.info("Trying to unlock a non-existent lock")
+        try:
+            self.Session.remove()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to close DB session %s", e)
+        if read_only:
             return
+        hold_time = time.monotonic() - self.lock_time
+        with self.stats_lock:
+            self.lock_stats["lock_hold_total"] += hold_time
+            self.lock_stats["lock_hold_max"] = max(hold_time,
+                                            self.lock_stats["lock_hold_max"])
         GBL_NV_SYNC_OBJ.mutex_unlock(self.DB_TRANSACT_LOCK)
 
+    def start_group_commit(self):
+        self.is_group_stopped = False
+        self.group_thread = Thread(name = "nvdb_group_commit",
+                                   target = self.run_group_commit)
+        self.group_thread.daemon = True
+        self.group_thread.start()
+
+    def stop_group_commit(self):
+        '''
+        Stop the group commit thread after committing all the submitted
+        writes.
+        '''
+        with self.group_cond:
+            self.is_group_stopped = True
+            self.group_cond.notify_all()
+        if self.group_thread is not None:
+            self.group_thread.join()
+            self.group_thread = None
+
+    def db_submit_write(self, write_fn, on_done = None):
+        '''
+        Submit a write to commit with the other writes submitted in
+        NVDB_GROUP_COMMIT_WINDOW. The writes are run and committed in the
+        order submitted, in the group commit thread.
+        @param write_fn: Function to change the DB session, no commit.
+        @param on_done: Called with None after the commit, or the exception
+                        when the write failed.
+        '''
+        with self.group_cond:
+            if self.group_thread is None or self.is_group_stopped:
+                raise RuntimeError("DB group commit is not running")
+            self.group_writes.append([write_fn, on_done])
+            if len(self.group_writes) == 1 or \
+                len(self.group_writes) >= NVDB_GROUP_COMMIT_MAX_OPS:
+                self.group_cond.notify_all()
+
+    def db_flush_writes(self):
+        '''
+        Wait until all the writes submitted so far are committed.
+        '''
+        if current_thread() is self.group_thread:
+            # Called from an on_done, cannot wait for itself.
+            return
+        flush_event = Event()
+        try:
+            self.db_submit_write(lambda : None,
+                                 lambda error : flush_event.set())
+        except RuntimeError:
+            return
+        flush_event.wait()
+
+    def get_group_writes(self):
+        '''
+        Returns the next writes to commit, waits for the first write and the
+        writes submitted in the window after it. None when stopped and no
+        writes left.
+        '''
+        with self.group_cond:
+            while not self.group_writes and not self.is_group_stopped:
+                self.group_cond.wait()
+            if not self.group_writes:
+                return None
+            window_end = time.monotonic() + NVDB_GROUP_COMMIT_WINDOW
+            while len(self.group_writes) < NVDB_GROUP_COMMIT_MAX_OPS and \
+                not self.is_group_stopped:
+                wait_time = window_end - time.monotonic()
+                if wait_time <= 0:
+                    break
+                self.group_cond.wait(wait_time)
+            return [self.group_writes.popleft() for _ in
+                    range(min(len(self.group_writes),
+                              NVDB_GROUP_COMMIT_MAX_OPS))]
+
+    def commit_group_writes(self, write_ops):
+        '''
+        Run the writes and commit them in one transaction. When any write
+        fails, the writes are run again in their own transaction to find the
+        failed one. Returns the error of every write, None on success.
+        '''
+        try:
+            self.db_start_transaction()
+            for [write_fn, _] in write_ops:
+                write_fn()
+            self.db_commit()
+            return [None] * len(write_ops)
+        except Exception as e:
+            self.db_session.rollback()
+            if len(write_ops) == 1:
+                return [e]
+        finally:
+            self.db_end_transaction()
+        self.nv_log_handler.info("Group commit of %d writes failed, commit "
+                                 "them one by one", len(write_ops))
+        return [self.commit_group_writes([write_op])[0]
+                for write_op in write_ops]
+
+    def run_group_commit(self):
+        while True:
+            write_ops = self.get_group_writes()
+            if write_ops is None:
+                break
+            write_errors = self.commit_group_writes(write_ops)
+            with self.stats_lock:
+                self.lock_stats["group_commits"] += 1
+                self.lock_stats["group_writes"] += len(write_ops)
+                self.lock_stats["group_writes_max"] = max(len(write_ops),
+                                        self.lock_stats["group_writes_max"])
+            for [_, on_done], write_error in zip(write_ops, write_errors):
+                if write_error is not None:
+                    self.nv_log_handler.error("Failed to write to DB, %s",
+                                              write_error)
+                if on_done is None:
+                    continue
+                try:
+                    on_done(write_error)
+                except Exception as e:
+                    self.nv_log_handler.error("DB write callback failed, %s",
+                                              e)
+
+    def get_db_lock_stats(self):
+        '''
+        Returns the DB transaction lock statistics, the wait and hold times are
+        in seconds,
+        {'write_transactions' : 10, 'read_transactions' : 20,
+         'lock_wait_total' : 0.5, 'lock_wait_max' : 0.1,
+         'lock_wait_avg' : 0.05, 'lock_hold_total' : 1.2,
+         'lock_hold_max' : 0.4, 'group_commits' : 5, 'group_writes' : 40,
+         'group_writes_max' : 20}
+        '''
+        with self.stats_lock:
+            lock_stats = dict(self.lock_stats)
+        lock_stats["lock_wait_avg"] = lock_stats["lock_wait_total"] / \
+                                      max(lock_stats["write_transactions"], 1)
+        return lock_stats
+
 db_mgr_obj = db_manager()
 
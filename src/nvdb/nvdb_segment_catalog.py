@@ -0,0 +1,265 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The video segment catalog for nv-middlebox.
+#
+
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import os
+import time
+import calendar
+from threading import Thread, Condition, Lock
+from src.nv_logger import nv_logger
+from src.nvdb.nvdb_manager import db_mgr_obj, enum_relayState
+from src.settings import NV_MID_BOX_CAM_STREAM_DIR
+from src.settings import NVDB_SEGMENT_FLUSH_INTERVAL, NVDB_SEGMENT_BATCH_SIZE
+
+class nv_segment_catalog():
+    '''
+    The catalog of recorded video segments in the nv_segment table. The
+    segments are added when the recorder closes the file and removed when the
+    file is deleted. The changes are written to DB in batches by the catalog
+    thread, a query writes the pending changes first.
+    '''
+    # The segment file name is its start time in UTC, all the recorders name
+    # the files in UTC.
+    SEGMENT_NAME_FORMAT = "%d-%b-%Y:%H-%M-%S"
+
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        # Pending changes, applied in the order deletes, adds and relay
+        # states.
+        # { file_path : nv_segment column dictionary }
+        self.pending_adds = {}
+        self.pending_dels = set()
+        # { file_path : enum_relayState }
+        self.pending_states = {}
+        self.catalog_cond = Condition()
+        # Only one flush at a time, to apply the changes in order.
+        self.flush_lock = Lock()
+        self.is_catalog_stopped = False
+        self.catalog_thread = None
+        # The longest segment in catalog, to bound the range query.
+        self.max_duration = 0.0
+
+    @classmethod
+    def get_segment_start(cls, file_path, end_time):
+        '''
+        Returns the start time of the segment from its file name, 'end_time'
+        when the name is not a segment time.
+        '''
+        seg_name = os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            return float(calendar.timegm(time.strptime(seg_name,
+                                                cls.SEGMENT_NAME_FORMAT)))
+        except ValueError:
+            return end_time
+
+    def get_pending_cnt(self):
+        return len(self.pending_adds) + len(self.pending_dels) + \
+               len(self.pending_states)
+
+    def add_segment(self, file_path, cam_name, file_size, end_time):
+        '''
+        Add a finalized segment file to catalog, 'end_time' is the time the
+        file is closed.
+        '''
+        start_time = self.get_segment_start(file_path, end_time)
+        if start_time > end_time:
+            # The system clock is changed while recording.
+            self.nv_log_handler.info("Segment %s is closed before its start "
+                                     "time, %d sec", file_path,
+                                     start_time - end_time)
+            start_time = end_time
+        with self.catalog_cond:
+            self.pending_adds[file_path] = {
+                        "file_path" : file_path,
+                        "cam_name" : cam_name,
+                        "start_time" : start_time,
+                        "end_time" : end_time,
+                        "duration" : end_time - start_time,
+                        "file_size" : file_size,
+                        "relay_state" : enum_relayState.CONST_RELAY_PENDING}
+            if self.get_pending_cnt() >= NVDB_SEGMENT_BATCH_SIZE:
+                self.catalog_cond.notify_all()
+
+    def remove_segments(self, file_paths):
+        with self.catalog_cond:
+            for file_path in file_paths:
+                if self.pending_adds.pop(file_path, None) is None:
+                    self.pending_dels.add(file_path)
+                self.pending_states.pop(file_path, None)
+            if self.get_pending_cnt() >= NVDB_SEGMENT_BATCH_SIZE:
+                self.catalog_cond.notify_all()
+
+    def set_relay_state(self, file_path, relay_state):
+        with self.catalog_cond:
+            if file_path in self.pending_adds:
+                self.pending_adds[file_path]["relay_state"] = relay_state
+            else:
+                self.pending_states[file_path] = relay_state
+            if self.get_pending_cnt() >= NVDB_SEGMENT_BATCH_SIZE:
+                self.catalog_cond.notify_all()
+
+    def restore_pending(self, pending_adds, pending_dels, pending_states):
+        '''
+        Add the changes of a failed flush back to the pending changes, to
+        retry them on next flush. The changes made after the failed flush are
+        newer and kept as is.
+        '''
+        with self.catalog_cond:
+            for file_path in pending_dels:
+                if file_path not in self.pending_adds:
+                    self.pending_dels.add(file_path)
+            for segment in pending_adds:
+                file_path = segment["file_path"]
+                if file_path in self.pending_adds or \
+                    file_path in self.pending_dels:
+                    continue
+                if file_path in self.pending_states:
+                    segment["relay_state"] = \
+                                        self.pending_states.pop(file_path)
+                self.pending_adds[file_path] = segment
+            for file_path, relay_state in pending_states.items():
+                if file_path in self.pending_adds or \
+                    file_path in self.pending_dels or \
+                    file_path in self.pending_states:
+                    continue
+                self.pending_states[file_path] = relay_state
+
+    def flush_catalog(self):
+        '''
+        Write all the pending changes to DB in one transaction.
+        '''
+        with self.flush_lock:
+            with self.catalog_cond:
+                if not self.get_pending_cnt():
+                    return
+                pending_adds = list(self.pending_adds.values())
+                pending_dels = self.pending_dels
+                pending_states = self.pending_states
+                self.pending_adds = {}
+                self.pending_dels = set()
+                self.pending_states = {}
+            try:
+                db_mgr_obj.db_start_transaction()
+                db_mgr_obj.del_segment_files(pending_dels)
+                if pending_adds:
+                    db_mgr_obj.add_segments(pending_adds)
+                db_mgr_obj.set_segment_relay_states(pending_states)
+                db_mgr_obj.db_commit()
+            except Exception as e:
+                self.nv_log_handler.error("Failed to update the segment "
+                                          "catalog, retrying %d changes in "
+                                          "%d sec, %s",
+                                          len(pending_adds) +
+                                          len(pending_dels) +
+                                          len(pending_states),
+                                          NVDB_SEGMENT_FLUSH_INTERVAL, e)
+                self.restore_pending(pending_adds, pending_dels,
+                                     pending_states)
+                return
+            finally:
+                db_mgr_obj.db_end_transaction()
+            self.max_duration = max([self.max_duration] +
+                                    [segment["duration"]
+                                     for segment in pending_adds])
+
+    def get_segments(self, cam_name, start_time, end_time):
+        '''
+        Returns the segments of the camera that has any video between
+        'start_time' and 'end_time' in seconds since epoch, as the list of
+        nv_segment in the order of start time.
+        '''
+        self.flush_catalog()
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            return db_mgr_obj.get_segments(cam_name, start_time, end_time,
+                                           self.max_duration)
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the segments of %s, %s",
+                                      cam_name, e)
+            return []
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+
+    def reconcile_catalog(self):
+        '''
+        Sync the catalog with the segment files in the camera stream
+        directory, for eg: the files recorded or deleted while the middlebox
+        was not running.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            seg_paths = db_mgr_obj.get_segment_paths()
+            self.max_duration = max(self.max_duration,
+                                    db_mgr_obj.get_segment_max_duration())
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the segment catalog, %s",
+                                      e)
+            return
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+        new_cnt = 0
+        with os.scandir(NV_MID_BOX_CAM_STREAM_DIR) as cam_dirs:
+            for cam_dir in cam_dirs:
+                if not cam_dir.is_dir(follow_symlinks = False):
+                    continue
+                with os.scandir(cam_dir.path) as cam_files:
+                    for cam_file in cam_files:
+                        if not cam_file.name.endswith('.mp4') or \
+                            not cam_file.is_file(follow_symlinks = False):
+                            continue
+                        if cam_file.path in seg_paths:
+                            seg_paths.discard(cam_file.path)
+                            continue
+                        file_stat = cam_file.stat()
+                        self.add_segment(cam_file.path, cam_dir.name,
+                                         file_stat.st_size,
+                                         file_stat.st_mtime)
+                        new_cnt += 1
+        self.remove_segments(seg_paths)
+        self.flush_catalog()
+        self.nv_log_handler.info("Segment catalog reconciled, %d segments "
+                                 "added and %d removed", new_cnt,
+                                 len(seg_paths))
+
+    def run_catalog(self):
+        try:
+            self.reconcile_catalog()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to reconcile the segment "
+                                      "catalog, %s", e)
+        while True:
+            with self.catalog_cond:
+                if not self.is_catalog_stopped and \
+                    self.get_pending_cnt() < NVDB_SEGMENT_BATCH_SIZE:
+                    self.catalog_cond.wait(NVDB_SEGMENT_FLUSH_INTERVAL)
+                is_stopped = self.is_catalog_stopped
+            self.flush_catalog()
+            if is_stopped:
+                break
+
+    def start_catalog(self):
+        self.is_catalog_stopped = False
+        self.catalog_thread = Thread(name = "nv_segment_catalog",
+                                     target = self.run_catalog)
+        self.catalog_thread.daemon = True
+        self.catalog_thread.start()
+
+    def stop_catalog(self):
+        '''
+        Stop the catalog thread, the pending changes are written before its
+        stopped.
+        '''
+        with self.catalog_cond:
+            self.is_catalog_stopped = True
+            self.catalog_cond.notify_all()
+        if self.catalog_thread is not None:
+            self.catalog_thread.join()
+            self.catalog_thread = None
+
+GBL_SEGMENT_CATALOG = nv_segment_catalog()
@@ -13,78 +13,98 @@ __copyright__ = "Copyright (C) The neoview team."
 __license__ = "GNU Lesser General Public License"
 __version__ = "1.0"
 
+import os
 from watchdog.observers import Observer  
 from watchdog.events import FileSystemEventHandler
 from src.settings import NV_MID_BOX_CAM_STREAM_DIR
 from src.nvdb.nvdb_manager import db_mgr_obj
 from src.nv_logger import nv_logger
 from src.nv_lib.nv_os_lib import nv_os_lib
-from src.nv_lib.nv_sync_lib import GBL_NV_SYNC_OBJ
 from src.settings import NV_CAM_VALID_FILE_SIZE_MB
+from src.settings import NV_RELAY_WORKERS, NV_RELAY_QUEUE_LEN
+from src.settings import NV_RELAY_SFTP_POOL_SIZE, NV_RELAY_VERIFY_HASH
+from src.settings import NV_RELAY_DEST_SESSIONS
+from src.settings import NV_RELAY_BACKLOG_BATCH
+from src.settings import NV_RELAY_BACKLOG_INTERVAL
+from src.nvdb.nvdb_manager import enum_relayState
+from src.nvrelay.relay_journal import relay_journal
+from src.nvdb.nvdb_segment_catalog import GBL_SEGMENT_CATALOG
+from src.nvrelay.relay_stripe import relay_stripe_tuner
+from src.nvrelay.relay_shaper import relay_shaper
+from src.nvrelay.relay_retention import relay_retention_mgr
+from src.nv_lib.nv_os_lib import nv_sftp_pool, enum_copyMethod
+from src.nv_exception import sftpConnException
 from src.nv_lib.nv_time_lib import nv_time
 from src.settings import NV_CAM_CONN_TIMEOUT
-import queue
 from src.nv_lib.ipc_data_obj import camera_data, enum_ipcOpCode
 from src.nv_lib.nv_sync_lib import GBL_CONF_QUEUE
 from src.nvdb.nvdb_manager import enum_camStatus
+from collections import deque
+from threading import Thread, Condition, Lock, Event
 
-class relay_queue_mgr():
+class relay_cam_timer_mgr():
     '''
-    Class to manage files to copy. It maintain one queue per camera stream.
+    Class to track the liveness of camera streams. It maintain one timer
+    object per camera stream.
     '''
     def __init__(self):
         '''
-        Dictionary to hold the different queues. the dictionary will be looks
-        like
-        cam_stream_queue_dic = {
-                            'camera1' : [queue1, camera_timer_obj]
-                            'camera2' : [queue2, camera_timer_obj]
-                             .....
-                             }
-        the queues are holding the series of file-pairs. for eg:
-        queue1 = <[src1, dst1], [src2. dst2], ....>
-
+        Dictionary to hold the timer objects of cameras. the dictionary will be
+        looks like
+        cam_timer_dic = {
+                        'camera1' : camera_timer_obj
+                        'camera2' : camera_timer_obj
+                         .....
+                         }
         camera_timer_obj is used to determine the liveness of camera. If a
         camera generates invalid streams(less than valid size) continuously
         for a period(NV_CAM_CONN_TIMEOUT), then the camera will move to
         disconnected state.
         '''
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
-        self.cam_stream_queue_dic = {}
-
-    def enqueue_file_pair(self, cam_name, src, dst):
-        if not cam_name in self.cam_stream_queue_dic:
-            # There is no queue for specific camera, create it.
-            rel_queue = queue.Queue()
-            cam_timeobj = nv_time(timeout=NV_CAM_CONN_TIMEOUT)
-            self.cam_stream_queue_dic[cam_name] = [rel_queue, cam_timeobj]
-        else:
-            [rel_queue,cam_timeobj] = self.cam_stream_queue_dic[cam_name]
-        rel_queue.put([src, dst])
-
-    def dequeue_file_pair(self, cam_name):
-        if not cam_name in self.cam_stream_queue_dic:
-            self.nv_log_handler.debug("Cannot dequeue from a non-existent queue"
-                                      ": %s" % cam_name)
-            return [None, None]
-        [rel_queue,_] = self.cam_stream_queue_dic[cam_name]
-        if rel_queue.empty():
-            self.nv_log_handler.debug("Cannot dequeue from a empty queue")
-            return [None, None]
-        return rel_queue.get()
-
-    def dequeue_file_pair_with_timeout(self, cam_name):
-        '''
-        Function to return the file pair to copy from queue along with the
-        timeobj. The timeobj stores the last time a proper video stream is
-        generated.
-        @returns [[file-src, file-dst], timeobj]
-        '''
-        file_list = self.dequeue_file_pair(cam_name)
-        if all(x is None for x in file_list):
-            return[file_list, None]
-        [_, timeobj] = self.cam_stream_queue_dic[cam_name]
-        return[file_list, timeobj]
+        self.cam_timer_dic = {}
+        self.timer_lock = Lock()
+
+    def get_cam_timeobj(self, cam_name):
+        '''
+        Returns the timeobj of the camera, that stores the last time a proper
+        video stream is generated.
+        '''
+        with self.timer_lock:
+            if not cam_name in self.cam_timer_dic:
+                self.cam_timer_dic[cam_name] = \
+                                    nv_time(timeout=NV_CAM_CONN_TIMEOUT)
+            return self.cam_timer_dic[cam_name]
+
+class relay_cache_stats():
+    '''
+    Counters of the file bytes the relay read from the page cache and from the
+    disk, per camera. The files are copied right after the recording, most
+    of them should be read from the page cache.
+    '''
+    def __init__(self):
+        '''
+        cam_cache_dic = {
+                        'camera1' : {'cache_bytes' : 1200, 'disk_bytes' : 10}
+                        .....
+                        }
+        '''
+        self.cam_cache_dic = {}
+        self.stats_lock = Lock()
+
+    def add_file_read(self, cam_name, cached_bytes, file_size):
+        if cached_bytes is None:
+            return
+        with self.stats_lock:
+            cam_stats = self.cam_cache_dic.setdefault(cam_name,
+                                    {"cache_bytes" : 0, "disk_bytes" : 0})
+            cam_stats["cache_bytes"] += cached_bytes
+            cam_stats["disk_bytes"] += file_size - cached_bytes
+
+    def get_cam_cache_stats(self):
+        with self.stats_lock:
+            return {cam_name : dict(cam_stats) for cam_name, cam_stats in
+                    self.cam_cache_dic.items()}
 
 class relay_ftp_handler():
     '''
@@ -93,12 +113,20 @@ class relay_ftp_handler():
     MB_SIZE = 1000000 # Bytes #
     NV_CAM_VALID_FILE_SIZE = NV_CAM_VALID_FILE_SIZE_MB * MB_SIZE
 
-    def __init__(self):
+    def __init__(self, timer_mgr, shaper, cache_stats):
+        '''
+        @param timer_mgr: The camera liveness timers, shared by all the relay
+                          workers.
+        @param shaper: The bandwidth shaper of uploads, shared by all the relay
+                       workers.
+        @param cache_stats: The page cache counters, shared by all the relay
+                            workers.
+        '''
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
         self.os_context = nv_os_lib()
-        self.websrv = None 
-        self.sftp = None
-        self.queue_mgr = relay_queue_mgr()
+        self.timer_mgr = timer_mgr
+        self.shaper = shaper
+        self.cache_stats = cache_stats
 
     def notify_camera_disconnect(self, cam_name):
         '''
@@ -178,105 +206,252 @@ class relay_ftp_handler():
         timeobj.update_time()
         return True
 
-    def enqeue_copy_file_list(self, cam_name, src, dst):
-        '''
-        NOTE ::: 
-        The assumption here is copying of file must be faster than getting a file
-        generated.
-        Relay agent trigger a copy operation for every file created by middle
-        box streaming thread. Copying a file immediately on creation causes data
-        loss/corruption as the file generation is not complete.
-        The enqueue mechanism take care of it by copying a file only after the
-        creation is complete. On creation files are enqueued and real copying is
-        happen only at the time of second file creation.
-        '''
-        [file_list, time_obj] = \
-                        self.queue_mgr.dequeue_file_pair_with_timeout(cam_name)
-        [cp_src, cp_dst] = file_list
-        self.queue_mgr.enqueue_file_pair(cam_name, src, dst)
-        if cp_src is None or cp_dst is None:
-            return [None, None]
-        if not self.is_file_to_copy_valid(cp_src, cam_name, time_obj):
+    def is_copy_valid(self, cam_name, src, is_live):
+        '''
+        Check if the file is valid to copy. The camera liveness is tracked only
+        on the new files ('is_live'), not on the old files copied from the
+        relay journal.
+        NOTE :::
+        The relay is triggered only when the streaming thread closes the file
+        after writing. The file is complete by then and its copied right away.
+        '''
+        if not is_live:
+            file_size = self.os_context.get_filesize_in_bytes(src)
+            is_valid = file_size >= relay_ftp_handler.NV_CAM_VALID_FILE_SIZE
+        else:
+            time_obj = self.timer_mgr.get_cam_timeobj(cam_name)
+            is_valid = self.is_file_to_copy_valid(src, cam_name, time_obj)
+        if not is_valid:
             self.nv_log_handler.info("%s file size less than %dMB, "
                                       "Not copying to webserver",
-                                      cp_src,
+                                      src,
                                       NV_CAM_VALID_FILE_SIZE_MB)
-            return [None, None]
-        return [cp_src, cp_dst]
+        return is_valid
+
+    def get_cache_residency(self, file_path):
+        '''
+        Returns [<bytes of the file in page cache>, <file size>], the cached
+        bytes is None when cannot find it.
+        '''
+        try:
+            return self.os_context.get_file_cache_residency(file_path)
+        except OSError as e:
+            self.nv_log_handler.debug("Cannot find the cached size of %s, %s",
+                                      file_path, e)
+            return [None, 0]
 
-    def local_file_transfer(self, nv_cam_src, websrv):
+    def drop_file_cache(self, file_path):
+        '''
+        The file is not read again after the copy, drop it from page cache to
+        keep the cache for the recent files.
+        '''
         try:
-            # Copy the file nv_cam_src to dst.
-            if not self.is_media_file(nv_cam_src):
-                self.nv_log_handler.error("%s is not a media file, Do not copy" % \
-                                          nv_cam_src)
-                return
-            if not self.websrv:
-                self.websrv = websrv
-            dst_path = websrv.video_path
-            # Get the absolute path directory name of the file.
-            cam_src_dir = self.os_context.get_dirname(nv_cam_src)
-            # Find the camera folder name in the absolute path.
-            cam_src_dir = self.os_context.get_last_filename(cam_src_dir)
-            dst_dir = self.os_context.join_dir(dst_path, cam_src_dir)
+            self.os_context.drop_file_cache(file_path)
+        except OSError as e:
+            self.nv_log_handler.debug("Cannot drop %s from page cache, %s",
+                                      file_path, e)
+
+    def relay_file(self, nv_cam_src, dests, is_live = True):
+        '''
+        Copy a file to all the webservers 'dests', relay_destination objects.
+        The local webservers get an in-kernel copy, the remote webservers are
+        uploaded together with a single read of the file.
+        Returns the relay state of the file for every webserver,
+        { server_id : enum_relayState }
+        '''
+        if not self.is_media_file(nv_cam_src):
+            self.nv_log_handler.error("%s is not a media file, Do not copy" % \
+                                      nv_cam_src)
+            return {dest.server_id : enum_relayState.CONST_RELAY_SKIPPED
+                    for dest in dests}
+        # Get the absolute path directory name of the file.
+        cam_src_dir = self.os_context.get_dirname(nv_cam_src)
+        # Find the camera folder name in the absolute path.
+        cam_src_dir = self.os_context.get_last_filename(cam_src_dir)
+        try:
+            if not self.is_copy_valid(cam_src_dir, nv_cam_src, is_live):
+                return {dest.server_id : enum_relayState.CONST_RELAY_SKIPPED
+                        for dest in dests}
+        except Exception as e:
+            self.nv_log_handler.error("Cannot copy %s, %s", nv_cam_src, e)
+            return {dest.server_id : enum_relayState.CONST_RELAY_FAILED
+                    for dest in dests}
+        [cached_bytes, file_size] = self.get_cache_residency(nv_cam_src)
+        relay_states = {}
+        is_file_read = False
+        for dest in dests:
+            if not dest.is_local:
+                continue
+            relay_states[dest.server_id], copy_method = \
+                    self.local_file_transfer(nv_cam_src, cam_src_dir, dest)
+            # The webserver has its own copy, the source is read only once.
+            if copy_method is not None and \
+                copy_method != enum_copyMethod.CONST_COPY_LINK:
+                is_file_read = True
+        remote_dests = [dest for dest in dests if not dest.is_local]
+        if len(remote_dests) == 1:
+            relay_states[remote_dests[0].server_id] = \
+                    self.remote_file_transfer(nv_cam_src, cam_src_dir,
+                                              remote_dests[0], is_live)
+        elif remote_dests:
+            relay_states.update(self.remote_fanout_transfer(nv_cam_src,
+                                                            cam_src_dir,
+                                                            remote_dests,
+                                                            is_live))
+        if remote_dests:
+            is_file_read = True
+        if is_file_read:
+            self.cache_stats.add_file_read(cam_src_dir, cached_bytes,
+                                           file_size)
+            if all(relay_state == enum_relayState.CONST_RELAY_DONE
+                   for relay_state in relay_states.values()):
+                # The copies are done, the file is never read again.
+                self.drop_file_cache(nv_cam_src)
+        return relay_states
+
+    def local_file_transfer(self, nv_cam_src, cam_name, dest):
+        '''
+        Copy the file to webserver on the same machine.
+        Returns [<relay state of the file>, <copy method used>], the copy
+        method is None when the copy failed.
+        '''
+        try:
+            dst_dir = self.os_context.join_dir(dest.video_path, cam_name)
             if not self.os_context.is_path_exists(dst_dir):
                 self.nv_log_handler.debug("Create the directory %s" % dst_dir)
                 self.os_context.make_dir(dst_dir)
-            file_pair = self.enqeue_copy_file_list(cam_src_dir, nv_cam_src, dst_dir)
-            cp_src = file_pair[0]
-            cp_dst = file_pair[1]
-            if cp_src is None or cp_dst is None:
-                return
             self.nv_log_handler.debug("Copying file %s to %s"% \
-                                      (cp_src, cp_dst))
-            self.os_context.copy_file(cp_src, cp_dst)
+                                      (nv_cam_src, dst_dir))
+            copy_method = self.os_context.fast_copy_file(nv_cam_src, dst_dir)
+            # Not on the uplink, only counted for the camera share.
+            self.shaper.account_bytes(cam_name,
+                            self.os_context.get_filesize_in_bytes(nv_cam_src))
+            return [enum_relayState.CONST_RELAY_DONE, copy_method]
         except Exception as e:
                 self.nv_log_handler.debug("Failed to copy file to webserver %s", e)
+                return [enum_relayState.CONST_RELAY_FAILED, None]
 
-    def remote_file_transfer(self, nv_cam_src, websrv):
+    def remote_file_transfer(self, nv_cam_src, cam_name, dest, is_live = True):
+        '''
+        Copy the file remotely over a sftp session borrowed from the sftp pool
+        of webserver 'dest'. A large file is uploaded in stripes over the free
+        sessions of the pool.
+        Returns the relay state of the file, enum_relayState. The file stays
+        pending when cannot connect to the webserver.
+        '''
         try:
-            # Copy the file remotely using scp/sftp.
-            if not self.is_media_file(nv_cam_src):
-                self.nv_log_handler.debug("%s is not a media file, Do not copy" % \
-                                          nv_cam_src)
-                return
-            if not self.websrv:
-                self.websrv = websrv
+            dst_dir = self.os_context.join_dir(dest.video_path, cam_name)
+            sftp_pool = dest.sftp_pool
+            stripes = dest.stripe_tuner.get_stripes(
+                            self.os_context.get_filesize_in_bytes(nv_cam_src))
+            with sftp_pool.borrow() as session:
+                # No round trip when the camera directory is known already.
+                self.os_context.remote_make_dir_cached(session.sftp, dst_dir,
+                                                       session.known_dirs)
+                self.nv_log_handler.debug("Copying file %s to %s remotely"% \
+                                          (nv_cam_src, dst_dir))
+                # Stripes only on the sessions free now, never wait for them.
+                stripe_sessions = sftp_pool.get_free_sessions(stripes - 1)
                 try:
-                    self.sftp = self.os_context.get_remote_sftp_connection(
-                                                hostname = websrv.name,
-                                                username = websrv.uname,
-                                                pwd = websrv.pwd)
-                except Exception as e:
-                    self.nv_log_handler.error("Failed to establish remote ssh "
-                                "connection to webserver, copying failed %s", e)
-                    self.sftp = None
-                    return
-            if not self.sftp:
-                self.nv_log_handler.error("SFTP failed, cannot copy media.")
-                return
-            dst_path = websrv.video_path
-            # Get the absolute path directory name of the file.
-            cam_src_dir = self.os_context.get_dirname(nv_cam_src)
-            # Find the camera folder name in the absolute path.
-            cam_src_dir = self.os_context.get_last_filename(cam_src_dir)
-            dst_dir = self.os_context.join_dir(dst_path, cam_src_dir)
-            if not self.os_context.is_remote_path_exists(self.sftp, dst_dir):
-                self.nv_log_handler.debug("Create the remote directory %s" % dst_dir)
-                self.os_context.remote_make_dir(self.sftp, dir_name = dst_dir)
-            file_pair = self.enqeue_copy_file_list(cam_src_dir, nv_cam_src, dst_dir)
-            cp_src = file_pair[0]
-            cp_dst = file_pair[1]
-            if cp_src is None or cp_dst is None:
-                return
-            self.nv_log_handler.debug("Copying file %s to %s remotely"% \
-                                      (cp_src, cp_dst))
-            self.os_context.remote_copy_file(self.sftp,cp_src, cp_dst)
+                    upload_stats = self.os_context.remote_upload_file(
+                            session.ssh, session.sftp, nv_cam_src, dst_dir,
+                            verify_hash = NV_RELAY_VERIFY_HASH,
+                            stripe_sftps = [stripe_session.sftp for
+                                            stripe_session in stripe_sessions],
+                            throttle = lambda nbytes :
+                                self.shaper.throttle_upload(cam_name,
+                                                            is_live, nbytes))
+                finally:
+                    for stripe_session in stripe_sessions:
+                        sftp_pool.put_session(stripe_session, is_broken =
+                            not self.os_context.is_sftp_session_alive(
+                                    stripe_session.ssh, stripe_session.sftp))
+            dest.stripe_tuner.update_stats(upload_stats)
+            return enum_relayState.CONST_RELAY_DONE
+        except sftpConnException as e:
+            self.nv_log_handler.error("SFTP failed, cannot copy media %s, %s",
+                                      nv_cam_src, e)
+            return enum_relayState.CONST_RELAY_PENDING
         except Exception as e:
             self.nv_log_handler.debug("Failed to remote copy file to webserver"
                                       "%s", e)
+            return enum_relayState.CONST_RELAY_FAILED
 
-    def is_webserver_local(self, webserver):
+    def remote_fanout_transfer(self, nv_cam_src, cam_name, dests,
+                               is_live = True):
+        '''
+        Copy the file to several remote webservers 'dests' with a single read
+        of the file, over a session borrowed from the sftp pool of each
+        webserver.
+        Returns the relay state of the file for every webserver,
+        { server_id : enum_relayState }. The file stays pending for a
+        webserver that cannot be connected.
+        '''
+        relay_states = {}
+        dest_sessions = []
+        try:
+            # The sessions are borrowed in the server id order, so the workers
+            # never wait on each other in a cycle.
+            for dest in sorted(dests, key = lambda dest : dest.server_id):
+                try:
+                    session = dest.sftp_pool.get_session()
+                except sftpConnException as e:
+                    self.nv_log_handler.error("SFTP failed, cannot copy media "
+                                              "%s to %s, %s", nv_cam_src,
+                                              dest.name, e)
+                    relay_states[dest.server_id] = \
+                                        enum_relayState.CONST_RELAY_PENDING
+                    continue
+                dst_dir = self.os_context.join_dir(dest.video_path, cam_name)
+                try:
+                    self.os_context.remote_make_dir_cached(session.sftp,
+                                                           dst_dir,
+                                                           session.known_dirs)
+                except Exception as e:
+                    self.nv_log_handler.debug("Failed to create %s on %s, %s",
+                                              dst_dir, dest.name, e)
+                    dest.sftp_pool.put_failed_session(session)
+                    relay_states[dest.server_id] = \
+                                        enum_relayState.CONST_RELAY_FAILED
+                    continue
+                dest_sessions.append([dest, session, dst_dir])
+            if not dest_sessions:
+                return relay_states
+            self.nv_log_handler.debug("Copying file %s to %d webservers" % \
+                                      (nv_cam_src, len(dest_sessions)))
+            try:
+                upload_results = self.os_context.remote_upload_fanout(
+                        nv_cam_src,
+                        [[session.ssh, session.sftp, dst_dir] for
+                         [_, session, dst_dir] in dest_sessions],
+                        verify_hash = NV_RELAY_VERIFY_HASH,
+                        throttle = lambda nbytes :
+                            self.shaper.throttle_upload(cam_name, is_live,
+                                                        nbytes))
+            except Exception as e:
+                self.nv_log_handler.debug("Failed to remote copy file to "
+                                          "webservers %s", e)
+                upload_results = [e] * len(dest_sessions)
+            for [dest, session, _], upload_result in \
+                zip(dest_sessions, upload_results):
+                if isinstance(upload_result, Exception):
+                    dest.sftp_pool.put_failed_session(session)
+                    relay_states[dest.server_id] = \
+                                        enum_relayState.CONST_RELAY_FAILED
+                else:
+                    dest.sftp_pool.put_session(session)
+                    dest.stripe_tuner.update_stats(upload_result)
+                    relay_states[dest.server_id] = \
+                                        enum_relayState.CONST_RELAY_DONE
+            dest_sessions = []
+        finally:
+            # Only when interrupted by an unexpected error.
+            for [dest, session, _] in dest_sessions:
+                dest.sftp_pool.put_failed_session(session)
+        return relay_states
+
+    @staticmethod
+    def is_webserver_local(webserver):
         '''
         Check if the webserver deployed on the same machine.
         Returns:
@@ -287,46 +462,421 @@ class relay_ftp_handler():
             return True
         return False
 
-    def is_media_file(self, file_path):
+    @staticmethod
+    def is_media_file(file_path):
         '''
         Check if the file is media
         '''
         file_ext = '.mp4'
         return file_path.endswith(file_ext)
 
-    def kill_ftp_session(self):
-        self.os_context.close_remote_sftp_connection()
-        self.os_context.close_remote_host_connection()
-        self.nv_log_handler.debug("Closing the ftp session..")
-        pass
+class relay_destination():
+    '''
+    A webserver to relay the files. A remote webserver has its own sftp pool,
+    that limits the files copied to it in parallel and keeps the connection
+    retry state of the webserver, and its own stripe tuner.
+    The webserver record is copied, the DB record is never accessed from the
+    relay workers.
+    '''
+    def __init__(self, websrv):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.server_id = websrv.server_id
+        self.name = websrv.name
+        self.video_path = websrv.video_path
+        self.uname = websrv.uname
+        self.pwd = websrv.pwd
+        self.is_local = relay_ftp_handler.is_webserver_local(websrv)
+        self.stripe_tuner = relay_stripe_tuner()
+        self.sftp_pool = None
+        if self.is_local:
+            return
+        self.nv_log_handler.info("Starting the sftp pool to webserver %s",
+                                 self.name)
+        self.sftp_pool = nv_sftp_pool(hostname = self.name,
+                                      username = self.uname,
+                                      pwd = self.pwd,
+                                      pool_size = NV_RELAY_DEST_SESSIONS.get(
+                                            self.name, NV_RELAY_SFTP_POOL_SIZE))
+        self.sftp_pool.prewarm_pool()
+
+    @staticmethod
+    def get_dest_key(websrv):
+        return (websrv.server_id, websrv.name, websrv.video_path, websrv.uname,
+                websrv.pwd)
+
+    def close(self):
+        if self.sftp_pool is not None:
+            self.sftp_pool.close_pool()
+
+class relay_job():
+    '''
+    A file to copy to the webservers 'server_ids'. 'is_live' is set for a new
+    file closed by the streaming thread and unset for an old file from the
+    relay journal.
+    '''
+    def __init__(self, cam_name, src_path, server_ids, is_live = True):
+        self.cam_name = cam_name
+        self.src_path = src_path
+        self.server_ids = server_ids
+        self.is_live = is_live
+
+class relay_worker_pool():
+    '''
+    Pool of relay worker threads to copy the files to webserver in parallel.
+    The jobs are queued per camera and a camera is handled by only one worker
+    at a time, so the files of a camera are copied in the order they are
+    closed. Every worker has its own ftp handler, the remote copies borrow
+    a session from the sftp pool of each webserver. A file is copied to all
+    the webservers by the same worker.
+    The pool can hold upto 'queue_len' jobs, a new job waits for a free slot
+    when its full.
+    The old files from relay journal are queued in a separate backlog, oldest
+    first. A worker picks a backlog job only when there is no new file to
+    copy and at most NV_RELAY_BACKLOG_WORKERS workers copy the backlog at a
+    time, so the backlog never delays the new files.
+    The camera to copy next and the upload rate are decided by the relay
+    shaper.
+    '''
+    def __init__(self, num_workers = NV_RELAY_WORKERS,
+                 queue_len = NV_RELAY_QUEUE_LEN):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.num_workers = num_workers
+        self.queue_len = queue_len
+        self.timer_mgr = relay_cam_timer_mgr()
+        self.shaper = relay_shaper()
+        self.cache_stats = relay_cache_stats()
+        self.os_context = nv_os_lib()
+        # Pending jobs of every camera, { 'camera1' : deque([job1, job2]) }
+        self.cam_jobs = {}
+        # Cameras ready to be picked by a worker, in the order they are
+        # ready.
+        self.ready_cams = deque()
+        # Cameras either in ready_cams or being handled by a worker.
+        self.sched_cams = set()
+        self.job_cnt = 0
+        self.backlog_jobs = deque()
+        self.backlog_running = 0
+        self.backlog_progress = False
+        # Files queued or being copied, a file is never queued twice.
+        self.queued_paths = set()
+        self.pool_cond = Condition()
+        self.is_pool_stopped = False
+        self.workers = []
+        self.journal = relay_journal()
+        self.backlog_event = Event()
+        self.backlog_thread = None
+        # The webservers to relay, { server_id : relay_destination_obj }
+        self.dests = {}
+        self.dest_keys = {}
+        # The journal is reconciled when the webservers are changed.
+        self.is_dests_changed = True
+        self.dest_lock = Lock()
+        self.retention_mgr = relay_retention_mgr(self)
+
+    def update_webservers(self, websrv_list):
+        '''
+        Keep the relay destinations in sync with the webserver records. A new
+        destination is created for a new or changed webserver, and the sftp
+        pool of a deleted or changed webserver is closed.
+        '''
+        with self.dest_lock:
+            new_keys = {websrv.server_id : relay_destination.get_dest_key(websrv)
+                        for websrv in websrv_list}
+            if new_keys == self.dest_keys:
+                return
+            dests = dict(self.dests)
+            for server_id, dest in self.dests.items():
+                if new_keys.get(server_id) != self.dest_keys[server_id]:
+                    dest.close()
+                    del dests[server_id]
+            for websrv in websrv_list:
+                if websrv.server_id not in dests:
+                    dests[websrv.server_id] = relay_destination(websrv)
+            # Replaced as a whole, the workers read it without the lock.
+            self.dests = dests
+            self.dest_keys = new_keys
+        self.is_dests_changed = True
+        # The journal may have files waiting for the webservers.
+        self.backlog_event.set()
+
+    def get_dest_ids(self):
+        return list(self.dests)
+
+    def get_dests(self, server_ids):
+        dests = self.dests
+        return [dests[server_id] for server_id in server_ids
+                if server_id in dests]
+
+    def is_file_queued(self, file_path):
+        with self.pool_cond:
+            return file_path in self.queued_paths
+
+    def start_workers(self):
+        for worker_id in range(self.num_workers):
+            ftp_obj = relay_ftp_handler(self.timer_mgr, self.shaper,
+                                        self.cache_stats)
+            worker = Thread(name = "nv_relay_worker" + str(worker_id),
+                            target = self.run_worker, args = (ftp_obj,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        self.backlog_thread = Thread(name = "nv_relay_backlog",
+                                     target = self.run_backlog)
+        self.backlog_thread.daemon = True
+        self.backlog_thread.start()
+        self.retention_mgr.start_retention()
+        self.nv_log_handler.info("Started %d relay workers", self.num_workers)
+
+    def enqueue_job(self, job):
+        with self.pool_cond:
+            if self.job_cnt >= self.queue_len and not self.is_pool_stopped:
+                self.nv_log_handler.info("Relay queue is full, waiting to "
+                                         "queue %s", job.src_path)
+            while self.job_cnt >= self.queue_len and not self.is_pool_stopped:
+                self.pool_cond.wait()
+            if self.is_pool_stopped:
+                self.nv_log_handler.debug("Relay is stopped, no file copy")
+                return False
+            if job.src_path in self.queued_paths:
+                return True
+            self.queued_paths.add(job.src_path)
+            self.cam_jobs.setdefault(job.cam_name, deque()).append(job)
+            self.job_cnt += 1
+            if job.cam_name not in self.sched_cams:
+                self.sched_cams.add(job.cam_name)
+                self.shaper.camera_ready(job.cam_name)
+                self.ready_cams.append(job.cam_name)
+                self.pool_cond.notify_all()
+        return True
 
-RELAY_MUTEX_NAME = "relay_watcher_mutex"
+    def enqueue_backlog_job(self, job):
+        with self.pool_cond:
+            if self.is_pool_stopped or job.src_path in self.queued_paths:
+                return
+            self.queued_paths.add(job.src_path)
+            self.backlog_jobs.append(job)
+            self.pool_cond.notify_all()
+
+    def is_backlog_ready(self):
+        return self.backlog_jobs and \
+               self.backlog_running < self.shaper.get_backlog_workers()
+
+    def dequeue_job(self):
+        '''
+        Returns the next job to run, None when the pool is stopped. The new
+        files are picked before the backlog.
+        '''
+        with self.pool_cond:
+            while not self.ready_cams and not self.is_backlog_ready() and \
+                not self.is_pool_stopped:
+                self.pool_cond.wait()
+            if self.is_pool_stopped:
+                return None
+            if not self.ready_cams:
+                self.backlog_running += 1
+                return self.backlog_jobs.popleft()
+            cam_name = self.shaper.pick_camera(self.ready_cams)
+            self.ready_cams.remove(cam_name)
+            return self.cam_jobs[cam_name].popleft()
+
+    def job_done(self, job, relay_states):
+        with self.pool_cond:
+            self.queued_paths.discard(job.src_path)
+            if not job.is_live:
+                self.backlog_running -= 1
+                if any(relay_state in (enum_relayState.CONST_RELAY_DONE,
+                                       enum_relayState.CONST_RELAY_SKIPPED)
+                       for relay_state in relay_states.values()):
+                    self.backlog_progress = True
+                if not self.backlog_jobs and not self.backlog_running and \
+                    self.backlog_progress:
+                    # Backlog is moving, get the next batch right away.
+                    self.backlog_event.set()
+                self.pool_cond.notify_all()
+                return
+            self.job_cnt -= 1
+            if self.cam_jobs[job.cam_name]:
+                # Next file of the camera is ready to pick.
+                self.shaper.camera_ready(job.cam_name)
+                self.ready_cams.append(job.cam_name)
+            else:
+                del self.cam_jobs[job.cam_name]
+                self.sched_cams.discard(job.cam_name)
+            self.pool_cond.notify_all()
+
+    def run_worker(self, ftp_obj):
+        while True:
+            job = self.dequeue_job()
+            if job is None:
+                break
+            # The webservers deleted after the job is queued are left out.
+            dests = self.get_dests(job.server_ids)
+            relay_states = {dest.server_id : enum_relayState.CONST_RELAY_FAILED
+                            for dest in dests}
+            try:
+                for dest in dests:
+                    self.journal.set_file_state(job.src_path, dest.server_id,
+                                        enum_relayState.CONST_RELAY_UPLOADING)
+                relay_states.update(ftp_obj.relay_file(job.src_path, dests,
+                                                       job.is_live))
+            except Exception as e:
+                self.nv_log_handler.error("Failed to relay %s, %s",
+                                          job.src_path, e)
+            finally:
+                for server_id, relay_state in relay_states.items():
+                    self.journal.set_file_state(job.src_path, server_id,
+                                                relay_state)
+                self.job_done(job, relay_states)
+            relay_state = self.journal.get_relay_state(job.src_path)
+            if relay_state is not None:
+                GBL_SEGMENT_CATALOG.set_relay_state(job.src_path, relay_state)
+
+    def is_file_cached(self, file_path):
+        '''
+        Check if most of the file is in page cache.
+        '''
+        try:
+            [cached_bytes, file_size] = \
+                            self.os_context.get_file_cache_residency(file_path)
+        except OSError:
+            return False
+        return cached_bytes is not None and cached_bytes * 2 >= file_size
+
+    def run_backlog(self):
+        '''
+        Queue the old files from relay journal to the backlog, one batch at a
+        time. The next batch is read when the current batch is copied, or
+        after NV_RELAY_BACKLOG_INTERVAL when the copy is not progressing.
+        '''
+        reset_uploading = True
+        while not self.is_pool_stopped:
+            if self.is_dests_changed:
+                self.is_dests_changed = False
+                self.journal.reconcile_journal(self.get_dest_ids(),
+                                               reset_uploading)
+                reset_uploading = False
+            self.backlog_event.wait(NV_RELAY_BACKLOG_INTERVAL)
+            self.backlog_event.clear()
+            with self.pool_cond:
+                if self.is_pool_stopped:
+                    break
+                if self.backlog_jobs or self.backlog_running:
+                    continue
+                self.backlog_progress = False
+                # The new files waiting in queue are in the journal too, for
+                # every webserver.
+                limit = NV_RELAY_BACKLOG_BATCH + \
+                        len(self.queued_paths) * len(self.dests)
+            if not self.dests:
+                continue
+            backlog = self.journal.get_backlog(limit)
+            # The files of the batch still in page cache are copied first,
+            # before they are evicted.
+            backlog.sort(key = lambda entry : not self.is_file_cached(entry[0]))
+            for [file_path, cam_name, server_ids] in backlog:
+                self.enqueue_backlog_job(relay_job(cam_name, file_path,
+                                                   server_ids,
+                                                   is_live = False))
+
+    def get_relay_stats(self):
+        '''
+        Returns the relay queue depth, the achieved rate and the bytes read
+        from page cache/disk of every camera,
+        { 'camera1' : {'queued' : <new files to copy>,
+                       'backlog' : <old files to copy>,
+                       'rate' : <bytes/sec>, 'bytes' : <total bytes>,
+                       'cache_bytes' : <bytes read from page cache>,
+                       'disk_bytes' : <bytes read from disk>,
+                       'evicted_files' : <files deleted by retention>,
+                       'evicted_bytes' : <bytes deleted by retention>} }
+        '''
+        cam_stats = {}
+        with self.pool_cond:
+            for cam_name, jobs in self.cam_jobs.items():
+                cam_stats[cam_name] = {"queued" : len(jobs), "backlog" : 0}
+            for job in self.backlog_jobs:
+                cam_stats.setdefault(job.cam_name, {"queued" : 0,
+                                                    "backlog" : 0})
+                cam_stats[job.cam_name]["backlog"] += 1
+        for cam_name, cam_rate in self.shaper.get_cam_rates().items():
+            cam_stats.setdefault(cam_name, {"queued" : 0, "backlog" : 0})
+            cam_stats[cam_name].update(cam_rate)
+        for cam_name, cache_stats in \
+            self.cache_stats.get_cam_cache_stats().items():
+            cam_stats.setdefault(cam_name, {"queued" : 0, "backlog" : 0})
+            cam_stats[cam_name].update(cache_stats)
+        for cam_name, evict_stats in \
+            self.retention_mgr.get_cam_evict_stats().items():
+            cam_stats.setdefault(cam_name, {"queued" : 0, "backlog" : 0})
+            cam_stats[cam_name].update(evict_stats)
+        for cam_name in cam_stats:
+            cam_stats[cam_name].setdefault("rate", 0.0)
+            cam_stats[cam_name].setdefault("bytes", 0)
+            cam_stats[cam_name].setdefault("cache_bytes", 0)
+            cam_stats[cam_name].setdefault("disk_bytes", 0)
+            cam_stats[cam_name].setdefault("evicted_files", 0)
+            cam_stats[cam_name].setdefault("evicted_bytes", 0)
+        return cam_stats
+
+    def stop_workers(self):
+        '''
+        Stop the workers after they complete the current copy. The pending
+        jobs are dropped.
+        '''
+        with self.pool_cond:
+            self.is_pool_stopped = True
+            if self.job_cnt:
+                self.nv_log_handler.info("Dropping %d pending relay jobs, "
+                                         "they are copied from relay journal "
+                                         "on next start", self.job_cnt)
+            self.pool_cond.notify_all()
+        self.backlog_event.set()
+        self.retention_mgr.stop_retention()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        if self.backlog_thread is not None:
+            self.backlog_thread.join()
+            self.backlog_thread = None
+        self.update_webservers([])
 
 class relay_watcher(FileSystemEventHandler):
     '''
-    The watcher notified when a file change event happened. 
+    The watcher notified when a file change event happened. The files are
+    copied by the relay worker pool.
     '''
     def __init__(self):
         self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
-        self.websrv = None
-        self.ftp_obj = relay_ftp_handler()
+        self.os_context = nv_os_lib()
+        self.worker_pool = relay_worker_pool()
         self.is_relay_thread_killed = False # flag for tracking user kill.
 
+    def start_relay_workers(self):
+        self.webserver_changed()
+        self.worker_pool.start_workers()
+
+    def webserver_changed(self):
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            websrv_list = list(db_mgr_obj.get_webserver_records())
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the webservers, %s", e)
+            return
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+        self.worker_pool.update_webservers(websrv_list)
+
+    def get_relay_stats(self):
+        return self.worker_pool.get_relay_stats()
+
     def kill_relay_thread(self):
         '''
-        Function to kill the relay thread gracefully. It waits until the thread
-        completes the current execution before initiate the kill.
+        Function to kill the relay thread gracefully. It waits until the
+        workers complete the current copy before initiate the kill.
         '''
         self.nv_log_handler.debug("Stopping the relay thread..")
         self.is_relay_thread_killed = True
-        GBL_NV_SYNC_OBJ.mutex_lock(RELAY_MUTEX_NAME)
-            # Wait until current relay thread completes its processing.
-        try:
-            self.ftp_obj.kill_ftp_session()
-        except:
-            self.nv_log_handler.error("Failed to close the ftp session properly")
-        finally:
-            GBL_NV_SYNC_OBJ.mutex_unlock(RELAY_MUTEX_NAME)
+        self.worker_pool.stop_workers()
 
     def is_relay_thread_active(self):
         '''
@@ -337,57 +887,52 @@ class relay_watcher(FileSystemEventHandler):
         '''
         return self.is_relay_thread_killed
 
-    def process(self, event):
-        """
-        event.event_type 
-            'modified' | 'created' | 'moved' | 'deleted'
-        event.is_directory
-            True | False
-        event.src_path
-            path/to/observed/file
-        """
-        pass
-        # the file will be processed there
-    #    print(event.src_path, event.event_type)  # print now only for degug
-
-    #def on_modified(self, event):
-    #    self.process(event)
-
-    def on_created(self, event):
+    def on_closed(self, event):
         '''
-        On a file creation, change the thread state to busy to avoid premature
-        thread close. Close the thread only when there is no event to be
-        handled.
+        On closing a file after writing, the file is complete and ready to
+        copy. The streaming threads close the file at the end of every video
+        snip, including the last one when the stream is stopped.
+        The file is queued to the relay workers, the observer thread never
+        waits on the copy.
         '''
+        if event.is_directory:
+            return
         if(self.is_relay_thread_active()):
             #Kill signal issued, nothing to do.
             self.nv_log_handler.debug("Kill signal issued, no file copy")
             return
-        GBL_NV_SYNC_OBJ.mutex_lock(RELAY_MUTEX_NAME)
+        if not relay_ftp_handler.is_media_file(event.src_path):
+            return
+        # The camera folder name in the absolute path.
+        cam_name = self.os_context.get_last_filename(
+                                    self.os_context.get_dirname(event.src_path))
         try:
-            # Check if the webserver local, copy the file to a specified location
-            self.websrv = db_mgr_obj.get_webserver_record()
-            if not self.websrv:
-                self.nv_log_handler.error("Webserver is not configured")
-                return
-            is_local_wbs = self.ftp_obj.is_webserver_local(self.websrv)
-            if is_local_wbs:
-                cam_src_path = event.src_path
-                self.ftp_obj.local_file_transfer(cam_src_path, self.websrv)
-            else:
-                # The server is remote and need to do the scp over network
-                self.ftp_obj.remote_file_transfer(event.src_path, self.websrv)
-        except:
-            raise
-        finally:
-            #    self.process(event)
-            GBL_NV_SYNC_OBJ.mutex_unlock(RELAY_MUTEX_NAME)
-
-    #def on_deleted(self,event):
-    #    self.process(event)
+            file_stat = os.stat(event.src_path)
+            GBL_SEGMENT_CATALOG.add_segment(event.src_path, cam_name,
+                                            file_stat.st_size,
+                                            file_stat.st_mtime)
+        except OSError:
+            # Deleted already, for eg: the last file of a stopped recording.
+            return
+        server_ids = self.worker_pool.get_dest_ids()
+        if not server_ids:
+            # Journaled when a webserver is configured.
+            self.nv_log_handler.error("Webserver is not configured")
+            return
+        # Journal the file first, its copied later if the copy cannot be done
+        # now.
+        self.worker_pool.journal.add_file(event.src_path, cam_name, server_ids)
+        self.worker_pool.enqueue_job(relay_job(cam_name, event.src_path,
+                                               server_ids))
 
-    #def on_any_event(self,event):
-    #    self.process(event)
+    def on_deleted(self, event):
+        '''
+        A deleted video file is removed from the segment catalog.
+        '''
+        if event.is_directory or \
+            not relay_ftp_handler.is_media_file(event.src_path):
+            return
+        GBL_SEGMENT_CATALOG.remove_segments([event.src_path])
 
 class relay_main():
     '''
@@ -409,6 +954,7 @@ class relay_main():
                 self.nv_log_handler.error("%s Directory not found",
                                           NV_MID_BOX_CAM_STREAM_DIR)
                 raise FileNotFoundError
+            self.watcher_obj.start_relay_workers()
             self.observer_obj.schedule(self.watcher_obj, NV_MID_BOX_CAM_STREAM_DIR,
                                        recursive=True)
             self.observer_obj.start()
@@ -417,6 +963,12 @@ class relay_main():
         except Exception as e:
             raise e
 
+    def relay_webserver_changed(self):
+        self.watcher_obj.webserver_changed()
+
+    def get_relay_stats(self):
+        return self.watcher_obj.get_relay_stats()
+
     def relay_stop(self):
         self.watcher_obj.kill_relay_thread()
         self.observer_obj.stop()
@@ -0,0 +1,236 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The relay journal module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import os
+import time
+from src.nv_logger import nv_logger
+from src.nvdb.nvdb_manager import db_mgr_obj
+from src.nvdb.nvdb_manager import nv_relay_journal, enum_relayState
+from src.settings import NV_MID_BOX_CAM_STREAM_DIR
+from src.settings import NV_RELAY_MAX_ATTEMPTS, NV_RELAY_RETRY_DELAY
+
+class relay_journal():
+    '''
+    The persistent journal of video files to relay, kept in the nvdb. Every
+    file closed by the streaming threads is journaled for every webserver
+    before its copied, the files not copied to a webserver due to a middlebox
+    restart or webserver outage are found in the journal and copied later.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+
+    def add_file(self, file_path, cam_name, server_ids, file_time = None):
+        '''
+        Add a new file to the journal in pending state for the webservers
+        'server_ids', nothing to do for a webserver its already journaled.
+        '''
+        if file_time is None:
+            file_time = time.time()
+        try:
+            db_mgr_obj.db_start_transaction()
+            for server_id in server_ids:
+                if db_mgr_obj.get_relay_journal_entry(file_path,
+                                                      server_id) is not None:
+                    continue
+                db_mgr_obj.add_record(nv_relay_journal(file_path = file_path,
+                                server_id = server_id,
+                                cam_name = cam_name,
+                                state = enum_relayState.CONST_RELAY_PENDING,
+                                attempts = 0,
+                                file_time = file_time,
+                                update_time = time.time()))
+            db_mgr_obj.db_commit()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to journal the file %s, %s",
+                                      file_path, e)
+        finally:
+            db_mgr_obj.db_end_transaction()
+
+    def set_file_state(self, file_path, server_id, state):
+        '''
+        Update the relay state of a file to a webserver, every failed copy is
+        counted as an attempt. The entry is removed when the file is deleted.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction()
+            entry = db_mgr_obj.get_relay_journal_entry(file_path, server_id)
+            if entry is None:
+                return
+            if state == enum_relayState.CONST_RELAY_FAILED and \
+                not os.path.exists(file_path):
+                self.nv_log_handler.info("%s is deleted, removing from "
+                                         "relay journal", file_path)
+                db_mgr_obj.delete_record(entry)
+            else:
+                if state == enum_relayState.CONST_RELAY_FAILED:
+                    entry.attempts += 1
+                entry.state = state
+                entry.update_time = time.time()
+            db_mgr_obj.db_commit()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to update the relay state of %s"
+                                      ", %s", file_path, e)
+        finally:
+            db_mgr_obj.db_end_transaction()
+
+    def get_backlog(self, limit):
+        '''
+        Returns the oldest files yet to be copied, upto 'limit' copies, as
+        [[file_path, cam_name, [server_id, ...]], ...]. A file is returned
+        once with all the webservers its yet to be copied. A failed file is
+        retried only after NV_RELAY_RETRY_DELAY.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            backlog = []
+            backlog_files = {}
+            for entry in db_mgr_obj.get_relay_journal_backlog(
+                                        NV_RELAY_MAX_ATTEMPTS,
+                                        time.time() - NV_RELAY_RETRY_DELAY,
+                                        limit):
+                if entry.file_path not in backlog_files:
+                    backlog_files[entry.file_path] = [entry.file_path,
+                                                      entry.cam_name, []]
+                    backlog.append(backlog_files[entry.file_path])
+                backlog_files[entry.file_path][2].append(entry.server_id)
+            return backlog
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the relay backlog, %s",
+                                      e)
+            return []
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+
+    def get_file_states(self):
+        '''
+        Returns the relay state of all the journaled files for every
+        webserver, { file_path : { server_id : enum_relayState } }, None on
+        failure.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            return db_mgr_obj.get_relay_journal_states()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the relay journal, %s",
+                                      e)
+            return None
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+
+    def get_relay_state(self, file_path):
+        '''
+        Returns the relay state of a file for all the webservers, DONE when
+        its copied to all of them, FAILED when any copy failed and PENDING
+        otherwise. None on failure.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            relay_states = set(db_mgr_obj.get_relay_journal_file_states(
+                                                        file_path).values())
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the relay state of %s, "
+                                      "%s", file_path, e)
+            return None
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+        if not relay_states:
+            return None
+        if relay_states == {enum_relayState.CONST_RELAY_SKIPPED}:
+            return enum_relayState.CONST_RELAY_SKIPPED
+        if relay_states <= {enum_relayState.CONST_RELAY_DONE,
+                            enum_relayState.CONST_RELAY_SKIPPED}:
+            return enum_relayState.CONST_RELAY_DONE
+        if enum_relayState.CONST_RELAY_FAILED in relay_states:
+            return enum_relayState.CONST_RELAY_FAILED
+        return enum_relayState.CONST_RELAY_PENDING
+
+    def remove_files(self, file_paths):
+        '''
+        Remove the deleted files from journal.
+        '''
+        try:
+            db_mgr_obj.db_start_transaction()
+            db_mgr_obj.del_relay_journal_files(file_paths)
+            db_mgr_obj.db_commit()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to remove %d files from relay "
+                                      "journal, %s", len(file_paths), e)
+        finally:
+            db_mgr_obj.db_end_transaction()
+
+    def reconcile_journal(self, server_ids, reset_uploading = False):
+        '''
+        Journal the video files in the camera stream directory that are not in
+        journal yet for the webservers 'server_ids', for eg: the files closed
+        while relay was not running or before a webserver is added.
+        The files that were being copied at exit are copied again, when
+        'reset_uploading' is set at the relay start.
+        '''
+        # The directories are scanned without the DB lock, the scan can take
+        # long on a large stream directory.
+        try:
+            db_mgr_obj.db_start_transaction(read_only = True)
+            journal_keys = db_mgr_obj.get_relay_journal_keys()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to read the relay journal, %s", e)
+            return
+        finally:
+            db_mgr_obj.db_end_transaction(read_only = True)
+        scan_files = []
+        try:
+            with os.scandir(NV_MID_BOX_CAM_STREAM_DIR) as cam_dirs:
+                for cam_dir in cam_dirs:
+                    if not cam_dir.is_dir(follow_symlinks = False):
+                        continue
+                    with os.scandir(cam_dir.path) as cam_files:
+                        for cam_file in cam_files:
+                            if not cam_file.name.endswith('.mp4') or \
+                                not cam_file.is_file(follow_symlinks = False):
+                                continue
+                            if all((cam_file.path, server_id) in journal_keys
+                                   for server_id in server_ids):
+                                continue
+                            try:
+                                file_time = cam_file.stat().st_mtime
+                            except FileNotFoundError:
+                                continue
+                            scan_files.append((cam_file.path, cam_dir.name,
+                                               file_time))
+        except Exception as e:
+            self.nv_log_handler.error("Failed to scan the camera stream "
+                                      "directory, %s", e)
+            return
+        new_files = []
+        try:
+            db_mgr_obj.db_start_transaction()
+            if reset_uploading:
+                db_mgr_obj.reset_relay_journal_uploading()
+            # Files journaled by the relay while scanning.
+            journal_keys = db_mgr_obj.get_relay_journal_keys()
+            for file_path, cam_name, file_time in scan_files:
+                new_files.extend(nv_relay_journal(
+                                file_path = file_path,
+                                server_id = server_id,
+                                cam_name = cam_name,
+                                state = enum_relayState.CONST_RELAY_PENDING,
+                                attempts = 0,
+                                file_time = file_time,
+                                update_time = time.time())
+                                for server_id in server_ids
+                                if (file_path, server_id) not in journal_keys)
+            db_mgr_obj.add_records(new_files)
+            db_mgr_obj.db_commit()
+        except Exception as e:
+            self.nv_log_handler.error("Failed to reconcile the relay journal,"
+                                      " %s", e)
+            return
+        finally:
+            db_mgr_obj.db_end_transaction()
+        self.nv_log_handler.info("%d unrelayed file copies added to relay "
+                                 "journal", len(new_files))
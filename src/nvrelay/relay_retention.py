@@ -0,0 +1,251 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The video file retention module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import os
+import time
+from threading import Thread, Event, Lock
+from src.nv_logger import nv_logger
+from src.nv_lib.nv_os_lib import nv_os_lib
+from src.nvdb.nvdb_manager import enum_relayState
+from src.settings import NV_MID_BOX_CAM_STREAM_DIR
+from src.settings import NV_RETENTION_INTERVAL, NV_RETENTION_UNRELAYED_GRACE
+from src.settings import NV_RETENTION_MAX_AGE, NV_RETENTION_TOTAL_QUOTA
+from src.settings import NV_RETENTION_CAM_QUOTAS, NV_RETENTION_CAM_QUOTA
+from src.settings import NV_RETENTION_FREE_LOW_PCT, NV_RETENTION_FREE_HIGH_PCT
+
+class retention_file():
+    '''
+    A video file in the camera stream directory.
+    '''
+    def __init__(self, file_path, cam_name, file_size, file_time, is_relayed):
+        self.file_path = file_path
+        self.cam_name = cam_name
+        self.file_size = file_size
+        self.file_time = file_time
+        self.is_relayed = is_relayed
+
+    def get_evict_order(self):
+        '''
+        The relayed files are deleted first, oldest first.
+        '''
+        return (not self.is_relayed, self.file_time)
+
+class relay_retention_mgr():
+    '''
+    Delete the video files in the camera stream directory to keep the disk
+    usage bounded. Every NV_RETENTION_INTERVAL the files are deleted,
+    - when older than NV_RETENTION_MAX_AGE.
+    - when a camera uses more than its quota.
+    - when all the cameras use more than NV_RETENTION_TOTAL_QUOTA.
+    - when the free space on disk is below NV_RETENTION_FREE_LOW_PCT, until
+      its NV_RETENTION_FREE_HIGH_PCT.
+    The files copied to all the webservers are deleted first, oldest first. A
+    file not copied yet is deleted only after NV_RETENTION_UNRELAYED_GRACE and
+    never when its queued to copy.
+    '''
+    RELAYED_STATES = (enum_relayState.CONST_RELAY_DONE,
+                      enum_relayState.CONST_RELAY_SKIPPED)
+
+    def __init__(self, worker_pool):
+        '''
+        @param worker_pool: The relay worker pool, for the webservers and the
+                            files queued to copy.
+        '''
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.os_context = nv_os_lib()
+        self.worker_pool = worker_pool
+        self.journal = worker_pool.journal
+        self.stop_event = Event()
+        self.retention_thread = None
+        # Files deleted of every camera,
+        # { 'camera1' : {'evicted_files' : 10, 'evicted_bytes' : 1200} }
+        self.cam_evict_dic = {}
+        self.stats_lock = Lock()
+
+    @staticmethod
+    def get_cam_quota(cam_name):
+        return NV_RETENTION_CAM_QUOTAS.get(cam_name, NV_RETENTION_CAM_QUOTA)
+
+    def is_file_relayed(self, file_states, file_path, server_ids):
+        '''
+        Check if the file is copied to all the webservers, a file is never
+        relayed when there is no webserver.
+        '''
+        relay_states = file_states.get(file_path, {})
+        return bool(server_ids) and \
+               all(relay_states.get(server_id) in self.RELAYED_STATES
+                   for server_id in server_ids)
+
+    def scan_cam_files(self, file_states, server_ids):
+        '''
+        Returns the video files of every camera in the order to delete,
+        { 'camera1' : [retention_file_obj, ...] }
+        '''
+        cam_files = {}
+        with os.scandir(NV_MID_BOX_CAM_STREAM_DIR) as cam_dirs:
+            for cam_dir in cam_dirs:
+                if not cam_dir.is_dir(follow_symlinks = False):
+                    continue
+                file_list = []
+                with os.scandir(cam_dir.path) as cam_entries:
+                    for cam_entry in cam_entries:
+                        if not cam_entry.name.endswith('.mp4') or \
+                            not cam_entry.is_file(follow_symlinks = False):
+                            continue
+                        try:
+                            file_stat = cam_entry.stat(follow_symlinks = False)
+                        except FileNotFoundError:
+                            continue
+                        file_list.append(retention_file(cam_entry.path,
+                                cam_dir.name,
+                                file_stat.st_size,
+                                file_stat.st_mtime,
+                                self.is_file_relayed(file_states,
+                                                     cam_entry.path,
+                                                     server_ids)))
+                file_list.sort(key = retention_file.get_evict_order)
+                cam_files[cam_dir.name] = file_list
+        return cam_files
+
+    def is_file_evictable(self, evict_file, now):
+        if not evict_file.is_relayed and \
+            now - evict_file.file_time < NV_RETENTION_UNRELAYED_GRACE:
+            return False
+        return not self.worker_pool.is_file_queued(evict_file.file_path)
+
+    def evict_bytes(self, file_list, evict_size, evict_set, now):
+        '''
+        Mark the files in 'file_list' to delete in the order, until
+        'evict_size' bytes are freed. Returns the bytes not freed.
+        '''
+        for evict_file in file_list:
+            if evict_size <= 0:
+                break
+            if evict_file.file_path in evict_set or \
+                not self.is_file_evictable(evict_file, now):
+                continue
+            evict_set.add(evict_file.file_path)
+            evict_size -= evict_file.file_size
+        return max(evict_size, 0)
+
+    def get_evict_error(self, file_list, evict_set):
+        '''
+        Returns the reason the files in 'file_list' could not free the bytes.
+        '''
+        if any(evict_file.file_path not in evict_set
+               for evict_file in file_list):
+            return "the files are not relayed yet"
+        return "no more files to delete"
+
+    def find_evict_files(self, cam_files, now):
+        '''
+        Returns the set of files to delete.
+        '''
+        evict_set = set()
+        all_files = []
+        for cam_name, file_list in cam_files.items():
+            all_files.extend(file_list)
+            if NV_RETENTION_MAX_AGE:
+                for evict_file in file_list:
+                    if now - evict_file.file_time > NV_RETENTION_MAX_AGE and \
+                        self.is_file_evictable(evict_file, now):
+                        evict_set.add(evict_file.file_path)
+            cam_quota = self.get_cam_quota(cam_name)
+            if not cam_quota:
+                continue
+            cam_size = sum(evict_file.file_size for evict_file in file_list
+                           if evict_file.file_path not in evict_set)
+            if self.evict_bytes(file_list, cam_size - cam_quota, evict_set,
+                                now):
+                self.nv_log_handler.error("Camera %s is over its quota, %s",
+                                cam_name,
+                                self.get_evict_error(file_list, evict_set))
+        all_files.sort(key = retention_file.get_evict_order)
+        scan_size = sum(evict_file.file_size for evict_file in all_files)
+        total_size = sum(evict_file.file_size for evict_file in all_files
+                         if evict_file.file_path not in evict_set)
+        if NV_RETENTION_TOTAL_QUOTA and \
+            self.evict_bytes(all_files, total_size - NV_RETENTION_TOTAL_QUOTA,
+                             evict_set, now):
+            self.nv_log_handler.error("Cameras are over the total quota, %s",
+                                self.get_evict_error(all_files, evict_set))
+        [disk_size, free_size] = self.os_context.get_disk_space(
+                                                    NV_MID_BOX_CAM_STREAM_DIR)
+        # The files picked to delete are still on disk, count them as free.
+        free_size += scan_size - \
+                     sum(evict_file.file_size for evict_file in all_files
+                         if evict_file.file_path not in evict_set)
+        if free_size * 100 < disk_size * NV_RETENTION_FREE_LOW_PCT and \
+            self.evict_bytes(all_files,
+                             disk_size * NV_RETENTION_FREE_HIGH_PCT // 100 -
+                             free_size, evict_set, now):
+            self.nv_log_handler.error("Free disk space is below %d%%, %s",
+                                NV_RETENTION_FREE_HIGH_PCT,
+                                self.get_evict_error(all_files, evict_set))
+        return [evict_file for evict_file in all_files
+                if evict_file.file_path in evict_set]
+
+    def enforce_retention(self):
+        now = time.time()
+        file_states = self.journal.get_file_states()
+        if file_states is None:
+            return
+        server_ids = self.worker_pool.get_dest_ids()
+        evict_files = self.find_evict_files(
+                            self.scan_cam_files(file_states, server_ids), now)
+        removed_paths = []
+        unrelayed_cnt = 0
+        for evict_file in evict_files:
+            try:
+                os.remove(evict_file.file_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.nv_log_handler.error("Failed to delete %s, %s",
+                                          evict_file.file_path, e)
+                continue
+            removed_paths.append(evict_file.file_path)
+            if not evict_file.is_relayed:
+                unrelayed_cnt += 1
+            with self.stats_lock:
+                cam_stats = self.cam_evict_dic.setdefault(evict_file.cam_name,
+                                    {"evicted_files" : 0, "evicted_bytes" : 0})
+                cam_stats["evicted_files"] += 1
+                cam_stats["evicted_bytes"] += evict_file.file_size
+        if not removed_paths:
+            return
+        self.journal.remove_files(removed_paths)
+        self.nv_log_handler.info("Deleted %d video files, %d of them not "
+                                 "relayed", len(removed_paths), unrelayed_cnt)
+
+    def run_retention(self):
+        while not self.stop_event.wait(NV_RETENTION_INTERVAL):
+            try:
+                self.enforce_retention()
+            except Exception as e:
+                self.nv_log_handler.error("Failed to delete the old video "
+                                          "files, %s", e)
+
+    def start_retention(self):
+        self.stop_event.clear()
+        self.retention_thread = Thread(name = "nv_relay_retention",
+                                       target = self.run_retention)
+        self.retention_thread.daemon = True
+        self.retention_thread.start()
+
+    def stop_retention(self):
+        self.stop_event.set()
+        if self.retention_thread is not None:
+            self.retention_thread.join()
+            self.retention_thread = None
+
+    def get_cam_evict_stats(self):
+        with self.stats_lock:
+            return {cam_name : dict(cam_stats) for cam_name, cam_stats in
+                    self.cam_evict_dic.items()}
@@ -0,0 +1,200 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The relay bandwidth shaping module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import math
+import time
+from datetime import datetime
+from threading import Lock
+from src.nv_logger import nv_logger
+from src.settings import NV_RELAY_RATE_LIMIT, NV_RELAY_RATE_BURST
+from src.settings import NV_RELAY_BACKLOG_RATE, NV_RELAY_BULK_WINDOWS
+from src.settings import NV_RELAY_CAM_WEIGHTS, NV_RELAY_CAM_PRIORITIES
+from src.settings import NV_RELAY_WORKERS, NV_RELAY_BACKLOG_WORKERS
+
+class relay_token_bucket():
+    '''
+    Token bucket to limit the upload rate to 'rate' bytes/sec, upto 'burst'
+    bytes can be sent at once. No limit when 'rate' is 0.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_time = time.monotonic()
+        self.bucket_lock = Lock()
+
+    def take_tokens(self, nbytes):
+        '''
+        Take the tokens to send 'nbytes', returns the time to wait before
+        sending them. The tokens are taken right away even when not enough in
+        the bucket, the next sender waits for them to refill. So the senders
+        are served in the order they asked.
+        '''
+        if not self.rate:
+            return 0
+        with self.bucket_lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= nbytes
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+class relay_rate_meter():
+    '''
+    The achieved rate of a camera, in bytes/sec. The rate is decayed
+    exponentially over RATE_PERIOD, so its the rate of recent uploads.
+    '''
+    RATE_PERIOD = 10  # 10 sec
+
+    def __init__(self):
+        self.rate = 0.0
+        self.total_bytes = 0
+        self.last_time = time.monotonic()
+
+    def decay_rate(self, now):
+        self.rate *= math.exp(-(now - self.last_time) / self.RATE_PERIOD)
+        self.last_time = now
+
+    def add_bytes(self, nbytes):
+        self.decay_rate(time.monotonic())
+        self.rate += nbytes / self.RATE_PERIOD
+        self.total_bytes += nbytes
+
+    def get_rate(self):
+        self.decay_rate(time.monotonic())
+        return self.rate
+
+class relay_shaper():
+    '''
+    Shape the relay uploads to the webserver, so that a burst of files or the
+    backlog copy never saturates the uplink of the site.
+    - All the remote uploads are limited to NV_RELAY_RATE_LIMIT together.
+    - The backlog uploads are limited to NV_RELAY_BACKLOG_RATE, except in the
+      bulk copy windows NV_RELAY_BULK_WINDOWS. In a bulk copy window the
+      backlog can use all the relay workers and the full rate.
+    - The camera to copy next is picked by the camera priority first, a
+      higher priority camera is always copied before the lower ones. The
+      cameras with same priority share the relay by their weight, in weighted
+      fair queuing order.
+    '''
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.relay_bucket = relay_token_bucket(NV_RELAY_RATE_LIMIT,
+                                               NV_RELAY_RATE_BURST)
+        self.backlog_bucket = relay_token_bucket(NV_RELAY_BACKLOG_RATE,
+                                                 NV_RELAY_RATE_BURST)
+        # Bytes copied by every camera scaled by its weight,
+        # { 'camera1' : 1200.5, 'camera2' : 800.0 }
+        self.cam_vtime = {}
+        # Virtual time of the last camera picked.
+        self.sys_vtime = 0.0
+        # Achieved rate of every camera, { 'camera1' : relay_rate_meter_obj }
+        self.cam_rate = {}
+        self.shaper_lock = Lock()
+        # Parse the windows once, [[start_min, end_min], ...]
+        self.bulk_windows = [[self.get_day_minute(start),
+                              self.get_day_minute(end)]
+                             for [start, end] in NV_RELAY_BULK_WINDOWS]
+
+    @staticmethod
+    def get_day_minute(time_str):
+        '''
+        Returns the minute of the day of 'HH:MM'.
+        '''
+        hour, minute = time_str.split(':')
+        return int(hour) * 60 + int(minute)
+
+    def is_bulk_window(self):
+        '''
+        Check if its a bulk copy window now. A window can wrap around midnight,
+        for eg: ['22:00', '06:00'].
+        '''
+        now = datetime.now()
+        day_minute = now.hour * 60 + now.minute
+        for [start, end] in self.bulk_windows:
+            if start <= end:
+                if start <= day_minute < end:
+                    return True
+            elif day_minute >= start or day_minute < end:
+                return True
+        return False
+
+    def get_backlog_workers(self):
+        '''
+        Returns the number of workers can copy the backlog at a time.
+        '''
+        if self.is_bulk_window():
+            return NV_RELAY_WORKERS
+        return NV_RELAY_BACKLOG_WORKERS
+
+    @staticmethod
+    def get_cam_weight(cam_name):
+        return max(NV_RELAY_CAM_WEIGHTS.get(cam_name, 1), 0.01)
+
+    @staticmethod
+    def get_cam_priority(cam_name):
+        return NV_RELAY_CAM_PRIORITIES.get(cam_name, 0)
+
+    def camera_ready(self, cam_name):
+        '''
+        A camera has a file to copy. A camera idle for a while doesnt get the
+        unused share of its idle time.
+        '''
+        with self.shaper_lock:
+            self.cam_vtime[cam_name] = max(self.cam_vtime.get(cam_name, 0.0),
+                                           self.sys_vtime)
+
+    def pick_camera(self, ready_cams):
+        '''
+        Returns the camera to copy next from 'ready_cams', the highest
+        priority camera that got the least share of the relay.
+        '''
+        with self.shaper_lock:
+            cam_name = min(ready_cams,
+                           key = lambda cam : (-self.get_cam_priority(cam),
+                                               self.cam_vtime.get(cam, 0.0)))
+            self.sys_vtime = max(self.sys_vtime,
+                                 self.cam_vtime.get(cam_name, 0.0))
+            return cam_name
+
+    def account_bytes(self, cam_name, nbytes):
+        '''
+        Count the bytes copied for a camera, for its share and rate.
+        '''
+        with self.shaper_lock:
+            self.cam_vtime[cam_name] = self.cam_vtime.get(cam_name, 0.0) + \
+                                       nbytes / self.get_cam_weight(cam_name)
+            if cam_name not in self.cam_rate:
+                self.cam_rate[cam_name] = relay_rate_meter()
+            self.cam_rate[cam_name].add_bytes(nbytes)
+
+    def throttle_upload(self, cam_name, is_live, nbytes):
+        '''
+        Wait until 'nbytes' of a camera can be uploaded to the webserver.
+        '''
+        wait_time = self.relay_bucket.take_tokens(nbytes)
+        if not is_live and not self.is_bulk_window():
+            wait_time = max(wait_time,
+                            self.backlog_bucket.take_tokens(nbytes))
+        if wait_time:
+            time.sleep(wait_time)
+        self.account_bytes(cam_name, nbytes)
+
+    def get_cam_rates(self):
+        '''
+        Returns the achieved rate and bytes copied of every camera,
+        { 'camera1' : {'rate' : <bytes/sec>, 'bytes' : <total bytes>} }
+        '''
+        with self.shaper_lock:
+            return {cam_name : {"rate" : rate_meter.get_rate(),
+                                "bytes" : rate_meter.total_bytes}
+                    for cam_name, rate_meter in self.cam_rate.items()}
@@ -0,0 +1,92 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The striped upload tuning module for nv-middlebox.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+from threading import Lock
+from src.nv_logger import nv_logger
+from src.settings import NV_RELAY_STRIPE_MAX, NV_RELAY_STRIPE_MIN_SIZE
+from src.settings import NV_RELAY_STRIPE_MIN_RTT
+
+class relay_stripe_tuner():
+    '''
+    Find the number of stripes to upload a large file to the remote webserver
+    in parallel. A single sftp channel cannot fill a link with high round
+    trip time, more stripes are used as long as they give more throughput.
+    - No striping when the round trip time is below NV_RELAY_STRIPE_MIN_RTT,
+      a single channel fills a low latency link.
+    - The throughput is measured for every stripe count used. The stripe
+      count is increased while it gives atleast STRIPE_GAIN more throughput
+      than one stripe less, and decreased otherwise.
+    '''
+    # Smoothing factor of the measured round trip time and throughput.
+    EWMA_WEIGHT = 0.3
+    # Minimum throughput gain to use one more stripe.
+    STRIPE_GAIN = 1.1
+
+    def __init__(self):
+        self.nv_log_handler = nv_logger(self.__class__.__name__).get_logger()
+        self.rtt = None
+        # Throughput in MB/s for every stripe count, { 1 : 2.5, 2 : 4.8 }
+        self.stripe_mbps = {}
+        self.stripes = 1
+        self.tuner_lock = Lock()
+
+    def ewma(self, old_val, new_val):
+        if old_val is None:
+            return new_val
+        return old_val + self.EWMA_WEIGHT * (new_val - old_val)
+
+    def get_stripes(self, file_size):
+        '''
+        Returns the number of stripes to upload a file of 'file_size' bytes.
+        '''
+        with self.tuner_lock:
+            if file_size < NV_RELAY_STRIPE_MIN_SIZE or self.rtt is None or \
+                self.rtt < NV_RELAY_STRIPE_MIN_RTT:
+                return 1
+            return self.stripes
+
+    def update_stats(self, upload_stats):
+        '''
+        Update the tuner with the statistics of a completed upload, the
+        upload statistics returned by nv_os_lib remote_upload_file.
+        '''
+        with self.tuner_lock:
+            self.rtt = self.ewma(self.rtt, upload_stats["rtt"])
+            if upload_stats["bytes"] < NV_RELAY_STRIPE_MIN_SIZE:
+                # Small files never reach the full throughput.
+                return
+            used_stripes = upload_stats["stripes"]
+            self.stripe_mbps[used_stripes] = self.ewma(
+                                        self.stripe_mbps.get(used_stripes),
+                                        upload_stats["mbps"])
+            if self.rtt < NV_RELAY_STRIPE_MIN_RTT or \
+                used_stripes != self.stripes:
+                return
+            curr_mbps = self.stripe_mbps[self.stripes]
+            less_mbps = self.stripe_mbps.get(self.stripes - 1)
+            old_stripes = self.stripes
+            if less_mbps is not None and \
+                curr_mbps < less_mbps * self.STRIPE_GAIN:
+                self.stripes -= 1
+            elif self.stripes < NV_RELAY_STRIPE_MAX:
+                more_mbps = self.stripe_mbps.get(self.stripes + 1)
+                if more_mbps is None or \
+                    more_mbps >= curr_mbps * self.STRIPE_GAIN:
+                    self.stripes += 1
+            if self.stripes != old_stripes:
+                self.nv_log_handler.info("Uploading with %d stripes, rtt "
+                                         "%.1f ms, %.2f MB/s on %d stripes",
+                                         self.stripes, self.rtt * 1000,
+                                         curr_mbps, old_stripes)
+
+    def get_tuner_stats(self):
+        with self.tuner_lock:
+            return {"rtt" : self.rtt,
+                    "stripes" : self.stripes,
+                    "stripe_mbps" : dict(self.stripe_mbps)}
@@ -26,6 +26,201 @@ NV_CAM_VALID_FILE_SIZE_MB = 4   # 4MB
 # The minimum timeout woule be atleast 5 min.
 NV_CAM_CONN_TIMEOUT = 300  # 300 sec/5 min
 
+# Number of relay worker threads to copy the files to webserver in parallel.
+# The files of a camera are always copied in order, by one worker at a time.
+NV_RELAY_WORKERS = 4
+# Maximum number of files waiting to be copied to webserver. The relay stops
+# taking new files until a worker is free, when its full.
+NV_RELAY_QUEUE_LEN = 256
+
+# Every video file is journaled in the nvdb before the copy. The files not
+# copied, for eg: when the middlebox is restarted or the webserver is down,
+# are copied later from the journal, oldest file first.
+# A failed copy is retried after NV_RELAY_RETRY_DELAY, upto
+# NV_RELAY_MAX_ATTEMPTS times. Connection failures are not counted.
+NV_RELAY_MAX_ATTEMPTS = 5
+NV_RELAY_RETRY_DELAY = 60  # 60 sec
+# Maximum number of relay workers copying the old files at a time, rest of the
+# workers are always free for the new files.
+NV_RELAY_BACKLOG_WORKERS = 2
+# Number of old files read from the journal at a time.
+NV_RELAY_BACKLOG_BATCH = 32
+# Interval to check the journal for old files, when there is no progress.
+NV_RELAY_BACKLOG_INTERVAL = 30  # 30 sec
+
+# The video files in NV_MID_BOX_CAM_STREAM_DIR are deleted by the retention
+# manager every NV_RETENTION_INTERVAL, to keep the disk usage bounded. The
+# files copied to all the webservers are deleted first, oldest first. A file
+# not copied yet is never deleted before NV_RETENTION_UNRELAYED_GRACE.
+# The age and quota limits are off by default, only the free space limit
+# deletes the files unless they are set.
+NV_RETENTION_INTERVAL = 60  # 60 sec
+NV_RETENTION_UNRELAYED_GRACE = 3 * 24 * 3600  # 3 days
+# Files older than NV_RETENTION_MAX_AGE are deleted, 0 for no age limit.
+NV_RETENTION_MAX_AGE = 0  # for eg: 7 * 24 * 3600 for 7 days
+# Maximum bytes of video files of a camera, { 'camera1' : 10 * 1024 ** 3 }.
+# The cameras not in the list are limited to NV_RETENTION_CAM_QUOTA.
+# 0 for no limit.
+NV_RETENTION_CAM_QUOTAS = {}
+NV_RETENTION_CAM_QUOTA = 0
+# Maximum bytes of video files of all the cameras, 0 for no limit.
+NV_RETENTION_TOTAL_QUOTA = 0
+# The files are deleted when the free space on the disk drops below
+# NV_RETENTION_FREE_LOW_PCT percent, until its NV_RETENTION_FREE_HIGH_PCT
+# percent.
+NV_RETENTION_FREE_LOW_PCT = 10
+NV_RETENTION_FREE_HIGH_PCT = 15
+
+# Maximum upload rate to a remote webserver in bytes/sec, shared by all the
+# relay workers. Upto NV_RELAY_RATE_BURST bytes can be sent at once.
+# 0 for no limit.
+NV_RELAY_RATE_LIMIT = 0
+NV_RELAY_RATE_BURST = 4 * 1024 * 1024  # 4MB
+# Maximum upload rate of the old files from the relay journal in bytes/sec,
+# 0 for no limit. The backlog is not limited in the bulk copy windows, and can
+# use all the relay workers. The windows are ['HH:MM', 'HH:MM'] in local time,
+# for eg: [['22:00', '06:00']] for a nightly catch-up.
+NV_RELAY_BACKLOG_RATE = 0
+NV_RELAY_BULK_WINDOWS = []
+# The relay share of cameras, { 'camera1' : 2 }. A camera with weight 2 gets
+# twice the share of a camera with weight 1. The default weight is 1.
+NV_RELAY_CAM_WEIGHTS = {}
+# The relay priority of cameras, { 'camera1' : 1 }. The files of a higher
+# priority camera are always copied first. The default priority is 0.
+NV_RELAY_CAM_PRIORITIES = {}
+
+# A large file is uploaded to a remote webserver in NV_RELAY_STRIPE_MAX stripes
+# at most, every stripe over its own sftp session. The files smaller than
+# NV_RELAY_STRIPE_MIN_SIZE are not striped. The stripe count is adapted to the
+# measured throughput, no striping when the round trip time to the webserver
+# is less than NV_RELAY_STRIPE_MIN_RTT.
+NV_RELAY_STRIPE_MAX = 4
+NV_RELAY_STRIPE_MIN_SIZE = 16 * 1024 * 1024  # 16MB
+NV_RELAY_STRIPE_MIN_RTT = 0.02  # 20 msec
+
+# The relay workers copy to a remote webserver over a pool of sftp sessions.
+NV_RELAY_SFTP_POOL_SIZE = NV_RELAY_WORKERS + NV_RELAY_STRIPE_MAX - 1
+NV_RELAY_SFTP_CONN_TIMEOUT = 10  # 10 sec
+# Interval of ssh keepalive messages on an idle session.
+NV_RELAY_SFTP_KEEPALIVE = 30  # 30 sec
+# A session idle for more than NV_RELAY_SFTP_IDLE_CHECK is checked with a round
+# trip to the webserver before using it.
+NV_RELAY_SFTP_IDLE_CHECK = 60  # 60 sec
+# A failed connection is retried after a delay, doubled on every failure from
+# NV_RELAY_SFTP_RETRY_MIN upto NV_RELAY_SFTP_RETRY_MAX.
+NV_RELAY_SFTP_RETRY_MIN = 1  # 1 sec
+NV_RELAY_SFTP_RETRY_MAX = 300  # 300 sec/5 min
+# After NV_RELAY_SFTP_BREAKER_FAILURES failures in a row, the relay stops
+# trying the webserver until the retry delay is elapsed.
+NV_RELAY_SFTP_BREAKER_FAILURES = 3
+# Size of every read from the file.
+NV_RELAY_SFTP_BLOCK_SIZE = 256 * 1024  # 256KB
+# The file uploads are pipelined, upto NV_RELAY_SFTP_PIPELINE_DEPTH write
+# requests of NV_RELAY_SFTP_REQUEST_SIZE each are sent before waiting for their
+# acknowledgement. The data in flight to the webserver is their product,
+# increase the depth on a high latency link, it should be atleast the
+# bandwidth * round trip time of the link. Its also bounded by the ssh window
+# of the webserver. The sftp servers must accept 32KB requests, OpenSSH accepts
+# upto 255KB.
+NV_RELAY_SFTP_REQUEST_SIZE = 32 * 1024  # 32KB
+NV_RELAY_SFTP_PIPELINE_DEPTH = 64
+# Verify the sha256 of every uploaded file on the webserver, the webserver must
+# allow ssh commands for it.
+NV_RELAY_VERIFY_HASH = False
+# Number of sftp sessions to a remote webserver, { 'backup.example.com' : 2 }.
+# Its the number of files copied to the webserver in parallel, including the
+# stripes. The default is NV_RELAY_SFTP_POOL_SIZE.
+NV_RELAY_DEST_SESSIONS = {}
+# A file is read once and uploaded to all the remote webservers together.
+# Number of blocks read ahead for a webserver, a webserver slower than the
+# others holds back the read once its blocks are full.
+NV_RELAY_FANOUT_QUEUE_LEN = 64
+
+# Camera recording mode.
+# 'segment' : One long-lived ffmpeg process per camera keeps the RTSP session
+#             open and the segment muxer cuts the stream into files of
+#             'stream_file_time_sec' length. No video lost between the files.
+# 'respawn' : cvlc is restarted for every file with '--stop-time'. Every file
+#             costs a new RTSP session and few seconds of video.
+# 'libvlc'  : Files are recorded by the libvlc in the middlebox process itself,
+#             no process spawn for every file. The next file is started on the
+#             libvlc end-of-stream event.
+NV_CAM_RECORD_MODE = 'segment'
+
+# Delay before restarting a recording process that exited unexpectedly, for
+# eg: when the camera dropped the RTSP session.
+NV_CAM_RECORD_RESTART_DELAY = 5  # 5 sec
+
+# Camera live preview mode.
+# 'fmp4'      : The camera video is remuxed into fragmented MP4 without any
+#               transcoding and streamed from the middlebox page server at
+#               /live/<cam_id>.
+# 'hls'       : The camera video is remuxed into HLS without any transcoding and
+#               served from the middlebox page server at
+#               /hls/<cam_id>/index.m3u8.
+# 'transcode' : The camera video is transcoded into Theora/Ogg. Costly on CPU,
+#               use only when the browser cannot play the camera video codec.
+# The live preview falls back to 'transcode' when the camera video codec is not
+# in NV_CAM_LIVE_PLAYABLE_CODECS.
+NV_CAM_LIVE_MODE = 'fmp4'
+NV_CAM_LIVE_PLAYABLE_CODECS = ['h264']
+# Directory for the HLS playlist and segments of live preview.
+NV_CAM_LIVE_HLS_DIR = "/tmp/camera-live"
+NV_CAM_LIVE_HLS_SEGMENT_SEC = 2  # 2 sec
+# Number of segments in the live HLS playlist.
+NV_CAM_LIVE_HLS_LIST_SIZE = 5
+
+# The live preview of a camera is started when a switch page asks for it and
+# stopped after the last page stopped watching it for NV_CAM_LIVE_IDLE_TIMEOUT.
+NV_CAM_LIVE_IDLE_TIMEOUT = 60  # 60 sec
+# Maximum time to wait for a live preview to become playable after its start.
+NV_CAM_LIVE_READY_TIMEOUT = 10  # 10 sec
+# The camera connectivity of a live preview is checked every
+# NV_CAM_LIVE_CHECK_INTERVAL, the live preview is restarted when the camera is
+# reachable again.
+NV_CAM_LIVE_CHECK_INTERVAL = 1  # 1 sec
+
+# Camera live preview engine for the 'transcode' live preview mode.
+# 'cvlc'   : Every live preview runs in a cvlc process.
+# 'libvlc' : Live preview runs in the libvlc in the middlebox process.
+NV_CAM_LIVE_ENGINE = 'cvlc'
+
+# All the recording, ingest and live preview processes are run by a process
+# supervisor in one event loop. A process that exits by itself is restarted
+# after a backoff delay, the delay is doubled from NV_CAM_RECORD_RESTART_DELAY
+# upto NV_PROC_RESTART_BACKOFF_MAX on every quick exit.
+NV_PROC_RESTART_BACKOFF_MAX = 60  # 60 sec
+# A process that ran atleast NV_PROC_HEALTHY_RUN_SEC is considered healthy and
+# the backoff delay is reset.
+NV_PROC_HEALTHY_RUN_SEC = 10  # 10 sec
+# Time given to a process to exit gracefully on stop, its killed after that.
+NV_PROC_STOP_TIMEOUT = 10  # 10 sec
+# Size of each read from the stderr of a process. The stderr is parsed into the
+# camera stream statistics line by line.
+NV_PROC_STDERR_CHUNK_SIZE = 4096
+# Minimum interval between two log lines from the stderr of a process.
+NV_PROC_STDERR_LOG_INTERVAL = 30  # 30 sec
+
+# Share a single RTSP session per camera between the recording and the live
+# preview. The camera stream is pulled by one ffmpeg process and fanned out to
+# the 'segment' recorder and the 'cvlc' live preview. Either of them can
+# start/stop without disturbing the other.
+NV_CAM_SHARED_INGEST = True
+# Size of each read from the camera ingest process, in bytes.
+NV_CAM_INGEST_CHUNK_SIZE = 65536
+# Bytes buffered for each ingest consumer. A consumer that cannot keep up
+# loses the stream data that dont fit in its buffer.
+NV_CAM_INGEST_CONSUMER_BUF_SIZE = 32 * 1024 * 1024  # 32MB
+
+# The conf thread reads upto NV_CONF_QUEUE_BATCH operations from the conf
+# queue at a time. The stop/kill/disconnect operations are read ahead of the
+# other operations and the status refresh operations are read last.
+NV_CONF_QUEUE_BATCH = 16
+# Maximum operations waiting in the conf queue, an operation is dropped when
+# the queue is full for NV_CONF_QUEUE_PUT_TIMEOUT seconds.
+NV_CONF_QUEUE_LEN = 10000
+NV_CONF_QUEUE_PUT_TIMEOUT = 1
+
 # nv-middle-box logging Settings
 NV_DEFAULT_LOG_LEVEL = logging.DEBUG
 NV_LOG_FILE = "/tmp/nv_middlebox.log"
@@ -39,6 +234,26 @@ NV_CONSOLE_LOG = False
 
 #NVDB_SQLALCHEMY_DB = 'sqlite:///nvdb.db' #Relative path db
 NVDB_SQLALCHEMY_DB = 'sqlite:////tmp/nvdb.db' #absolute path db
+# Every thread has its own DB session, the connections are taken from a pool
+# of NVDB_POOL_SIZE connections. Upto NVDB_POOL_OVERFLOW more connections are
+# opened when all of them are in use.
+NVDB_POOL_SIZE = 8
+NVDB_POOL_OVERFLOW = 8
+# Time to wait for the sqlite lock before failing a DB operation, in seconds.
+NVDB_BUSY_TIMEOUT = 5
+# Log a warning when a thread waits longer than this for the DB transaction
+# lock, in seconds.
+NVDB_LOCK_WAIT_WARN = 1
+# The control writes submitted within NVDB_GROUP_COMMIT_WINDOW seconds of the
+# first one are committed in one transaction, upto NVDB_GROUP_COMMIT_MAX_OPS
+# writes.
+NVDB_GROUP_COMMIT_WINDOW = 0.01
+NVDB_GROUP_COMMIT_MAX_OPS = 100
+# The finalized segments are added to the segment catalog in batches, every
+# NVDB_SEGMENT_FLUSH_INTERVAL seconds or when NVDB_SEGMENT_BATCH_SIZE changes
+# are pending.
+NVDB_SEGMENT_FLUSH_INTERVAL = 1
+NVDB_SEGMENT_BATCH_SIZE = 500
 
 #nv-middlebox database logging settings.
 NVDB_DEFAULT_LOG_LEVEL = logging.DEBUG
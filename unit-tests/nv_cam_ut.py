@@ -30,7 +30,8 @@ def nv_test_camera_stream_in():
                                nv_midbox = nv_sys_record
                                )
     stream_handler = cam_handler(nv_cam_record1)
-    stream_handler.save_camera_stream_in_multifile()
+    stream_handler.start_camera_thread()
+    stream_handler.join_camera_thread()
 
 if __name__ == '__main__':
     nv_test_camera_stream_in()
\ No newline at end of file
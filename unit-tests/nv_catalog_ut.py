@@ -0,0 +1,146 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The UT test case functions for the segment catalog.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import sys
+import os.path
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+class ut_db_mgr():
+    '''
+    The segment table of the db manager, the changes are applied on commit.
+    'on_commit' is called before the commit, it can change the catalog
+    while its flushed. The commit fails when 'fail_commit' is set.
+    '''
+    def __init__(self):
+        self.segments = {}
+        self.changes = []
+        self.fail_commit = False
+        self.on_commit = None
+
+    def db_start_transaction(self, read_only = False):
+        self.changes = []
+
+    def db_end_transaction(self, read_only = False):
+        self.changes = []
+
+    def del_segment_files(self, file_paths):
+        self.changes.extend(("del", file_path) for file_path in file_paths)
+
+    def add_segments(self, segments):
+        self.changes.extend(("add", dict(segment)) for segment in segments)
+
+    def set_segment_relay_states(self, relay_states):
+        self.changes.extend(("state", item) for item in relay_states.items())
+
+    def db_commit(self):
+        if self.on_commit:
+            self.on_commit()
+        if self.fail_commit:
+            raise IOError("database is locked")
+        for change, value in self.changes:
+            if change == "del":
+                self.segments.pop(value, None)
+            elif change == "add":
+                self.segments[value["file_path"]] = value
+            elif value[0] in self.segments:
+                self.segments[value[0]]["relay_state"] = value[1]
+
+    def get_relay_states(self):
+        return dict((file_path, segment["relay_state"])
+                    for file_path, segment in self.segments.items())
+
+def setup_catalog(nvdb_segment_catalog):
+    db_mgr = ut_db_mgr()
+    nvdb_segment_catalog.db_mgr_obj = db_mgr
+    return nvdb_segment_catalog.nv_segment_catalog(), db_mgr
+
+def nv_test_restore_failed_flush(nvdb_segment_catalog, enum_relayState):
+    '''
+    The changes of a failed flush are written on the next flush.
+    '''
+    catalog, db_mgr = setup_catalog(nvdb_segment_catalog)
+    catalog.add_segment("/cam1/a.mp4", "cam1", 100, 1000.0)
+    catalog.flush_catalog()
+    catalog.add_segment("/cam1/b.mp4", "cam1", 100, 1010.0)
+    catalog.add_segment("/cam1/c.mp4", "cam1", 100, 1020.0)
+    catalog.set_relay_state("/cam1/a.mp4", enum_relayState.CONST_RELAY_DONE)
+    catalog.remove_segments(["/cam1/b.mp4"])
+    db_mgr.fail_commit = True
+    catalog.flush_catalog()
+    assert list(db_mgr.segments) == ["/cam1/a.mp4"]
+    assert catalog.get_pending_cnt() == 2, catalog.get_pending_cnt()
+    db_mgr.fail_commit = False
+    catalog.flush_catalog()
+    assert catalog.get_pending_cnt() == 0
+    assert db_mgr.get_relay_states() == {
+                        "/cam1/a.mp4" : enum_relayState.CONST_RELAY_DONE,
+                        "/cam1/c.mp4" : enum_relayState.CONST_RELAY_PENDING}
+
+def nv_test_restore_keeps_newer(nvdb_segment_catalog, enum_relayState):
+    '''
+    The changes made while a flush failed are newer than the restored ones.
+    '''
+    catalog, db_mgr = setup_catalog(nvdb_segment_catalog)
+    catalog.add_segment("/cam1/a.mp4", "cam1", 100, 1000.0)
+    catalog.add_segment("/cam1/d.mp4", "cam1", 100, 1030.0)
+    catalog.flush_catalog()
+    catalog.add_segment("/cam1/b.mp4", "cam1", 100, 1010.0)
+    catalog.add_segment("/cam1/c.mp4", "cam1", 100, 1020.0)
+    catalog.set_relay_state("/cam1/a.mp4", enum_relayState.CONST_RELAY_FAILED)
+    catalog.set_relay_state("/cam1/d.mp4", enum_relayState.CONST_RELAY_FAILED)
+    catalog.remove_segments(["/cam1/d.mp4"])
+    catalog.set_relay_state("/cam1/d.mp4", enum_relayState.CONST_RELAY_DONE)
+
+    def update_catalog():
+        catalog.remove_segments(["/cam1/b.mp4"])
+        catalog.set_relay_state("/cam1/c.mp4",
+                                enum_relayState.CONST_RELAY_DONE)
+        catalog.set_relay_state("/cam1/a.mp4",
+                                enum_relayState.CONST_RELAY_DONE)
+    db_mgr.fail_commit = True
+    db_mgr.on_commit = update_catalog
+    catalog.flush_catalog()
+    db_mgr.fail_commit = False
+    db_mgr.on_commit = None
+    catalog.flush_catalog()
+    assert catalog.get_pending_cnt() == 0
+    assert db_mgr.get_relay_states() == {
+                        "/cam1/a.mp4" : enum_relayState.CONST_RELAY_DONE,
+                        "/cam1/c.mp4" : enum_relayState.CONST_RELAY_DONE}, \
+           db_mgr.get_relay_states()
+
+def nv_test_segment_start(nvdb_segment_catalog):
+    '''
+    The segment start is the time in its file name, clamped to its end.
+    '''
+    catalog, db_mgr = setup_catalog(nvdb_segment_catalog)
+    catalog.add_segment("/cam1/01-Jan-2020:00-00-00.mp4", "cam1", 100,
+                        1577836860.0)
+    catalog.add_segment("/cam1/01-Jan-2030:00-00-00.mp4", "cam1", 100,
+                        1577836860.0)
+    catalog.add_segment("/cam1/a.mp4", "cam1", 100, 1577836860.0)
+    catalog.flush_catalog()
+    assert [segment["duration"] for segment in db_mgr.segments.values()] == \
+           [60.0, 0.0, 0.0]
+    assert catalog.max_duration == 60.0
+
+def main():
+    setup_src_path()
+    import src.nvdb.nvdb_segment_catalog as nvdb_segment_catalog
+    from src.nvdb.nvdb_manager import enum_relayState
+    nv_test_restore_failed_flush(nvdb_segment_catalog, enum_relayState)
+    nv_test_restore_keeps_newer(nvdb_segment_catalog, enum_relayState)
+    nv_test_segment_start(nvdb_segment_catalog)
+    print("The test completed successfully")
+
+main()
@@ -0,0 +1,115 @@
+'''
+Benchmark the DB read latency while the DB is written.
+
+A writer thread adds relay journal records in write transactions, holding
+the DB lock for 10ms each, as the relay and camera threads do. The reader
+threads read the relay journal states at the same time, in,
+    locked    : write transaction, the readers wait for the DB lock.
+    read_only : read only transaction, the readers never take the DB lock
+                and read the last committed data from the WAL.
+The read latencies and the average DB lock wait of every run are printed.
+The benchmark runs on a temporary DB, the middlebox DB is not touched.
+usage : python3 unit-tests/nv_db_lock_bench.py [num_readers] [num_reads]
+'''
+import sys
+import os.path
+import time
+import tempfile
+import threading
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+def print_latency(name, latency_list, lock_stats):
+    latency_list = sorted(latency_list)
+    cnt = len(latency_list)
+    print("%-10s reads %5d  p50 %7.2fms  p99 %7.2fms  max %7.2fms  "
+          "lock wait avg %7.2fms" %
+          (name, cnt, latency_list[cnt // 2] * 1000,
+           latency_list[int(cnt * 0.99) - 1] * 1000,
+           latency_list[-1] * 1000,
+           lock_stats["lock_wait_avg"] * 1000))
+
+def get_lock_stats_diff(db_mgr_obj, start_stats):
+    '''
+    Returns the average lock wait of the run, from the 'start_stats'.
+    '''
+    lock_stats = db_mgr_obj.get_db_lock_stats()
+    write_cnt = lock_stats["write_transactions"] - \
+                start_stats["write_transactions"]
+    wait_total = lock_stats["lock_wait_total"] - start_stats["lock_wait_total"]
+    return {"lock_wait_avg" : wait_total / max(write_cnt, 1)}
+
+def nv_bench_db_reads(db_mgr_obj, nv_relay_journal, run_name, read_only,
+                      num_readers, num_reads):
+    stop_event = threading.Event()
+    def writer_thread():
+        record_idx = 0
+        while not stop_event.is_set():
+            try:
+                db_mgr_obj.db_start_transaction()
+                db_mgr_obj.add_record(nv_relay_journal(
+                            file_path = "/bench/%s/%d" % (run_name,
+                                                          record_idx),
+                            server_id = 1, cam_name = "bench-cam",
+                            state = 0, attempts = 0,
+                            file_time = time.time(),
+                            update_time = time.time()))
+                db_mgr_obj.db_commit()
+                # The lock is held for the work of a busy writer.
+                time.sleep(0.01)
+            finally:
+                db_mgr_obj.db_end_transaction()
+            record_idx += 1
+    latency_list = []
+    lock = threading.Lock()
+    def reader_thread():
+        for _ in range(num_reads):
+            start_time = time.monotonic()
+            try:
+                db_mgr_obj.db_start_transaction(read_only = read_only)
+                db_mgr_obj.get_relay_journal_states()
+            finally:
+                db_mgr_obj.db_end_transaction(read_only = read_only)
+            with lock:
+                latency_list.append(time.monotonic() - start_time)
+    start_stats = db_mgr_obj.get_db_lock_stats()
+    writer = threading.Thread(target = writer_thread)
+    writer.start()
+    readers = [threading.Thread(target = reader_thread)
+               for _ in range(num_readers)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    stop_event.set()
+    writer.join()
+    print_latency(run_name, latency_list,
+                  get_lock_stats_diff(db_mgr_obj, start_stats))
+
+def nv_bench_db_lock(num_readers = 4, num_reads = 100):
+    setup_src_path()
+    db_dir = tempfile.mkdtemp()
+    # The DB url is read at import of the DB manager.
+    import src.settings
+    src.settings.NVDB_SQLALCHEMY_DB = "sqlite:///" + \
+                                      os.path.join(db_dir, "nvdb_bench.db")
+    from src.nvdb.nvdb_manager import db_mgr_obj, nv_relay_journal
+    db_mgr_obj.setup_session()
+    print("%d readers, %d reads each, while a writer holds the DB lock" %
+          (num_readers, num_reads))
+    try:
+        nv_bench_db_reads(db_mgr_obj, nv_relay_journal, "locked", False,
+                          num_readers, num_reads)
+        nv_bench_db_reads(db_mgr_obj, nv_relay_journal, "read_only", True,
+                          num_readers, num_reads)
+    finally:
+        db_mgr_obj.teardown_session()
+        for file_name in os.listdir(db_dir):
+            os.remove(os.path.join(db_dir, file_name))
+        os.rmdir(db_dir)
+
+if __name__ == '__main__':
+    nv_bench_db_lock(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,126 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The UT test case functions for the relay retention manager.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import sys
+import os.path
+import time
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+class ut_worker_pool():
+    '''
+    The relay worker pool of the retention manager, with the queued files.
+    '''
+    def __init__(self, queued_files = ()):
+        self.journal = None
+        self.queued_files = set(queued_files)
+
+    def is_file_queued(self, file_path):
+        return file_path in self.queued_files
+
+class ut_os_context():
+    def __init__(self, disk_size, free_size):
+        self.disk_size = disk_size
+        self.free_size = free_size
+
+    def get_disk_space(self, dir_path):
+        return [self.disk_size, self.free_size]
+
+def get_cam_files(relay_retention, now, cam_name, file_cnt, file_size,
+                  is_relayed = True):
+    return [relay_retention.retention_file("/%s/%d.mp4" % (cam_name, idx),
+                                           cam_name, file_size,
+                                           now - 100 + idx, is_relayed)
+            for idx in range(file_cnt)]
+
+def setup_retention(relay_retention, disk_size, free_size, queued_files = (),
+                    max_age = 0, cam_quotas = None, total_quota = 0):
+    relay_retention.NV_RETENTION_MAX_AGE = max_age
+    relay_retention.NV_RETENTION_CAM_QUOTAS = cam_quotas or {}
+    relay_retention.NV_RETENTION_CAM_QUOTA = 0
+    relay_retention.NV_RETENTION_TOTAL_QUOTA = total_quota
+    relay_retention.NV_RETENTION_FREE_LOW_PCT = 10
+    relay_retention.NV_RETENTION_FREE_HIGH_PCT = 15
+    retention_mgr = relay_retention.relay_retention_mgr(
+                                            ut_worker_pool(queued_files))
+    retention_mgr.os_context = ut_os_context(disk_size, free_size)
+    return retention_mgr
+
+def nv_test_free_space_counts_quota(relay_retention, now):
+    '''
+    The bytes freed by the camera quota count to the free space watermark.
+    '''
+    cam_files = {"cam1" : get_cam_files(relay_retention, now, "cam1", 20, 100)}
+    retention_mgr = setup_retention(relay_retention, 10000, 400,
+                                    cam_quotas = {"cam1" : 1500})
+    evict_files = retention_mgr.find_evict_files(cam_files, now)
+    # 500 bytes by the quota, 600 more to reach 15% free.
+    assert [evict_file.file_path for evict_file in evict_files] == \
+           ["/cam1/%d.mp4" % idx for idx in range(11)], len(evict_files)
+
+def nv_test_free_space_counts_age(relay_retention, now):
+    '''
+    The bytes freed by the age limit count to the free space watermark.
+    '''
+    cam_files = {"cam1" : get_cam_files(relay_retention, now, "cam1", 10, 100)}
+    retention_mgr = setup_retention(relay_retention, 10000, 600,
+                                    max_age = 97)
+    evict_files = retention_mgr.find_evict_files(cam_files, now)
+    # Files 0 to 2 are older than the age limit, 6 more to reach 15% free.
+    assert len(evict_files) == 9, len(evict_files)
+
+def nv_test_no_eviction_above_watermark(relay_retention, now):
+    cam_files = {"cam1" : get_cam_files(relay_retention, now, "cam1", 10, 100)}
+    retention_mgr = setup_retention(relay_retention, 10000, 1000)
+    assert not retention_mgr.find_evict_files(cam_files, now)
+
+def nv_test_relayed_first(relay_retention, now):
+    '''
+    The relayed files are deleted before the older files not relayed, and
+    the files not relayed in the grace time or queued are never deleted.
+    '''
+    old_files = get_cam_files(relay_retention, now - 10 ** 9, "cam1", 2, 100,
+                              is_relayed = False)
+    new_files = get_cam_files(relay_retention, now, "cam2", 2, 100,
+                              is_relayed = False)
+    relayed_files = get_cam_files(relay_retention, now, "cam3", 2, 100)
+    cam_files = {"cam1" : old_files, "cam2" : new_files,
+                 "cam3" : relayed_files}
+    retention_mgr = setup_retention(relay_retention, 10000, 0,
+                                    queued_files = [old_files[1].file_path])
+    evict_files = retention_mgr.find_evict_files(cam_files, now)
+    assert [evict_file.file_path for evict_file in evict_files] == \
+           [relayed_files[0].file_path, relayed_files[1].file_path,
+            old_files[0].file_path], len(evict_files)
+
+def nv_test_evict_error(relay_retention, now):
+    file_list = get_cam_files(relay_retention, now, "cam1", 2, 100)
+    retention_mgr = setup_retention(relay_retention, 10000, 0)
+    evict_set = set(evict_file.file_path for evict_file in file_list)
+    assert retention_mgr.get_evict_error(file_list, evict_set) == \
+           "no more files to delete"
+    evict_set.pop()
+    assert retention_mgr.get_evict_error(file_list, evict_set) == \
+           "the files are not relayed yet"
+
+def main():
+    setup_src_path()
+    import src.nvrelay.relay_retention as relay_retention
+    now = time.time()
+    nv_test_free_space_counts_quota(relay_retention, now)
+    nv_test_free_space_counts_age(relay_retention, now)
+    nv_test_no_eviction_above_watermark(relay_retention, now)
+    nv_test_relayed_first(relay_retention, now)
+    nv_test_evict_error(relay_retention, now)
+    print("The test completed successfully")
+
+main()
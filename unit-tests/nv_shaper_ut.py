@@ -0,0 +1,110 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The UT test case functions for the relay shaper.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import sys
+import os.path
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+class ut_clock():
+    '''
+    The time module of the relay shaper, the time moves only on sleep.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += secs
+
+def nv_test_token_bucket(relay_shaper, clock):
+    '''
+    The burst is sent right away, the rest waits for the tokens at the rate.
+    '''
+    bucket = relay_shaper.relay_token_bucket(1000, 500)
+    assert bucket.take_tokens(500) == 0
+    assert bucket.take_tokens(250) == 0.25
+    # The tokens are taken, the next sender waits for them too.
+    assert bucket.take_tokens(250) == 0.5
+    clock.sleep(0.5)
+    assert bucket.take_tokens(100) == 0.1
+    # The bucket never refills above the burst.
+    clock.sleep(100)
+    assert bucket.take_tokens(500) == 0
+    assert bucket.take_tokens(100) == 0.1
+
+def nv_test_token_bucket_no_limit(relay_shaper, clock):
+    bucket = relay_shaper.relay_token_bucket(0, 500)
+    for _ in range(10):
+        assert bucket.take_tokens(1000000) == 0
+
+def setup_shaper(relay_shaper, cam_weights = None, cam_priorities = None):
+    relay_shaper.NV_RELAY_CAM_WEIGHTS = cam_weights or {}
+    relay_shaper.NV_RELAY_CAM_PRIORITIES = cam_priorities or {}
+    relay_shaper.NV_RELAY_BULK_WINDOWS = []
+    return relay_shaper.relay_shaper()
+
+def copy_files(shaper, ready_cams, file_cnt, file_size = 100):
+    '''
+    Copy 'file_cnt' files of the ready cameras in the shaper order, returns
+    the number of files copied of every camera.
+    '''
+    copy_cnt = dict((cam_name, 0) for cam_name in ready_cams)
+    for cam_name in ready_cams:
+        shaper.camera_ready(cam_name)
+    for _ in range(file_cnt):
+        cam_name = shaper.pick_camera(ready_cams)
+        shaper.account_bytes(cam_name, file_size)
+        copy_cnt[cam_name] += 1
+    return copy_cnt
+
+def nv_test_wfq_weights(relay_shaper):
+    '''
+    The cameras with same priority share the relay by their weight.
+    '''
+    shaper = setup_shaper(relay_shaper, cam_weights = {"cam1" : 2})
+    copy_cnt = copy_files(shaper, ["cam1", "cam2"], 300)
+    assert copy_cnt == {"cam1" : 200, "cam2" : 100}, copy_cnt
+
+def nv_test_wfq_priority(relay_shaper):
+    '''
+    A higher priority camera is always copied before the lower ones.
+    '''
+    shaper = setup_shaper(relay_shaper, cam_weights = {"cam1" : 100},
+                          cam_priorities = {"cam2" : 1})
+    copy_cnt = copy_files(shaper, ["cam1", "cam2"], 50)
+    assert copy_cnt == {"cam1" : 0, "cam2" : 50}, copy_cnt
+
+def nv_test_wfq_idle_camera(relay_shaper):
+    '''
+    A camera idle for a while doesnt get the unused share of its idle time.
+    '''
+    shaper = setup_shaper(relay_shaper)
+    copy_files(shaper, ["cam1"], 100)
+    copy_cnt = copy_files(shaper, ["cam1", "cam2"], 20)
+    assert abs(copy_cnt["cam1"] - copy_cnt["cam2"]) <= 1, copy_cnt
+
+def main():
+    setup_src_path()
+    import src.nvrelay.relay_shaper as relay_shaper
+    clock = ut_clock()
+    relay_shaper.time = clock
+    nv_test_token_bucket(relay_shaper, clock)
+    nv_test_token_bucket_no_limit(relay_shaper, clock)
+    nv_test_wfq_weights(relay_shaper)
+    nv_test_wfq_priority(relay_shaper)
+    nv_test_wfq_idle_camera(relay_shaper)
+    print("The test completed successfully")
+
+main()
@@ -0,0 +1,123 @@
+'''
+Benchmark the spawn latency of camera processes.
+
+100 cameras spawn their process at the same time, from a middlebox sized
+process(memory ballast and the idle threads of the middlebox). The latency of each spawn call is
+measured for,
+    preexec  : Popen with preexec_fn=os.setsid, the old spawn path.
+    session  : nv_os_lib execute_cmd_bg, Popen with start_new_session.
+    supervisor : The process supervisor, time from start_proc till the process
+                 is running.
+usage : python3 unit-tests/nv_spawn_bench.py [num_cameras] [ballast_mb]
+'''
+import sys
+import os.path
+import time
+import threading
+import subprocess
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+def print_latency(name, latency_list):
+    latency_list = sorted(latency_list)
+    cnt = len(latency_list)
+    print("%-10s spawns %4d  min %7.2fms  avg %7.2fms  p95 %7.2fms  "
+          "max %7.2fms  threads %d" %
+          (name, cnt, latency_list[0] * 1000,
+           sum(latency_list) / cnt * 1000,
+           latency_list[int(cnt * 0.95) - 1] * 1000,
+           latency_list[-1] * 1000,
+           threading.active_count()))
+
+def spawn_concurrent(num_cams, spawn_fn):
+    '''
+    Spawn a process for every camera from its own thread, all at once.
+    '''
+    latency_list = []
+    procs = []
+    start_event = threading.Event()
+    lock = threading.Lock()
+    def cam_thread():
+        start_event.wait()
+        start_time = time.monotonic()
+        proc = spawn_fn()
+        latency = time.monotonic() - start_time
+        with lock:
+            latency_list.append(latency)
+            procs.append(proc)
+    threads = [threading.Thread(target = cam_thread) for _ in range(num_cams)]
+    for thread in threads:
+        thread.start()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    for proc in procs:
+        proc.wait()
+    return latency_list
+
+def nv_bench_spawn_preexec(num_cams):
+    return spawn_concurrent(num_cams,
+                lambda : subprocess.Popen(["true"],
+                                          stdout = subprocess.DEVNULL,
+                                          stderr = subprocess.DEVNULL,
+                                          preexec_fn = os.setsid))
+
+def nv_bench_spawn_session(num_cams):
+    from src.nv_lib.nv_os_lib import nv_os_lib
+    os_context = nv_os_lib()
+    return spawn_concurrent(num_cams,
+                lambda : os_context.execute_cmd_bg("true", []))
+
+def nv_bench_spawn_supervisor(num_cams):
+    from src.nvcamera.cam_supervisor import GBL_PROC_SUPERVISOR
+    from src.nvcamera.cam_supervisor import nv_supervised_proc
+    latency_list = []
+    sprocs = []
+    start_time = {}
+    def proc_started(sproc):
+        latency_list.append(time.monotonic() - start_time[sproc.name])
+    for cam in range(num_cams):
+        sprocs.append(nv_supervised_proc(name = "bench-cam" + str(cam),
+                                         cmd = "sleep",
+                                         args = ["5"],
+                                         on_start = proc_started,
+                                         restart = False))
+    for sproc in sprocs:
+        start_time[sproc.name] = time.monotonic()
+        GBL_PROC_SUPERVISOR.start_proc(sproc)
+    while len(latency_list) < num_cams:
+        time.sleep(0.01)
+    print_latency("supervisor", latency_list)
+    for sproc in sprocs:
+        GBL_PROC_SUPERVISOR.kill_proc(sproc)
+    for sproc in sprocs:
+        GBL_PROC_SUPERVISOR.wait_proc(sproc)
+    GBL_PROC_SUPERVISOR.stop_supervisor()
+
+def nv_bench_spawn(num_cams = 100, ballast_mb = 512):
+    setup_src_path()
+    # Make the process as big as a busy middlebox, the fork cost grows with it.
+    ballast = bytearray(ballast_mb * 1024 * 1024)
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+    stop_event = threading.Event()
+    idle_threads = [threading.Thread(target = stop_event.wait)
+                    for _ in range(20)]
+    for thread in idle_threads:
+        thread.start()
+    print("Spawning %d camera processes, process size %dMB" %
+          (num_cams, ballast_mb))
+    try:
+        print_latency("preexec", nv_bench_spawn_preexec(num_cams))
+        print_latency("session", nv_bench_spawn_session(num_cams))
+        nv_bench_spawn_supervisor(num_cams)
+    finally:
+        stop_event.set()
+        for thread in idle_threads:
+            thread.join()
+
+if __name__ == '__main__':
+    nv_bench_spawn(*[int(arg) for arg in sys.argv[1:3]])
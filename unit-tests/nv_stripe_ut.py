@@ -0,0 +1,102 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The UT test case functions for the relay stripe tuner.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import sys
+import os.path
+
+# Size of a striped file, in bytes.
+UT_FILE_SIZE = 64 * 1024 * 1024
+# Round trip time of a high latency link, in seconds.
+UT_HIGH_RTT = 0.1
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+def setup_tuner(relay_stripe):
+    relay_stripe.NV_RELAY_STRIPE_MAX = 4
+    relay_stripe.NV_RELAY_STRIPE_MIN_SIZE = 16 * 1024 * 1024
+    relay_stripe.NV_RELAY_STRIPE_MIN_RTT = 0.02
+    return relay_stripe.relay_stripe_tuner()
+
+def upload_files(tuner, file_cnt, link_mbps, rtt = UT_HIGH_RTT):
+    '''
+    Upload 'file_cnt' files with the stripes from the tuner, 'link_mbps' is
+    called with the stripes used to get the upload throughput.
+    Returns the stripes used for every file.
+    '''
+    used_stripes = []
+    for _ in range(file_cnt):
+        stripes = tuner.get_stripes(UT_FILE_SIZE)
+        tuner.update_stats({"bytes" : UT_FILE_SIZE,
+                            "secs" : UT_FILE_SIZE / 1024 / 1024 /
+                                     link_mbps(stripes),
+                            "mbps" : link_mbps(stripes),
+                            "rtt" : rtt,
+                            "stripes" : stripes})
+        used_stripes.append(stripes)
+    return used_stripes
+
+def nv_test_no_stripes_low_rtt(relay_stripe):
+    '''
+    A single channel is used on a low latency link.
+    '''
+    tuner = setup_tuner(relay_stripe)
+    assert tuner.get_stripes(UT_FILE_SIZE) == 1
+    used_stripes = upload_files(tuner, 10, lambda stripes : 2.0 * stripes,
+                                rtt = 0.001)
+    assert used_stripes == [1] * 10, used_stripes
+
+def nv_test_no_stripes_small_file(relay_stripe):
+    tuner = setup_tuner(relay_stripe)
+    upload_files(tuner, 10, lambda stripes : 2.0 * stripes)
+    assert tuner.get_stripes(1024 * 1024) == 1
+    assert tuner.get_stripes(UT_FILE_SIZE) > 1
+
+def nv_test_stripes_upto_max(relay_stripe):
+    '''
+    The stripes are added while they give more throughput, upto the max.
+    '''
+    tuner = setup_tuner(relay_stripe)
+    used_stripes = upload_files(tuner, 10, lambda stripes : 2.0 * stripes)
+    assert used_stripes[:4] == [1, 2, 3, 4], used_stripes
+    assert used_stripes[4:] == [4] * 6, used_stripes
+
+def nv_test_stripes_link_limit(relay_stripe):
+    '''
+    The stripes settle at the count that fills the link, a stripe more
+    doesnt give more throughput.
+    '''
+    tuner = setup_tuner(relay_stripe)
+    used_stripes = upload_files(tuner, 20,
+                                lambda stripes : min(2.0 * stripes, 6.0))
+    assert used_stripes[-10:] == [3] * 10, used_stripes
+
+def nv_test_stripes_drop_on_loss(relay_stripe):
+    '''
+    The stripes are reduced when they give less throughput, for eg: the link
+    capacity is shared with other traffic.
+    '''
+    tuner = setup_tuner(relay_stripe)
+    upload_files(tuner, 10, lambda stripes : 2.0 * stripes)
+    assert tuner.get_stripes(UT_FILE_SIZE) == 4
+    used_stripes = upload_files(tuner, 30, lambda stripes : 2.0)
+    assert used_stripes[-5:] == [1] * 5, used_stripes
+
+def main():
+    setup_src_path()
+    import src.nvrelay.relay_stripe as relay_stripe
+    nv_test_no_stripes_low_rtt(relay_stripe)
+    nv_test_no_stripes_small_file(relay_stripe)
+    nv_test_stripes_upto_max(relay_stripe)
+    nv_test_stripes_link_limit(relay_stripe)
+    nv_test_stripes_drop_on_loss(relay_stripe)
+    print("The test completed successfully")
+
+main()
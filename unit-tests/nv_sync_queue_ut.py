@@ -0,0 +1,135 @@
+#! /usr/bin/python3
+# -*- coding: utf8 -*-
+# The UT test case functions for the conf queue.
+#
+__author__ = "Sugesh Chandran"
+__copyright__ = "Copyright (C) The neoview team."
+__license__ = "GNU Lesser General Public License"
+__version__ = "1.0"
+
+import sys
+import os.path
+import time
+from threading import Thread
+
+
+def setup_src_path():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(curr_dir, os.pardir)))
+
+class ut_ipc_data():
+    '''
+    A queue value with the ipc_data interface.
+    '''
+    def __init__(self, name, prio, key = None):
+        self.name = name
+        self.prio = prio
+        self.key = key
+
+    def is_ipc_datatype_valid(self):
+        return True
+
+    def get_ipc_priority(self):
+        return self.prio
+
+    def get_ipc_key(self):
+        return self.key
+
+def enqueue_values(sync_queue, values):
+    for value in values:
+        sync_queue.enqueue_data(obj_len = 1, obj_value = [value])
+
+def dequeue_names(sync_queue):
+    return [tlv_obj["value"][0].name
+            for tlv_obj in sync_queue.dequeue_batch(100, timeout = 0)]
+
+def nv_test_priority_order(nv_sync_lib):
+    '''
+    The values are read by their priority, in the queued order in a priority.
+    '''
+    sync_queue = nv_sync_lib.nv_sync_queue(prio_cnt = 3)
+    enqueue_values(sync_queue, [ut_ipc_data("low1", 2),
+                                ut_ipc_data("high1", 0),
+                                ut_ipc_data("mid1", 1),
+                                ut_ipc_data("low2", 2),
+                                ut_ipc_data("high2", 0),
+                                ut_ipc_data("invalid", 7)])
+    names = dequeue_names(sync_queue)
+    assert names == ["high1", "high2", "mid1", "low1", "low2", "invalid"], \
+           names
+    assert sync_queue.get_queue_depth() == 0
+
+def nv_test_key_promotion(nv_sync_lib):
+    '''
+    A value is never read ahead of the values queued before it with the same
+    key, they are promoted to its priority.
+    '''
+    sync_queue = nv_sync_lib.nv_sync_queue(prio_cnt = 3)
+    enqueue_values(sync_queue, [ut_ipc_data("cam1-status", 2, "cam1"),
+                                ut_ipc_data("cam2-status", 2, "cam2"),
+                                ut_ipc_data("cam1-live", 1, "cam1"),
+                                ut_ipc_data("cam3-stop", 0, "cam3"),
+                                ut_ipc_data("cam1-stop", 0, "cam1")])
+    names = dequeue_names(sync_queue)
+    assert names == ["cam3-stop", "cam1-status", "cam1-live", "cam1-stop",
+                     "cam2-status"], names
+    assert sync_queue.get_queue_stats()["promoted"] == 3
+
+def nv_test_batch_dequeue(nv_sync_lib):
+    sync_queue = nv_sync_lib.nv_sync_queue(prio_cnt = 2)
+    enqueue_values(sync_queue, [ut_ipc_data("value%d" % idx, idx % 2)
+                                for idx in range(5)])
+    tlv_list = sync_queue.dequeue_batch(3, timeout = 0)
+    assert [tlv_obj["value"][0].name for tlv_obj in tlv_list] == \
+           ["value0", "value2", "value4"]
+    assert sync_queue.get_queue_depth() == 2
+    assert sync_queue.dequeue_data()["value"][0].name == "value1"
+    q_stats = sync_queue.get_queue_stats()
+    assert q_stats["batches"] == 2 and q_stats["batch_max"] == 3, q_stats
+    assert q_stats["lane_depths"] == [0, 1], q_stats
+
+def nv_test_full_queue(nv_sync_lib):
+    '''
+    The values are dropped when the queue stays full for put_timeout.
+    '''
+    sync_queue = nv_sync_lib.nv_sync_queue(max_size = 2, put_timeout = 0.01)
+    enqueue_values(sync_queue, [ut_ipc_data("value%d" % idx, 0)
+                                for idx in range(3)])
+    assert dequeue_names(sync_queue) == ["value0", "value1"]
+    q_stats = sync_queue.get_queue_stats()
+    assert q_stats["dropped"] == 1 and q_stats["enqueued"] == 2, q_stats
+
+def nv_test_dequeue_timeout(nv_sync_lib):
+    sync_queue = nv_sync_lib.nv_sync_queue()
+    start_time = time.monotonic()
+    assert sync_queue.dequeue_data(timeout = 0.1) is None
+    assert time.monotonic() - start_time >= 0.1
+
+def nv_test_waiting_reader(nv_sync_lib):
+    '''
+    A waiting reader gets the value as soon as its queued.
+    '''
+    sync_queue = nv_sync_lib.nv_sync_queue()
+    read_values = []
+    reader = Thread(target = lambda :
+                    read_values.append(sync_queue.dequeue_data(timeout = 5)))
+    reader.start()
+    time.sleep(0.1)
+    start_time = time.monotonic()
+    enqueue_values(sync_queue, [ut_ipc_data("value", 0)])
+    reader.join()
+    assert time.monotonic() - start_time < 1
+    assert read_values[0]["value"][0].name == "value"
+
+def main():
+    setup_src_path()
+    import src.nv_lib.nv_sync_lib as nv_sync_lib
+    nv_test_priority_order(nv_sync_lib)
+    nv_test_key_promotion(nv_sync_lib)
+    nv_test_batch_dequeue(nv_sync_lib)
+    nv_test_full_queue(nv_sync_lib)
+    nv_test_dequeue_timeout(nv_sync_lib)
+    nv_test_waiting_reader(nv_sync_lib)
+    print("The test completed successfully")
+
+main()